@@ -1 +1,3 @@
 __author__ = 'zweiss'
+
+from exmaralda_converter.conversion import convert, convert_many
@@ -0,0 +1,319 @@
+""" Parallel loading of many transcripts into compact columnar buffers
+
+Worker processes parse the exb files and copy events and timeline into flat arrays in shared memory
+(multiprocessing.shared_memory). Only the name and layout of the shared memory block and the small speaker and tier
+tables are pickled back to the parent, which reads the columns in place instead of unpickling one object per event.
+
+    from exmaralda_converter import columnar
+    with columnar.ColumnarCorpus.load(files, jobs=4) as cold_corpus:
+        for transcript in cold_corpus:
+            starts = transcript.columns['start']  # memoryview of doubles, NaN if not anchored in time
+"""
+__author__ = 'zweiss'
+
+import array
+import math
+import multiprocessing
+import secrets
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+from exmaralda_converter import exmaralda
+
+
+class ColumnarTranscript:
+    """ Represents the events and timeline of a transcript as columns in shared memory
+
+    Events are ordered by tier, the events of the k-th tier are those from tier_offsets[k] to tier_offsets[k+1].
+    Strings are stored as one UTF-8 encoded buffer per column with the byte offset of each string.
+
+    Attributes
+    ----------
+    file: str
+        path of the exb file
+    speakers: dict
+        speakers of the transcript by their ids
+    tiers: list of tuples
+        id, speaker id, category, type, and display name of each tier
+    tier_offsets: list of int
+        index of the first event of each tier followed by the number of events
+    columns: dict
+        memoryviews of the columns by their names: 'start' and 'end' (seconds, NaN if unknown), 'start_index' and
+        'end_index' (positions in the timeline, -1 if unknown), 'content_offsets' and 'content' (UTF-8 bytes),
+        'time' (seconds of the time points in timeline order), 'time_id_offsets' and 'time_id' (UTF-8 bytes)
+
+    Methods
+    -------
+    get_content(i):
+        Returns the content of the i-th event
+    get_time_id(i):
+        Returns the id of the i-th time point
+    get_tier(i):
+        Returns the id of the tier of the i-th event
+    iter_events():
+        Iterates over all events
+    close():
+        Releases the shared memory
+    """
+
+    # name and type code of each column; the byte buffers are stored last
+    column_types = [('start', 'd'), ('end', 'd'), ('time', 'd'), ('content_offsets', 'q'), ('time_id_offsets', 'q'),
+                    ('start_index', 'i'), ('end_index', 'i'), ('content', 'B'), ('time_id', 'B')]
+
+    def __init__(self, file, shm_name, layout, speakers, tiers, tier_offsets):
+        """
+        :param file: path of the exb file
+        :type file: str
+        :param shm_name: name of the shared memory block holding the columns
+        :type shm_name: str
+        :param layout: byte offset and length of each column by its name
+        :type layout: dict
+        :param speakers: speakers of the transcript by their ids
+        :type speakers: dict
+        :param tiers: id, speaker id, category, type, and display name of each tier
+        :type tiers: list of tuples
+        :param tier_offsets: index of the first event of each tier followed by the number of events
+        :type tier_offsets: list of int
+        """
+
+        self.file = file
+        self.speakers = speakers
+        self.tiers = tiers
+        self.tier_offsets = tier_offsets
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.columns = {}
+        for name, typecode in ColumnarTranscript.column_types:
+            offset, length = layout[name]
+            self.columns[name] = self.shm.buf[offset:offset + length].cast(typecode)
+
+    def __len__(self):
+        return self.tier_offsets[-1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_content(self, i):
+        offsets = self.columns['content_offsets']
+        return bytes(self.columns['content'][offsets[i]:offsets[i + 1]]).decode('UTF-8')
+
+    def get_time_id(self, i):
+        offsets = self.columns['time_id_offsets']
+        return bytes(self.columns['time_id'][offsets[i]:offsets[i + 1]]).decode('UTF-8')
+
+    def get_tier(self, i):
+        for k in range(len(self.tiers)):
+            if self.tier_offsets[k] <= i < self.tier_offsets[k + 1]:
+                return self.tiers[k][0]
+        raise IndexError('event index out of range: {}'.format(i))
+
+    def iter_events(self):
+        """ Iterates over all events in tier order
+
+        :return: tier id, start, end (seconds or None), and content of each event
+        :rtype: generator of tuples
+        """
+
+        start = self.columns['start']
+        end = self.columns['end']
+        for k, tier in enumerate(self.tiers):
+            for i in range(self.tier_offsets[k], self.tier_offsets[k + 1]):
+                yield (tier[0], None if math.isnan(start[i]) else start[i], None if math.isnan(end[i]) else end[i],
+                       self.get_content(i))
+
+    def close(self):
+        """ Releases the shared memory, the columns cannot be used afterwards
+        """
+
+        if self.shm is None:
+            return
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    # creation in worker processes
+
+    @staticmethod
+    def get_columns(transcript):
+        """ Copies the events and the timeline of a transcript into columns
+
+        :param transcript: transcript to be copied
+        :type transcript: ExmaraldaTranscript
+        :return: columns by their names and the index of the first event of each tier followed by the number of events
+        :rtype: tuple
+        """
+
+        columns = {name: array.array(typecode) for name, typecode in ColumnarTranscript.column_types
+                   if typecode != 'B'}
+        content = bytearray()
+        time_ids = bytearray()
+        position = {}
+        for tid, tp in transcript.timeline.items():
+            position[tid] = len(position)
+            seconds = tp.get_seconds()
+            columns['time'].append(float('nan') if seconds is None else seconds)
+            columns['time_id_offsets'].append(len(time_ids))
+            time_ids += str(tid).encode('UTF-8')
+        columns['time_id_offsets'].append(len(time_ids))
+
+        tier_offsets = []
+        for tier in transcript.tiers.values():
+            tier_offsets.append(len(columns['start']))
+            for e in tier.event_list:
+                for side, tp in [('start', e.start), ('end', e.end)]:
+                    i = position.get(tp.time_id, -1)
+                    columns[side + '_index'].append(i)
+                    columns[side].append(columns['time'][i] if i >= 0 else float('nan'))
+                columns['content_offsets'].append(len(content))
+                content += e.content.encode('UTF-8')
+        tier_offsets.append(len(columns['start']))
+        columns['content_offsets'].append(len(content))
+        columns['content'] = content
+        columns['time_id'] = time_ids
+        return columns, tier_offsets
+
+    @staticmethod
+    def load_shared(in_file, interpolate=False, shm_name=None):
+        """ Loads a transcript and copies its columns into a new shared memory block
+
+        The block is not unlinked; this is left to the ColumnarTranscript attaching to it.
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :param interpolate: true if time points that are not anchored in time should be interpolated
+        :type interpolate: bool (optional, defaults to False)
+        :param shm_name: name of the shared memory block, chosen by the caller so that it can release the block even
+            if the result never arrives
+        :type shm_name: str (optional, defaults to a random name)
+        :return: the arguments creating the ColumnarTranscript
+        :rtype: tuple
+        """
+
+        transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+        if interpolate:
+            transcript.normalise_timeline()
+        columns, tier_offsets = ColumnarTranscript.get_columns(transcript)
+
+        layout = {}
+        size = 0
+        for name, typecode in ColumnarTranscript.column_types:
+            length = len(columns[name]) * (columns[name].itemsize if typecode != 'B' else 1)
+            layout[name] = (size, length)
+            # keep every column aligned to 8 bytes
+            size += length + (-length) % 8
+        shm = shared_memory.SharedMemory(name=shm_name, create=True, size=max(size, 1))
+        try:
+            for name, typecode in ColumnarTranscript.column_types:
+                offset, length = layout[name]
+                shm.buf[offset:offset + length] = columns[name] if typecode == 'B' else columns[name].tobytes()
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        shm.close()
+        tiers = [(tier.id, tier.speaker, tier.category, tier.type, tier.display_name)
+                 for tier in transcript.tiers.values()]
+        return in_file, shm.name, layout, transcript.speaker_table, tiers, tier_offsets
+
+
+class ColumnarCorpus:
+    """ Collection of columnar transcripts loaded in parallel
+
+    Attributes
+    ----------
+    transcripts: list of ColumnarTranscript
+        transcripts in the order of their files
+
+    Methods
+    -------
+    load(in_files, jobs=1, interpolate=False):
+        Loads many exb files with worker processes
+    close():
+        Releases the shared memory of all transcripts
+    release(shm_names):
+        Releases shared memory blocks that no transcript has attached to
+    """
+
+    def __init__(self):
+        self.transcripts = []
+
+    def __len__(self):
+        return len(self.transcripts)
+
+    def __iter__(self):
+        return iter(self.transcripts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def load(in_files, jobs=1, interpolate=False):
+        """ Loads many exb files with worker processes, transferring their columns through shared memory
+
+        :param in_files: paths to the exb files
+        :type in_files: list of str
+        :param jobs: number of worker processes; with 1, files are loaded in the calling process
+        :type jobs: int (optional, defaults to 1)
+        :param interpolate: true if time points that are not anchored in time should be interpolated
+        :type interpolate: bool (optional, defaults to False)
+        :return: corpus of columnar transcripts, to be closed after use
+        :rtype: ColumnarCorpus
+        """
+
+        rval = ColumnarCorpus()
+        # the names of the blocks are chosen here, so that blocks whose results never arrive (e.g. after an error or
+        # an interrupt) can still be released
+        shm_names = ['psm_' + secrets.token_hex(8) for _ in in_files]
+        try:
+            if jobs <= 1:
+                for in_file, shm_name in zip(in_files, shm_names):
+                    columns = ColumnarTranscript.load_shared(in_file, interpolate, shm_name)
+                    rval.transcripts.append(ColumnarTranscript(*columns))
+                return rval
+
+            # workers share the resource tracker of this process, which unlinks all blocks left at its shutdown
+            resource_tracker.ensure_running()
+            error = None
+            with multiprocessing.Pool(jobs) as pool:
+                pending = [pool.apply_async(ColumnarTranscript.load_shared, (in_file, interpolate, shm_name))
+                           for in_file, shm_name in zip(in_files, shm_names)]
+                for result in pending:
+                    try:
+                        rval.transcripts.append(ColumnarTranscript(*result.get()))
+                    except Exception as err:
+                        error = err if error is None else error
+            if error is not None:
+                raise error
+            return rval
+        except BaseException:
+            rval.close()
+            ColumnarCorpus.release(shm_names)
+            raise
+
+    def close(self):
+        for transcript in self.transcripts:
+            transcript.close()
+
+    @staticmethod
+    def release(shm_names):
+        """ Releases shared memory blocks that no transcript has attached to; blocks that have already been released
+        or never been created are skipped
+
+        :param shm_names: names of the blocks
+        :type shm_names: list of str
+        """
+
+        for shm_name in shm_names:
+            try:
+                shm = shared_memory.SharedMemory(name=shm_name)
+            except FileNotFoundError:
+                continue
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,126 @@
+""" Transparent handling of gzip, bz2, and xz compressed input and output files
+
+Compressed files are read and written as streams, nothing is decompressed to a temporary file.
+"""
+__author__ = 'zweiss'
+
+import bz2
+import gzip
+import io
+import lzma
+import zlib
+
+
+class Compression:
+
+    # file extension and leading magic bytes of each supported compression
+    extensions = {'gz': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+    magic_bytes = {'gz': b'\x1f\x8b', 'bz2': b'BZh', 'xz': b'\xfd7zXZ\x00'}
+    openers = {'gz': gzip.GzipFile, 'bz2': bz2.BZ2File, 'xz': lzma.LZMAFile}
+    # errors raised while reading truncated or corrupt (compressed) files; OSError includes gzip.BadGzipFile
+    read_errors = (EOFError, OSError, zlib.error, lzma.LZMAError)
+
+    @staticmethod
+    def get_extension(compression):
+        """ Returns the file extension of a compression
+
+        :param compression: 'gz', 'bz2', 'xz', or None for uncompressed files
+        :type compression: str
+        :return: file extension including the leading dot or empty string for uncompressed files
+        :rtype: str
+        """
+
+        return '' if compression is None else Compression.extensions[compression]
+
+    @staticmethod
+    def strip_extension(path):
+        """ Removes the extension of a compression from a file name
+
+        :param path: file name
+        :type path: str
+        :return: file name without compression extension
+        :rtype: str
+        """
+
+        for extension in Compression.extensions.values():
+            if path.endswith(extension):
+                return path[:-len(extension)]
+        return path
+
+    @staticmethod
+    def detect(in_file):
+        """ Detects the compression of a file by its extension or, failing that, by its leading magic bytes
+
+        :param in_file: path to the file
+        :type in_file: str
+        :return: 'gz', 'bz2', 'xz', or None for uncompressed files
+        :rtype: str
+        """
+
+        for compression, extension in Compression.extensions.items():
+            if in_file.endswith(extension):
+                return compression
+        with open(in_file, 'rb') as instr:
+            head = instr.read(6)
+        for compression, magic in Compression.magic_bytes.items():
+            if head.startswith(magic):
+                return compression
+        return None
+
+    @staticmethod
+    def open_input(in_file):
+        """ Opens a possibly compressed file for reading
+
+        :param in_file: path to the file
+        :type in_file: str
+        :return: binary stream of the decompressed content
+        :rtype: io.BufferedIOBase
+        """
+
+        compression = Compression.detect(in_file)
+        if compression is None:
+            return open(in_file, 'rb')
+        return Compression.openers[compression](in_file, 'rb')
+
+    @staticmethod
+    def open_bytes(content):
+        """ Opens possibly compressed bytes for reading, detecting the compression by their leading magic bytes
+
+        :param content: file content
+        :type content: bytes
+        :return: binary stream of the decompressed content
+        :rtype: io.BufferedIOBase
+        """
+
+        raw_stream = io.BytesIO(content)
+        if content.startswith(Compression.magic_bytes['gz']):
+            return gzip.GzipFile(fileobj=raw_stream, mode='rb')
+        for compression in ['bz2', 'xz']:
+            if content.startswith(Compression.magic_bytes[compression]):
+                return Compression.openers[compression](raw_stream, 'rb')
+        return raw_stream
+
+    @staticmethod
+    def wrap_output(raw_stream, compression=None, encoding='UTF-8'):
+        """ Wraps a binary output stream into a text stream compressing everything written to it
+
+        The returned stream has to be closed before the raw stream, so that the compressor can write its trailer.
+
+        :param raw_stream: binary output stream, e.g. an open file
+        :type raw_stream: io.BufferedIOBase
+        :param compression: 'gz', 'bz2', 'xz', or None for uncompressed output
+        :type compression: str (optional, defaults to None)
+        :param encoding: encoding of the text
+        :type encoding: str (optional, defaults to 'UTF-8')
+        :return: text stream
+        :rtype: io.TextIOWrapper
+        """
+
+        if compression is None:
+            return io.TextIOWrapper(raw_stream, encoding=encoding)
+        if compression == 'gz':
+            # leave the (temporary) file name out of the gzip header
+            stream = gzip.GzipFile(filename='', mode='wb', fileobj=raw_stream, mtime=0)
+        else:
+            stream = Compression.openers[compression](raw_stream, 'wb')
+        return io.TextIOWrapper(stream, encoding=encoding)
@@ -0,0 +1,133 @@
+""" Library interface converting exb files without writing any files
+
+    from exmaralda_converter import convert_many
+    for path, result in convert_many(paths, format='tsv', jobs=4, filters={'categories': ['v']}):
+        if isinstance(result, Exception):
+            ...
+"""
+__author__ = 'zweiss'
+
+import collections
+import concurrent.futures
+import itertools
+from exmaralda_converter import exmaralda
+from exmaralda_converter import generalhelper
+
+
+def dump_tsv(transcript, filters=None, normaliser=None):
+    return generalhelper.TSVDump.get_header(normaliser) + ''.join(
+        rows for tid, rows in generalhelper.TSVDump.generate_tier_dumps(transcript, filters, normaliser))
+
+
+def dump_chronological_tsv(transcript, filters=None, normaliser=None):
+    return ''.join(generalhelper.TSVDump.generate_chronological_rows(transcript, filters, normaliser))
+
+
+def dump_jsonl(transcript, filters=None, normaliser=None):
+    return ''.join(generalhelper.JSONLinesDump.generate_lines(transcript, filters, normaliser=normaliser))
+
+
+def dump_tokens(transcript, filters=None, normaliser=None):
+    if normaliser is not None:
+        raise ValueError('normalisation is not supported by the token format')
+    return ''.join(generalhelper.TokenDump.generate_lines(transcript, filters))
+
+
+# output formats by name, each creating the output of a loaded transcript
+formats = {'tsv': dump_tsv, 'chronological': dump_chronological_tsv, 'jsonl': dump_jsonl, 'tokens': dump_tokens}
+
+
+def convert(in_file, format='tsv', filters=None, interpolate=False, normaliser=None):
+    """ Converts a single exb file
+
+    :param in_file: path to the (possibly compressed) exb file or binary stream of its content
+    :type in_file: str or file object
+    :param format: output format, one of the keys of formats
+    :type format: str (optional, defaults to 'tsv')
+    :param filters: restricts the output to some tiers, see GeneralHelper.select_tiers
+    :type filters: dict (optional, defaults to None)
+    :param interpolate: true if time points that are not anchored in time should be interpolated
+    :type interpolate: bool (optional, defaults to False)
+    :param normaliser: adds the normalised content next to the raw content of each event
+    :type normaliser: Normaliser (optional, defaults to None)
+    :return: the converted content
+    :rtype: str
+    """
+
+    if format not in formats:
+        raise ValueError('unknown format: {}'.format(format))
+    transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+    if interpolate:
+        transcript.normalise_timeline()
+    return formats[format](transcript, filters, normaliser)
+
+
+def convert_many(paths, format='tsv', jobs=1, filters=None, interpolate=False, ordered=False, max_pending=None,
+                 normaliser=None):
+    """ Converts many exb files, yielding each result as soon as it is available
+
+    Files are only submitted for conversion while fewer than max_pending results are waiting to be consumed, so a
+    slow consumer slows down the conversion instead of accumulating results in memory. The paths may be given as a
+    (lazy) iterator. Errors are yielded as exception objects rather than raised, so one broken file does not end the
+    iteration.
+
+    :param paths: paths to the exb files
+    :type paths: iterable of str
+    :param format: output format, one of the keys of formats
+    :type format: str (optional, defaults to 'tsv')
+    :param jobs: number of worker processes; with 1, files are converted in the calling process
+    :type jobs: int (optional, defaults to 1)
+    :param filters: restricts the output to some tiers, see GeneralHelper.select_tiers
+    :type filters: dict (optional, defaults to None)
+    :param interpolate: true if time points that are not anchored in time should be interpolated
+    :type interpolate: bool (optional, defaults to False)
+    :param ordered: true to yield results in input order rather than in completion order
+    :type ordered: bool (optional, defaults to False)
+    :param max_pending: maximum number of submitted but not yet consumed files
+    :type max_pending: int (optional, defaults to twice the number of jobs)
+    :param normaliser: adds the normalised content next to the raw content of each event
+    :type normaliser: Normaliser (optional, defaults to None)
+    :return: path and converted content (str) or error (Exception) of each file
+    :rtype: generator of tuples
+    """
+
+    if format not in formats:
+        raise ValueError('unknown format: {}'.format(format))
+    if jobs <= 1:
+        for path in paths:
+            try:
+                result = convert(path, format, filters, interpolate, normaliser)
+            except Exception as err:
+                result = err
+            yield path, result
+        return
+
+    max_pending = max(max_pending if max_pending is not None else 2 * jobs, 1)
+    paths = iter(paths)
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+
+        def submit(n):
+            return [(executor.submit(convert, path, format, filters, interpolate, normaliser), path)
+                    for path in itertools.islice(paths, n)]
+
+        def get_result(future):
+            try:
+                return future.result()
+            except Exception as err:
+                return err
+
+        if ordered:
+            pending = collections.deque(submit(max_pending))
+            while len(pending) > 0:
+                future, path = pending.popleft()
+                result = get_result(future)
+                pending.extend(submit(1))
+                yield path, result
+        else:
+            pending = dict(submit(max_pending))
+            while len(pending) > 0:
+                done, not_done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    pending.update(submit(1))
+                    yield path, get_result(future)
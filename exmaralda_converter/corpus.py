@@ -0,0 +1,184 @@
+""" Container for many Exmaralda transcripts loaded into the same process
+
+All transcripts of a corpus share one pool of strings (ids, tier attributes, speaker attributes) and one registry
+of speakers, so that values repeated across files are only kept in memory once.
+"""
+__author__ = 'zweiss'
+
+import gc
+import tracemalloc
+from exmaralda_converter import exmaralda
+
+
+class ExmaraldaCorpus:
+    """ Represents a collection of Exmaralda transcripts
+
+    Attributes
+    ----------
+    transcripts: dict
+        transcripts of the corpus by the files they have been loaded from
+    strings: dict
+        pool of strings shared by all transcripts
+    speakers: dict
+        registry of distinct speakers across all transcripts, by their attributes
+    speaker_files: dict
+        files in which each registered speaker occurs, by the speaker attributes
+
+    Methods
+    -------
+    add_file(in_file):
+        Loads a transcript into the corpus
+    add_transcript(in_file, transcript):
+        Adds a transcript that has been loaded before to the corpus
+    register_speaker(speaker, in_file=''):
+        Returns the registered speaker with the same attributes, registering the speaker if necessary
+    get_speaker_files(speaker):
+        Returns the files in which a speaker occurs
+    iter_events():
+        Iterates over all events of the corpus
+    measure_memory(in_files):
+        Compares the memory used by a corpus with the memory used by loading each file on its own
+    """
+
+    def __init__(self):
+        self.transcripts = {}
+        self.strings = {}
+        self.speakers = {}
+        self.speaker_files = {}
+
+    # definition of built-in methods
+
+    def __len__(self):
+        return len(self.transcripts)
+
+    def __iter__(self):
+        return iter(self.transcripts.items())
+
+    def __contains__(self, in_file):
+        return in_file in self.transcripts
+
+    # loading
+
+    @staticmethod
+    def load(in_files):
+        """ Loads a corpus from exb files
+
+        :param in_files: paths to the exb files
+        :type in_files: list of str
+        :return: corpus containing all transcripts
+        :rtype: ExmaraldaCorpus
+        """
+
+        rval = ExmaraldaCorpus()
+        for in_file in in_files:
+            rval.add_file(in_file)
+        return rval
+
+    def add_file(self, in_file):
+        """ Loads a transcript into the corpus
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :return: the loaded transcript
+        :rtype: ExmaraldaTranscript
+        """
+
+        transcript = exmaralda.ExmaraldaTranscript.load(in_file, intern=self.strings)
+        self.add_transcript(in_file, transcript)
+        return transcript
+
+    def add_transcript(self, in_file, transcript):
+        """ Adds a transcript that has been loaded before to the corpus
+
+        The speakers of the transcript are replaced by the registered speakers with the same attributes.
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :param transcript: transcript loaded from the file
+        :type transcript: ExmaraldaTranscript
+        """
+
+        for sid in transcript.speaker_table.keys():
+            transcript.speaker_table[sid] = self.register_speaker(transcript.speaker_table[sid], in_file)
+        self.transcripts[in_file] = transcript
+
+    # speaker registry
+
+    @staticmethod
+    def get_speaker_key(speaker):
+        return (speaker.speaker_id, speaker.abbreviation, speaker.sex, tuple(speaker.languages_used),
+                tuple(speaker.l1), tuple(speaker.l2), speaker.ud_speaker_information, speaker.comment)
+
+    def register_speaker(self, speaker, in_file=''):
+        """ Returns the registered speaker with the same attributes, registering the speaker if necessary
+
+        Registered speakers are shared by all transcripts they occur in, so changing a registered speaker changes it
+        in all of these transcripts.
+
+        :param speaker: speaker to be registered
+        :type speaker: Speaker
+        :param in_file: file in which the speaker occurs
+        :type in_file: str (optional, defaults to '')
+        :return: registered speaker
+        :rtype: Speaker
+        """
+
+        key = ExmaraldaCorpus.get_speaker_key(speaker)
+        if key not in self.speakers:
+            self.speakers[key] = speaker
+            self.speaker_files[key] = []
+        if len(in_file) > 0 and in_file not in self.speaker_files[key]:
+            self.speaker_files[key].append(in_file)
+        return self.speakers[key]
+
+    def get_speaker_files(self, speaker):
+        """ Returns the files in which a speaker occurs
+
+        :param speaker: registered speaker
+        :type speaker: Speaker
+        :return: files in which the speaker occurs
+        :rtype: list of str
+        """
+
+        return self.speaker_files.get(ExmaraldaCorpus.get_speaker_key(speaker), [])
+
+    # iteration
+
+    def iter_events(self):
+        """ Iterates over all events of the corpus in file and tier order
+
+        :return: file, tier, and event of each event
+        :rtype: generator of tuples
+        """
+
+        for in_file, transcript in self.transcripts.items():
+            for tier in transcript.tiers.values():
+                for e in tier.event_list:
+                    yield in_file, tier, e
+
+    # memory usage
+
+    @staticmethod
+    def measure_memory(in_files):
+        """ Compares the memory used by a corpus with the memory used by loading each file on its own
+
+        :param in_files: paths to the exb files
+        :type in_files: list of str
+        :return: bytes allocated for separately loaded transcripts ('separate') and for the corpus ('corpus')
+        :rtype: dict
+        """
+
+        rval = {}
+        for mode in ['separate', 'corpus']:
+            gc.collect()
+            tracemalloc.start()
+            if mode == 'separate':
+                loaded = [exmaralda.ExmaraldaTranscript.load(in_file) for in_file in in_files]
+            else:
+                loaded = ExmaraldaCorpus.load(in_files)
+            gc.collect()
+            rval[mode] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del loaded
+        rval['saved'] = rval['separate'] - rval['corpus']
+        return rval
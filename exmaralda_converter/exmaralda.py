@@ -9,8 +9,13 @@ TODO make this compatible with transcript.py
 """
 __author__ = 'zweiss'
 
+import heapq
+import math
 import os
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from exmaralda_converter import compression
+from exmaralda_converter import validation
 
 
 class Speaker:
@@ -237,6 +242,8 @@ class Timepoint:
 
     Methods
     -------
+    get_seconds():
+        Returns the time stamp as a number or None if the time point is not anchored in time
     pretty_print(indentation_level=0):
         Creates an indented xml representation of the object following Exmaralda standards
     """
@@ -305,6 +312,20 @@ class Timepoint:
     def get_type(self):
         return self.type
 
+    def get_seconds(self):
+        """ Returns the time stamp as a number
+
+        :return: time stamp in seconds or None if the time point is not anchored in time
+        :rtype: float
+        """
+
+        if self.time_stamp == -1:
+            return None
+        try:
+            return float(self.time_stamp)
+        except (TypeError, ValueError):
+            return None
+
     # printing
 
     def pretty_print(self, indentation_level=0):
@@ -555,6 +576,16 @@ class ExmaraldaTranscript:
         Returns a tier form the record of conversation tiers based on its ID
     add_event(event, speaker_id):
         Adds an Event to the transcript
+    get_timeline_order():
+        Orders the time points topologically such that every event starts before it ends
+    normalise_timeline():
+        Orders the timeline topologically and interpolates time stamps of time points not anchored in time
+    diff(other):
+        Determines the changes turning this transcript into another version of it
+    copy_head():
+        Creates a transcript sharing meta information and speakers with this transcript, with empty tiers
+    split(window, policy='start'):
+        Splits the transcript into consecutive time windows
     print_meta_information(indentation_level=0):
         Creates an indented xml representation of the transcript's meta information following Exmaralda standards
     print_speaker_table(indentation_level=0):
@@ -567,6 +598,8 @@ class ExmaraldaTranscript:
         Creates an indented xml representation of the transcript's body following Exmaralda standards
     print_transcript(indentation_level=0, with_preface=False):
         Creates an indented xml representation of the full transcript following Exmaralda standards
+    generate_xml():
+        Generates the xml representation of the full transcript line by line, escaping all contents
     """
 
     preface = '<?xml version="1.0" encoding="UTF-8"?>\n<!-- (c) http://www.rrz.uni-hamburg.de/exmaralda -->\n'
@@ -780,6 +813,221 @@ class ExmaraldaTranscript:
         else:
             print(self.tiers.keys())
 
+    # Methods handling the timeline
+
+    def get_timeline_order(self):
+        """ Orders the time points topologically such that every event starts before it ends
+
+        Time points anchored in time are ordered by their time stamps. All other time points are placed according to
+        the events they delimit, ties are broken by their position in the timeline. If events and time stamps
+        contradict each other, the remaining time points keep their position in the timeline.
+
+        :return: time ids in temporal order
+        :rtype: list of str
+        """
+
+        position = {tid: i for i, tid in enumerate(self.timeline.keys())}
+        successors = {tid: set() for tid in position}
+        in_degree = dict.fromkeys(position, 0)
+
+        def add_edge(before, after):
+            if before != after and before in position and after in position and after not in successors[before]:
+                successors[before].add(after)
+                in_degree[after] += 1
+
+        for tier in self.tiers.values():
+            for e in tier.event_list:
+                add_edge(e.start.time_id, e.end.time_id)
+        seconds = {tid: tp.get_seconds() for tid, tp in self.timeline.items()}
+        anchored = sorted([tid for tid in position if seconds[tid] is not None], key=lambda tid: (seconds[tid], position[tid]))
+        for before, after in zip(anchored, anchored[1:]):
+            add_edge(before, after)
+
+        heap = [(position[tid], tid) for tid in position if in_degree[tid] == 0]
+        heapq.heapify(heap)
+        rval = []
+        while len(heap) > 0:
+            tid = heapq.heappop(heap)[1]
+            rval.append(tid)
+            for succ in successors[tid]:
+                in_degree[succ] -= 1
+                if in_degree[succ] == 0:
+                    heapq.heappush(heap, (position[succ], succ))
+        if len(rval) < len(position):
+            placed = set(rval)
+            rval += [tid for tid in position if tid not in placed]
+        return rval
+
+    def normalise_timeline(self):
+        """ Orders the timeline topologically and interpolates time stamps of time points not anchored in time
+
+        Missing time stamps are linearly interpolated between the closest anchored time points before and after them.
+        Interpolated time points are marked with the Exmaralda time point type 'intp'. Time points before the first or
+        after the last anchored time point remain unanchored.
+
+        :return: number of interpolated time points
+        :rtype: int
+        """
+
+        order = self.get_timeline_order()
+        times = [self.timeline[tid].get_seconds() for tid in order]
+        anchors = [i for i, time in enumerate(times) if time is not None]
+
+        # fill each gap between two anchors at once
+        interpolated = 0
+        for left, right in zip(anchors, anchors[1:]):
+            gap = right - left
+            if gap < 2:
+                continue
+            step = (times[right] - times[left]) / gap
+            times[left+1:right] = [times[left] + step * k for k in range(1, gap)]
+            for tid, time in zip(order[left+1:right], times[left+1:right]):
+                self.timeline[tid].set_time_stamp(str(round(time, 6)))
+                self.timeline[tid].set_type('intp')
+            interpolated += gap - 1
+
+        self.timeline = {tid: self.timeline[tid] for tid in order}
+        return interpolated
+
+    # Methods splitting the transcript
+
+    def copy_head(self):
+        """ Creates a transcript sharing meta information and speakers with this transcript, with empty tiers
+
+        :return: transcript with the same meta information, speaker table, and tiers but without events
+        :rtype: ExmaraldaTranscript
+        """
+
+        rval = ExmaraldaTranscript()
+        rval.meta_information = dict(self.meta_information)
+        rval.meta_information['referenced_file_url'] = list(self.get_referenced_file_url())
+        rval.speaker_table = self.speaker_table
+        for tid, tier in self.tiers.items():
+            rval.add_tier(tier_id=tid, speaker=tier.speaker, tier_category=tier.category, tier_type=tier.type,
+                          display_name=tier.display_name)
+        return rval
+
+    def split(self, window, policy='start'):
+        """ Splits the transcript into consecutive time windows
+
+        Every chunk keeps all tiers (in the same order) and only those time points used by its events. Events that
+        span a window boundary are handled according to the policy:
+        - 'start': the event is assigned to the window in which it starts, so every event occurs in exactly one chunk
+        - 'clip': the event is cut at the window boundaries into one event per window it spans, delimited by new time
+          points 'W<k>' at the boundaries (time id 'W3' denotes the time 3 * window)
+        Events whose times cannot be resolved stay in the chunk of the preceding event of their tier.
+
+        :param window: length of the time windows in seconds
+        :type window: float
+        :param policy: either 'start' or 'clip'
+        :type policy: str (optional, defaults to 'start')
+        :return: chunks in temporal order
+        :rtype: list of ExmaraldaTranscript
+        """
+
+        if window <= 0:
+            raise ValueError('window must be positive: {}'.format(window))
+        if policy not in ['start', 'clip']:
+            raise ValueError('unknown split policy: {}'.format(policy))
+
+        seconds = {tid: tp.get_seconds() for tid, tp in self.timeline.items()}
+        anchored = [time for time in seconds.values() if time is not None]
+        # the latest time stamp belongs to the last chunk, even if it is the end of a window
+        n_chunks = max(math.ceil(max(anchored) / window), 1) if len(anchored) > 0 else 1
+        chunks = [self.copy_head() for _ in range(n_chunks)]
+        boundaries = {}
+
+        def get_boundary(k):
+            if k not in boundaries:
+                boundaries[k] = Timepoint(time_stamp=str(round(k * window, 6)))
+                boundaries[k].set_time_id('W{}'.format(k))
+            return boundaries[k]
+
+        for tid, tier in self.tiers.items():
+            current = 0
+            for e in tier.event_list:
+                start = seconds.get(e.start.time_id)
+                end = seconds.get(e.end.time_id)
+                if start is not None:
+                    current = min(int(start // window), n_chunks - 1)
+                if policy == 'start' or start is None or end is None or end <= (current + 1) * window:
+                    chunks[current].add_event(Event(self.timeline.get(e.start.time_id, e.start),
+                                                    self.timeline.get(e.end.time_id, e.end), e.content), tid)
+                    continue
+                # cut the event at each window boundary it spans
+                last = min(int(end // window), n_chunks - 1)
+                if end == last * window:
+                    last -= 1
+                for k in range(current, last + 1):
+                    c_start = self.timeline[e.start.time_id] if k == current else get_boundary(k)
+                    c_end = self.timeline[e.end.time_id] if k == last else get_boundary(k + 1)
+                    chunks[k].add_event(Event(c_start, c_end, e.content), tid)
+                current = last
+
+        # keep the time points of each chunk in timeline order, framed by the window boundaries if any
+        for k, chunk in enumerate(chunks):
+            c_timeline = {}
+            if k in boundaries and boundaries[k].time_id in chunk.timeline:
+                c_timeline[boundaries[k].time_id] = boundaries[k]
+            c_timeline.update((tid, chunk.timeline[tid]) for tid in self.timeline if tid in chunk.timeline)
+            c_timeline.update((tid, tp) for tid, tp in chunk.timeline.items() if tid not in c_timeline)
+            chunk.timeline = c_timeline
+        return chunks
+
+    # Methods comparing transcripts
+
+    def diff(self, other):
+        """ Determines the changes turning this transcript into another version of it
+
+        Speakers, tiers, and time points are identified by their ids, events by their tier and the ids of their start
+        and end time points. All items are compared by hashing their attributes, so the comparison runs in time
+        linear to the size of both transcripts.
+
+        :param other: the other version of the transcript
+        :type other: ExmaraldaTranscript
+        :return: changes turning this transcript into the other one
+        :rtype: ChangeSet
+        """
+
+        rval = ChangeSet()
+
+        # speakers
+        for sid, speaker in other.speaker_table.items():
+            if sid not in self.speaker_table.keys():
+                rval.speakers['added'][sid] = speaker
+            elif ChangeSet.get_speaker_hash(speaker) != ChangeSet.get_speaker_hash(self.speaker_table[sid]):
+                rval.speakers['modified'][sid] = speaker
+        rval.speakers['removed'] = [sid for sid in self.speaker_table.keys() if sid not in other.speaker_table.keys()]
+
+        # timeline
+        for tid, tp in other.timeline.items():
+            if tid not in self.timeline.keys():
+                rval.timeline['added'][tid] = (tp.time_stamp, tp.type)
+            elif (tp.time_stamp, tp.type) != (self.timeline[tid].time_stamp, self.timeline[tid].type):
+                rval.timeline['modified'][tid] = (tp.time_stamp, tp.type)
+        rval.timeline['removed'] = [tid for tid in self.timeline.keys() if tid not in other.timeline.keys()]
+        rval.timeline['order'] = ChangeSet.get_order(self.timeline.keys(), other.timeline.keys())
+
+        # tiers and events
+        for tid, tier in other.tiers.items():
+            new_events = {(e.start.time_id, e.end.time_id): e.content for e in tier.event_list}
+            if tid not in self.tiers.keys():
+                rval.tiers['added'][tid] = ChangeSet.get_tier_hash(tier)
+                rval.events['added'].extend((tid, start, end, content) for (start, end), content in new_events.items())
+                continue
+            if ChangeSet.get_tier_hash(tier) != ChangeSet.get_tier_hash(self.tiers[tid]):
+                rval.tiers['modified'][tid] = ChangeSet.get_tier_hash(tier)
+            old_events = {(e.start.time_id, e.end.time_id): e.content for e in self.tiers[tid].event_list}
+            for (start, end), content in new_events.items():
+                if (start, end) not in old_events:
+                    rval.events['added'].append((tid, start, end, content))
+                elif old_events[(start, end)] != content:
+                    rval.events['modified'].append((tid, start, end, content))
+            rval.events['removed'].extend((tid, start, end) for (start, end) in old_events if (start, end) not in new_events)
+        rval.tiers['removed'] = [tid for tid in self.tiers.keys() if tid not in other.tiers.keys()]
+        rval.tiers['order'] = ChangeSet.get_order(self.tiers.keys(), other.tiers.keys())
+        return rval
+
     # Printing
 
     def print_meta_information(self, indentation_level=0):
@@ -889,14 +1137,100 @@ class ExmaraldaTranscript:
             self.print_body(indentation_level+1),
             indent)
 
+    def generate_xml(self):
+        """ Generates the xml representation of the full transcript line by line, escaping all contents
+
+        Unlike print_transcript, the transcript is never printed into a single string and all contents and attribute
+        values are escaped, so that event contents such as '<' or '&' cannot break the file. Languages are written as
+        language elements as done by the Partitur editor.
+
+        :return: lines of the exb file including their line breaks
+        :rtype: generator of str
+        """
+
+        def attr(value):
+            return escape(str(value), {'"': '&quot;'})
+
+        def languages(tag, values):
+            return '\t\t\t\t<{0}>{1}</{0}>\n'.format(
+                tag, ''.join('<language lang="{}"/>'.format(attr(lang)) for lang in values))
+
+        yield ExmaraldaTranscript.preface
+        yield '<basic-transcription>\n\t<head>\n\t\t<meta-information>\n'
+        yield '\t\t\t<project-name>{}</project-name>\n'.format(escape(self.get_project_name()))
+        yield '\t\t\t<transcription-name>{}</transcription-name>\n'.format(escape(self.get_transcription_name()))
+        for ref_url in self.get_referenced_file_url():
+            yield '\t\t\t<referenced-file url="{}"/>\n'.format(attr(ref_url))
+        yield '\t\t\t<ud-meta-information>{}</ud-meta-information>\n'.format(escape(self.get_ud_meta_information()))
+        yield '\t\t\t<comment>{}</comment>\n'.format(escape(self.get_comment()))
+        yield '\t\t\t<transcription-convention>{}</transcription-convention>\n'.format(
+            escape(self.get_transcription_convention()))
+        yield '\t\t</meta-information>\n\t\t<speakertable>\n'
+        for speaker_id in sorted(self.speaker_table.keys()):
+            speaker = self.speaker_table[speaker_id]
+            yield '\t\t\t<speaker id="{}">\n'.format(attr(speaker.speaker_id))
+            yield '\t\t\t\t<abbreviation>{}</abbreviation>\n'.format(escape(speaker.abbreviation))
+            yield '\t\t\t\t<sex value="{}"/>\n'.format(attr(speaker.sex))
+            yield languages('languages-used', speaker.languages_used)
+            yield languages('l1', speaker.l1)
+            yield languages('l2', speaker.l2)
+            yield '\t\t\t\t<ud-speaker-information>{}</ud-speaker-information>\n'.format(
+                escape(speaker.ud_speaker_information))
+            yield '\t\t\t\t<comment>{}</comment>\n\t\t\t</speaker>\n'.format(escape(speaker.comment))
+        yield '\t\t</speakertable>\n\t</head>\n\t<basic-body>\n\t\t<common-timeline>\n'
+        for tp in self.timeline.values():
+            yield '\t\t\t<tli id="T{}"{}{}/>\n'.format(
+                attr(tp.time_id), '' if tp.time_stamp == -1 else ' time="{}"'.format(attr(tp.time_stamp)),
+                '' if len(tp.type) == 0 else ' type="{}"'.format(attr(tp.type)))
+        yield '\t\t</common-timeline>\n'
+        for tier in self.tiers.values():
+            yield '\t\t<tier id="{}"{} category="{}" type="{}" display-name="{}">\n'.format(
+                attr(tier.id), ' speaker="{}"'.format(attr(tier.speaker)) if len(tier.speaker) > 0 else '',
+                attr(tier.category), attr(tier.type), attr(tier.display_name))
+            for e in tier.event_list:
+                yield '\t\t\t<event start="T{}" end="T{}">{}</event>\n'.format(attr(e.start.time_id),
+                                                                            attr(e.end.time_id), escape(e.content))
+            yield '\t\t</tier>\n'
+        yield '\t</basic-body>\n</basic-transcription>\n'
+
     # static transcript loader
 
     @staticmethod
-    def load(in_file):
+    def load(in_file, report=None, time_window=None, intern=None):
+        """ Loads a transcript from an exb file
+
+        Integrity problems are collected in the given report during the same pass over the file: duplicate ids,
+        time points without or with invalid time stamps, tiers referring to unknown speakers, events referring to
+        unknown time points, and events starting after they end. Events referring to unknown time points are kept so
+        that all problems can be reported; their times cannot be resolved in the timeline.
+
+        If a time window is given, only events starting within the window are loaded (cf. split with policy 'start').
+        Events whose start time cannot be resolved are loaded if the preceding event of their tier has been loaded.
+
+        :param in_file: path to the (possibly gzip, bz2, or xz compressed) exb file or binary stream of its content
+        :type in_file: str or file object
+        :param report: report collecting the integrity problems of the file
+        :type report: ValidationReport (optional, defaults to None)
+        :param time_window: start (inclusive) and end (exclusive) in seconds of the events to be loaded
+        :type time_window: tuple of floats (optional, defaults to None)
+        :param intern: pool of strings shared across transcripts, used for ids, speaker attributes, and tier attributes;
+            if given, events also share the time points of the timeline rather than holding copies of them
+        :type intern: dict (optional, defaults to None)
+        :return: the loaded transcript
+        :rtype: ExmaraldaTranscript
+        """
+
         rval_transcript = ExmaraldaTranscript()
-        tree = ET.parse(in_file)
+        if isinstance(in_file, str):
+            with compression.Compression.open_input(in_file) as instr:
+                tree = ET.parse(instr)
+        else:
+            tree = ET.parse(in_file)
         root = tree.getroot()
 
+        def pooled(value):
+            return value if intern is None else intern.setdefault(value, value)
+
         # load meta information
         for c_info in root.iter('project-name'):
             rval_transcript.set_project_name(c_info.text.strip() if c_info.text is not None else '')
@@ -909,57 +1243,427 @@ class ExmaraldaTranscript:
 
         # load speaker information
         for c_spk_xml in root.iter('speaker'):
-            abbr = ''
-            sex = ''
-            lang = []
-            l1 = []
-            l2 = []
-            comment = ''
-            for c_child in c_spk_xml:
-                # TODO save also ud-speaker-information
-                if c_child.tag == "abbreviation" and c_child.text is not None:
-                    abbr = c_child.text
-                if c_child.tag == "sex" and 'value' in c_child.attrib.keys() is not None:
-                    sex = c_child.attrib['value']
-                if c_child.tag == "l1" and c_child.text is not None:
-                    l1.append(c_child.text)
-                if c_child.tag == "l2" and c_child.text is not None:
-                    l2.append(c_child.text)
-                if c_child.tag == "comment" and c_child.text is not None:
-                    comment = c_child.text
-                if c_child.tag == "languages-used" and c_child.text is not None:
-                    lang.append(c_child.text)
-            rval_transcript.add_speaker(speaker_id=c_spk_xml.attrib['id'], abbreviation=abbr, sex=sex,
-                                        l1=l1, l2=l2, comment=comment, languages_used=lang)
+            c_spk_id = pooled(c_spk_xml.attrib.get('id', ''))
+            if report is not None:
+                if len(c_spk_id) == 0:
+                    report.error('missing-attribute', 'speaker without id')
+                elif rval_transcript.contains_speaker(c_spk_id):
+                    report.error('duplicate-id', 'speaker id is used more than once', c_spk_id)
+            rval_transcript.add_speaker(speaker_id=c_spk_id, **ExmaraldaTranscript.read_speaker(c_spk_xml, pooled))
 
         # load timelines
+        seconds = {}
         for time_info in root.iter('tli'):
-            new_tp = Timepoint(time_stamp=time_info.attrib['time'])
+            c_time_id = pooled(time_info.attrib.get('id', '')[1:])
+            new_tp = Timepoint(time_stamp=time_info.attrib.get('time', -1), type=pooled(time_info.attrib.get('type', '')))
             # TODO re-think autogenerated timestamps
-            new_tp.time_id = time_info.attrib['id'][1:] # overwrite the autogenerated timestamp
+            new_tp.time_id = c_time_id  # overwrite the autogenerated timestamp
+            if report is not None or time_window is not None:
+                c_seconds = new_tp.get_seconds()
+                if c_seconds is not None:
+                    seconds[c_time_id] = c_seconds
+            if report is not None:
+                if 'id' not in time_info.attrib.keys():
+                    report.error('missing-attribute', 'time point without id')
+                elif c_time_id in rval_transcript.timeline.keys():
+                    report.error('duplicate-id', 'time point id is used more than once', 'T' + c_time_id)
+                if 'time' not in time_info.attrib.keys():
+                    report.warning('missing-time', 'time point is not anchored in time', 'T' + c_time_id)
+                elif c_seconds is None:
+                    report.error('invalid-time', 'time stamp "{}" is not a number'.format(new_tp.time_stamp),
+                                 'T' + c_time_id)
             rval_transcript.timeline[new_tp.time_id] = new_tp
 
         # load tiers and events
         for current_tier_xml in root.iter('tier'):
-            c_tier_id = current_tier_xml.attrib['id'] if 'id' in current_tier_xml.attrib.keys() else ''
+            c_tier_id = pooled(current_tier_xml.attrib['id'] if 'id' in current_tier_xml.attrib.keys() else '')
+            c_speaker = pooled(current_tier_xml.attrib['speaker'] if 'speaker' in current_tier_xml.attrib.keys() else '')
+            if report is not None:
+                if rval_transcript.contains_tier(c_tier_id):
+                    report.error('duplicate-id', 'tier id is used more than once', c_tier_id)
+                if len(c_speaker) > 0 and not rval_transcript.contains_speaker(c_speaker):
+                    report.error('unknown-speaker', 'tier refers to unknown speaker "{}"'.format(c_speaker), c_tier_id)
             rval_transcript.add_tier(tier_id=c_tier_id,
-                                     speaker=current_tier_xml.attrib['speaker'] if 'speaker' in current_tier_xml.attrib.keys() else '',
-                                     tier_category=current_tier_xml.attrib['category'] if 'category' in current_tier_xml.attrib.keys() else '',
-                                     tier_type=current_tier_xml.attrib['type'] if 'type' in current_tier_xml.attrib.keys() else '',
-                                     display_name=current_tier_xml.attrib['display-name'] if 'display-name' in current_tier_xml.attrib.keys() else '')
+                                     speaker=c_speaker,
+                                     tier_category=pooled(current_tier_xml.attrib['category'] if 'category' in current_tier_xml.attrib.keys() else ''),
+                                     tier_type=pooled(current_tier_xml.attrib['type'] if 'type' in current_tier_xml.attrib.keys() else ''),
+                                     display_name=pooled(current_tier_xml.attrib['display-name'] if 'display-name' in current_tier_xml.attrib.keys() else ''))
+            in_window = time_window is None or time_window[0] <= 0
             for event_xml in current_tier_xml:
                 if event_xml.tag != 'event':
-                    print('Issue: something unexpected in tier ')
+                    if report is not None:
+                        report.warning('unexpected-element', 'unexpected element <{}> in tier'.format(event_xml.tag), c_tier_id)
+                    else:
+                        print('Issue: something unexpected in tier ')
+                    continue
+                if 'start' not in event_xml.attrib.keys() or 'end' not in event_xml.attrib.keys():
+                    if report is not None:
+                        report.error('missing-attribute', 'event without start or end', c_tier_id)
                     continue
-                tp1 = Timepoint()
-                tp1.set_time_id(event_xml.attrib['start'][1:])
-                tp2 = Timepoint()
-                tp2.set_time_id(event_xml.attrib['end'][1:])
+                if time_window is not None:
+                    c_start_id = event_xml.attrib['start'][1:]
+                    if c_start_id in seconds:
+                        in_window = time_window[0] <= seconds[c_start_id] < time_window[1]
+                    if not in_window:
+                        continue
+                if intern is not None and event_xml.attrib['start'][1:] in rval_transcript.timeline.keys() \
+                        and event_xml.attrib['end'][1:] in rval_transcript.timeline.keys():
+                    # share the time points of the timeline instead of creating new ones
+                    tp1 = rval_transcript.timeline[event_xml.attrib['start'][1:]]
+                    tp2 = rval_transcript.timeline[event_xml.attrib['end'][1:]]
+                else:
+                    tp1 = Timepoint()
+                    tp1.set_time_id(pooled(event_xml.attrib['start'][1:]))
+                    tp2 = Timepoint()
+                    tp2.set_time_id(pooled(event_xml.attrib['end'][1:]))
+                if report is not None:
+                    for tp in [tp1, tp2]:
+                        if tp.time_id not in rval_transcript.timeline.keys():
+                            report.error('dangling-time-id', 'event refers to unknown time point "T{}"'.format(tp.time_id),
+                                         c_tier_id)
+                    if tp1.time_id in seconds and tp2.time_id in seconds and seconds[tp1.time_id] > seconds[tp2.time_id]:
+                        report.error('start-after-end', 'event starts at T{} ({}) after it ends at T{} ({})'.format(
+                            tp1.time_id, seconds[tp1.time_id], tp2.time_id, seconds[tp2.time_id]), c_tier_id)
                 rval_transcript.add_event(tier_id=c_tier_id,
                                           event=Event(start=tp1, end=tp2,
                                                       content=event_xml.text if event_xml.text is not None else ''))
         return rval_transcript
 
+    @staticmethod
+    def read_speaker(c_spk_xml, pooled=None):
+        """ Reads the attributes of a speaker from its element in the speaker table
+
+        :param c_spk_xml: speaker element
+        :type c_spk_xml: xml.etree.ElementTree.Element
+        :param pooled: returns the shared instance of a string value
+        :type pooled: function (optional, defaults to None)
+        :return: abbreviation, sex, l1, l2, comment, and languages used by their add_speaker parameter names
+        :rtype: dict
+        """
+
+        pooled = pooled if pooled is not None else (lambda value: value)
+        abbr = ''
+        sex = ''
+        lang = []
+        l1 = []
+        l2 = []
+        comment = ''
+        for c_child in c_spk_xml:
+            # TODO save also ud-speaker-information
+            if c_child.tag == "abbreviation" and c_child.text is not None:
+                abbr = pooled(c_child.text)
+            if c_child.tag == "sex" and 'value' in c_child.attrib.keys() is not None:
+                sex = pooled(c_child.attrib['value'])
+            if c_child.tag == "l1" and c_child.text is not None:
+                l1.append(pooled(c_child.text))
+            if c_child.tag == "l2" and c_child.text is not None:
+                l2.append(pooled(c_child.text))
+            if c_child.tag == "comment" and c_child.text is not None:
+                comment = c_child.text
+            if c_child.tag == "languages-used" and c_child.text is not None:
+                lang.append(pooled(c_child.text))
+            # languages written by the Partitur editor
+            if c_child.tag in ["l1", "l2", "languages-used"]:
+                for c_lang in c_child.iter('language'):
+                    if 'lang' in c_lang.attrib.keys():
+                        {"l1": l1, "l2": l2, "languages-used": lang}[c_child.tag].append(pooled(c_lang.attrib['lang']))
+        return {'abbreviation': abbr, 'sex': sex, 'l1': l1, 'l2': l2, 'comment': comment, 'languages_used': lang}
+
+    @staticmethod
+    def stream(in_file, interpolate=False, time_window=None, head=None):
+        """ Reads the events of an exb file one by one without keeping the document or the events in memory
+
+        Speakers, timeline, and tiers (without events) are collected in a transcript which is passed along with each
+        event, so only they and the current event are held in memory. Events are generated in document order, i.e.,
+        tier by tier as long as no tier id is used more than once.
+
+        If a time window is given, only events starting within the window are generated, as with load; the others
+        are skipped without creating any objects for them.
+
+        :param in_file: path to the (possibly gzip, bz2, or xz compressed) exb file
+        :type in_file: str
+        :param interpolate: true if time points that are not anchored in time should be interpolated; this takes an
+            additional pass over the file, keeping only the time ids of the events
+        :type interpolate: bool (optional, defaults to False)
+        :param time_window: start (inclusive) and end (exclusive) in seconds of the events to be generated
+        :type time_window: tuple of floats (optional, defaults to None)
+        :param head: transcript collecting speakers, timeline, and tiers, still available if no event is generated
+        :type head: ExmaraldaTranscript (optional, defaults to a new transcript)
+        :return: transcript head, tier id, and event
+        :rtype: generator of tuples
+        """
+
+        rval_transcript = head if head is not None else ExmaraldaTranscript()
+        timeline = None
+        if interpolate:
+            # order the timeline by the events before their contents are read
+            for c_transcript, c_tier_id, e in ExmaraldaTranscript.stream(in_file):
+                rval_transcript = c_transcript
+                # the events share the time points of the timeline, cf. load with intern
+                rval_transcript.tiers[c_tier_id].event_list.append(
+                    Event(start=rval_transcript.timeline.get(e.start.time_id, e.start),
+                          end=rval_transcript.timeline.get(e.end.time_id, e.end)))
+            if len(rval_transcript.timeline) > 0:
+                rval_transcript.normalise_timeline()
+                timeline = rval_transcript.timeline
+            rval_transcript = head if head is not None else ExmaraldaTranscript()
+
+        with compression.Compression.open_input(in_file) as instr:
+            parents = []
+            c_tier_id = None
+            in_window = True
+            # seconds of the anchored time points, only needed to select the events of a time window
+            seconds = {}
+            for action, element in ET.iterparse(instr, events=('start', 'end')):
+                tag = element.tag
+                if action == 'start':
+                    parents.append(element)
+                    if tag == 'tier':
+                        c_tier_id = element.attrib.get('id', '')
+                        in_window = time_window is None or time_window[0] <= 0
+                        rval_transcript.add_tier(tier_id=c_tier_id, speaker=element.attrib.get('speaker', ''),
+                                                 tier_category=element.attrib.get('category', ''),
+                                                 tier_type=element.attrib.get('type', ''),
+                                                 display_name=element.attrib.get('display-name', ''))
+                    continue
+                parents.pop()
+                # the most frequent elements come first
+                if tag == 'event':
+                    attrib = element.attrib
+                    if c_tier_id is not None and 'start' in attrib and 'end' in attrib:
+                        if time_window is not None:
+                            # events whose start cannot be resolved stay with the preceding event of their tier
+                            c_seconds = seconds.get(attrib['start'][1:])
+                            if c_seconds is not None:
+                                in_window = time_window[0] <= c_seconds < time_window[1]
+                        if in_window:
+                            tp1 = Timepoint()
+                            tp1.set_time_id(attrib['start'][1:])
+                            tp2 = Timepoint()
+                            tp2.set_time_id(attrib['end'][1:])
+                            content = element.text if element.text is not None else ''
+                            yield rval_transcript, c_tier_id, Event(start=tp1, end=tp2, content=content)
+                elif tag == 'tli':
+                    new_tp = Timepoint(time_stamp=element.attrib.get('time', -1), type=element.attrib.get('type', ''))
+                    new_tp.time_id = element.attrib.get('id', '')[1:]
+                    rval_transcript.timeline[new_tp.time_id] = new_tp
+                    if time_window is not None and new_tp.get_seconds() is not None:
+                        seconds[new_tp.time_id] = new_tp.get_seconds()
+                elif tag == 'speaker':
+                    rval_transcript.add_speaker(speaker_id=element.attrib.get('id', ''),
+                                                **ExmaraldaTranscript.read_speaker(element))
+                elif tag == 'common-timeline' and timeline is not None:
+                    rval_transcript.timeline = timeline
+                    if time_window is not None:
+                        seconds = {tid: tp.get_seconds() for tid, tp in timeline.items() if tp.get_seconds() is not None}
+                elif tag == 'tier':
+                    c_tier_id = None
+                else:
+                    continue
+                # drop the repeated elements once they have been read
+                if len(parents) > 0:
+                    parents[-1].remove(element)
+
+    @staticmethod
+    def read_duration(in_file):
+        """ Reads the latest time stamp of the timeline of an exb file without loading its tiers
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :return: latest time stamp in seconds or 0.0 if no time point is anchored in time
+        :rtype: float
+        """
+
+        rval = 0.0
+        with compression.Compression.open_input(in_file) as instr:
+            for event, element in ET.iterparse(instr):
+                if element.tag == 'tli' and 'time' in element.attrib.keys():
+                    try:
+                        rval = max(rval, float(element.attrib['time']))
+                    except ValueError:
+                        pass
+                elif element.tag == 'common-timeline':
+                    break
+        return rval
+
+    @staticmethod
+    def validate(in_file):
+        """ Checks the integrity of an exb file without keeping the loaded transcript
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :return: report listing all integrity problems of the file
+        :rtype: ValidationReport
+        """
+
+        report = validation.ValidationReport(in_file)
+        try:
+            ExmaraldaTranscript.load(in_file, report=report)
+        except ET.ParseError as err:
+            report.error('malformed-xml', str(err))
+        except compression.Compression.read_errors as err:
+            report.error('unreadable-file', '{}: {}'.format(type(err).__name__, err))
+        return report
+
+
+class ChangeSet:
+    """ Represents the changes between two versions of a transcript (cf. ExmaraldaTranscript.diff)
+
+    Attributes
+    ----------
+    speakers: dict
+        'added' and 'modified' speakers by their id, ids of 'removed' speakers
+    tiers: dict
+        'added' and 'modified' tiers by their id as (speaker, category, type, display name), ids of 'removed' tiers,
+        and the new 'order' of tier ids if appending the added tiers does not yield it (None otherwise); the events of
+        removed tiers are removed implicitly
+    timeline: dict
+        'added' and 'modified' time points by their id as (time stamp, type), ids of 'removed' time points, and the new
+        'order' of time ids if appending the added time points does not yield it (None otherwise)
+    events: dict
+        'added' and 'modified' events as (tier id, start id, end id, content), 'removed' events as (tier id, start id,
+        end id)
+
+    Methods
+    -------
+    is_empty():
+        Checks if the change set does not contain any change
+    apply(transcript):
+        Applies the changes to a transcript
+    to_dict():
+        Creates a compact dictionary representation of the changes
+    """
+
+    def __init__(self):
+        self.speakers = {'added': {}, 'removed': [], 'modified': {}}
+        self.tiers = {'added': {}, 'removed': [], 'modified': {}, 'order': None}
+        self.timeline = {'added': {}, 'removed': [], 'modified': {}, 'order': None}
+        self.events = {'added': [], 'removed': [], 'modified': []}
+
+    # definition of built-in methods
+
+    def __len__(self):
+        return sum(len(changes[kind]) for changes in [self.speakers, self.tiers, self.timeline, self.events]
+                   for kind in ['added', 'removed', 'modified']) \
+            + sum(0 if changes['order'] is None else 1 for changes in [self.tiers, self.timeline])
+
+    # hashing
+
+    @staticmethod
+    def get_speaker_hash(speaker):
+        return hash((speaker.abbreviation, speaker.sex, tuple(speaker.languages_used), tuple(speaker.l1),
+                     tuple(speaker.l2), speaker.ud_speaker_information, speaker.comment))
+
+    @staticmethod
+    def get_tier_hash(tier):
+        # tiers are small, so their attributes are used directly rather than a hash of them
+        return tier.speaker, tier.category, tier.type, tier.display_name
+
+    @staticmethod
+    def get_order(old_ids, new_ids):
+        """ Determines whether the order of ids has to be recorded, as apply removes ids and appends added ids
+
+        :param old_ids: ids in the old order
+        :type old_ids: iterable of str
+        :param new_ids: ids in the new order
+        :type new_ids: iterable of str
+        :return: the new order or None if removing and appending ids yields it
+        :rtype: list of str
+        """
+
+        old_ids = list(old_ids)
+        new_ids = list(new_ids)
+        old_set = set(old_ids)
+        new_set = set(new_ids)
+        applied = [i for i in old_ids if i in new_set] + [i for i in new_ids if i not in old_set]
+        return new_ids if applied != new_ids else None
+
+    # additional methods
+
+    def is_empty(self):
+        """ Checks if the change set does not contain any change
+
+        :return: true if both versions of the transcript are equal
+        :rtype: bool
+        """
+
+        return len(self) == 0
+
+    def apply(self, transcript):
+        """ Applies the changes to a transcript
+
+        The events of tiers with added events are ordered according to the timeline afterwards.
+
+        :param transcript: the transcript the change set has been computed from
+        :type transcript: ExmaraldaTranscript
+        """
+
+        for sid in self.speakers['removed']:
+            del transcript.speaker_table[sid]
+        for sid, speaker in list(self.speakers['added'].items()) + list(self.speakers['modified'].items()):
+            transcript.speaker_table[sid] = speaker
+
+        for tid in self.timeline['removed']:
+            del transcript.timeline[tid]
+        for tid, (time_stamp, type) in list(self.timeline['added'].items()) + list(self.timeline['modified'].items()):
+            if tid not in transcript.timeline.keys():
+                transcript.timeline[tid] = Timepoint()
+                transcript.timeline[tid].set_time_id(tid)
+            transcript.timeline[tid].set_time_stamp(time_stamp)
+            transcript.timeline[tid].set_type(type)
+        if self.timeline['order'] is not None:
+            transcript.timeline = {tid: transcript.timeline[tid] for tid in self.timeline['order']}
+
+        for tid in self.tiers['removed']:
+            del transcript.tiers[tid]
+        for tid, (speaker, category, type, display_name) in self.tiers['added'].items():
+            transcript.add_tier(tier_id=tid, speaker=speaker, tier_category=category, tier_type=type,
+                                display_name=display_name)
+        for tid, (speaker, category, type, display_name) in self.tiers['modified'].items():
+            tier = transcript.get_tier(tid)
+            tier.set_speaker(speaker)
+            tier.set_category(category)
+            tier.set_type(type)
+            tier.set_display_name(display_name)
+        if self.tiers['order'] is not None:
+            transcript.tiers = {tid: transcript.tiers[tid] for tid in self.tiers['order']}
+
+        removed = set(self.events['removed'])
+        modified = {(tid, start, end): content for tid, start, end, content in self.events['modified']}
+        for tid in set([tid for tid, start, end in removed] + [tid for tid, start, end in modified]):
+            tier = transcript.get_tier(tid)
+            tier.set_event_list([e for e in tier.event_list if (tid, e.start.time_id, e.end.time_id) not in removed])
+            for e in tier.event_list:
+                if (tid, e.start.time_id, e.end.time_id) in modified:
+                    e.set_content(modified[(tid, e.start.time_id, e.end.time_id)])
+        reordered = set()
+        for tid, start, end, content in self.events['added']:
+            transcript.get_tier(tid).add_event(Event(transcript.timeline[start], transcript.timeline[end], content))
+            reordered.add(tid)
+
+        position = {tid: i for i, tid in enumerate(transcript.timeline.keys())}
+        for tid in reordered:
+            if tid in transcript.tiers.keys():
+                transcript.tiers[tid].event_list.sort(key=lambda e: position.get(e.start.time_id, len(position)))
+
+    def to_dict(self):
+        """ Creates a compact dictionary representation of the changes, e.g. for serialisation as json
+
+        :rtype: dict
+        """
+
+        def speaker_dict(speaker):
+            return {'abbreviation': speaker.abbreviation, 'sex': speaker.sex, 'languages_used': speaker.languages_used,
+                    'l1': speaker.l1, 'l2': speaker.l2, 'ud_speaker_information': speaker.ud_speaker_information,
+                    'comment': speaker.comment}
+
+        return {'speakers': {'added': {sid: speaker_dict(s) for sid, s in self.speakers['added'].items()},
+                             'removed': self.speakers['removed'],
+                             'modified': {sid: speaker_dict(s) for sid, s in self.speakers['modified'].items()}},
+                'tiers': {kind: self.tiers[kind] for kind in ['added', 'removed', 'modified', 'order']},
+                'timeline': {kind: self.timeline[kind] for kind in ['added', 'removed', 'modified', 'order']},
+                'events': {kind: self.events[kind] for kind in ['added', 'removed', 'modified']}}
+
 
 # TODO put this in the test class
 if __name__ == '__main__':
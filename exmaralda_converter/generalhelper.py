@@ -1,60 +1,575 @@
 __author__ = 'zweiss'
 
+import heapq
+import json
 import os
+import re
+import tempfile
+from exmaralda_converter import compression
 from exmaralda_converter import exmaralda
 
 
 class TSVDump:
 
+    header = 'Tier-ID\tType\tDisplay Name\tCategory\tSpeaker-ID\tAbbreviation\tL1\tL2\tLanguages Used\tSex\tStart\tEnd\tString\n'
+    # header with the normalised content next to the raw content, which stays the last column
+    normalised_header = header.replace('\tString\n', '\tNormalised String\tString\n')
+
+    @staticmethod
+    def get_header(normaliser=None):
+        return TSVDump.header if normaliser is None else TSVDump.normalised_header
+
     @staticmethod
-    def generate_cold_data_dump(in_file):
+    def format_time(time_point):
+        # time points that are unknown or not anchored in time are reported as missing values
+        if time_point is None or time_point.time_stamp == -1:
+            return 'NA'
+        return str(time_point.time_stamp)
+
+    @staticmethod
+    def generate_cold_data_dump(in_file, interpolate=False, filters=None, normaliser=None):
 
         # load the transcript
         cold_transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+        if interpolate:
+            cold_transcript.normalise_timeline()
 
         # create a data table
-        rval = 'Tier-ID\tType\tDisplay Name\tCategory\tSpeaker-ID\tAbbreviation\tL1\tL2\tLanguages Used\tSex\tStart\tEnd\tString\n'
-        for tid in cold_transcript.tiers:
+        return TSVDump.get_header(normaliser) + ''.join(
+            rows for tid, rows in TSVDump.generate_tier_dumps(cold_transcript, filters, normaliser))
+
+    @staticmethod
+    def get_tier_prefix(cold_transcript, tid):
+        """ Creates the tier and speaker columns shared by all rows of a tier
+
+        :param cold_transcript: transcript containing the tier
+        :type cold_transcript: ExmaraldaTranscript
+        :param tid: id of the tier
+        :type tid: str
+        :return: tab-separated tier and speaker columns including a trailing tab
+        :rtype: str
+        """
+
+        tier = cold_transcript.tiers[tid]
+        typ = tier.type if len(tier.type) > 0 else 'NA'
+        dname = tier.display_name if len(tier.display_name) > 0 else 'NA'
+        cat = tier.category if len(tier.category) > 0 else 'NA'
+        sid = "NA"
+        abb = "NA"
+        l1 = "NA"
+        l2 = "NA"
+        luse = "NA"
+        sex = "NA"
+
+        if len(tier.speaker) > 0 and tier.speaker in cold_transcript.speaker_table.keys():
+            sid = tier.speaker
+            abb = cold_transcript.speaker_table[sid].abbreviation if len(cold_transcript.speaker_table[sid].abbreviation) > 0 else 'NA'
+            l1 = '_'.join(cold_transcript.speaker_table[sid].l1) if len(cold_transcript.speaker_table[sid].l1) > 0 else 'NA'
+            l2 = '_'.join(cold_transcript.speaker_table[sid].l2) if len(cold_transcript.speaker_table[sid].l2) > 0 else 'NA'
+            luse = '_'.join(cold_transcript.speaker_table[sid].languages_used) if len(cold_transcript.speaker_table[sid].languages_used) > 0 else 'NA'
+            sex = cold_transcript.speaker_table[sid].sex if len(cold_transcript.speaker_table[sid].sex) > 0 else 'NA'
+
+        return tid + "\t" + typ + "\t" + dname + "\t" + cat + "\t" + sid + "\t" + abb + "\t" + l1 + "\t" + l2 + "\t" + luse + "\t" + sex + "\t"
+
+    @staticmethod
+    def generate_tier_dumps(cold_transcript, filters=None, normaliser=None):
+        """ Creates the data table rows of a transcript separately for each tier
+
+        :param cold_transcript: transcript to be dumped
+        :type cold_transcript: ExmaraldaTranscript
+        :param filters: restricts the dump to some tiers, see GeneralHelper.select_tiers
+        :type filters: dict (optional, defaults to None)
+        :param normaliser: adds the normalised content next to the raw content
+        :type normaliser: Normaliser (optional, defaults to None)
+        :return: tier ids and the rows of their events in tier order
+        :rtype: list of tuples
+        """
+
+        rval = []
+        for tid in GeneralHelper.select_tiers(cold_transcript, filters):
             tier = cold_transcript.tiers[tid]
-            typ = tier.type if len(tier.type) > 0 else 'NA'
-            dname = tier.display_name if len(tier.display_name) > 0 else 'NA'
             cat = tier.category if len(tier.category) > 0 else 'NA'
-            sid = "NA"
-            abb = "NA"
-            l1 = "NA"
-            l2 = "NA"
-            luse = "NA"
-            sex = "NA"
-
-            if len(tier.speaker) > 0 and tier.speaker in cold_transcript.speaker_table.keys():
-                sid = tier.speaker
-                abb = cold_transcript.speaker_table[sid].abbreviation if len(cold_transcript.speaker_table[sid].abbreviation) > 0 else 'NA'
-                l1 = '_'.join(cold_transcript.speaker_table[sid].l1) if len(cold_transcript.speaker_table[sid].l1) > 0 else 'NA'
-                l2 = '_'.join(cold_transcript.speaker_table[sid].l2) if len(cold_transcript.speaker_table[sid].l2) > 0 else 'NA'
-                luse = '_'.join(cold_transcript.speaker_table[sid].languages_used) if len(cold_transcript.speaker_table[sid].languages_used) > 0 else 'NA'
-                sex = cold_transcript.speaker_table[sid].sex if len(cold_transcript.speaker_table[sid].sex) > 0 else 'NA'
-
-            prefix = tid + "\t" + typ + "\t" + dname + "\t" + cat + "\t" + sid + "\t" + abb + "\t" + l1 + "\t" + l2 + "\t" + luse + "\t" + sex + "\t"
+            prefix = TSVDump.get_tier_prefix(cold_transcript, tid)
 
+            rows = ''
             for e in tier.event_list:
-                stime = cold_transcript.timeline[e.start.time_id].time_stamp
-                etime = cold_transcript.timeline[e.end.time_id].time_stamp
-                rval += prefix + stime + "\t" + etime + "\t" + e.content
-                if cat == "v" and (e.content.endswith(".") or e.content.endswith("!") or e.content.endswith("?")):
-                    #print(rval)
-                    rval += " "
-                rval += "\n"
+                rows += prefix + TSVDump.format_event(cold_transcript, e, cat == "v", normaliser)
+            rval.append((tid, rows))
         return rval
 
+    @staticmethod
+    def format_event(cold_transcript, e, verbal, normaliser=None):
+        """ Creates the time and content columns of an event
+
+        :param cold_transcript: transcript containing the event
+        :type cold_transcript: ExmaraldaTranscript
+        :param e: event to be formatted
+        :type e: Event
+        :param verbal: true if the event belongs to a verbal tier (category 'v')
+        :type verbal: bool
+        :param normaliser: adds the normalised content before the raw content
+        :type normaliser: Normaliser (optional, defaults to None)
+        :return: tab-separated start, end, (normalised content,) and content including the line break
+        :rtype: str
+        """
+
+        row = (TSVDump.format_time(cold_transcript.timeline.get(e.start.time_id)) + "\t"
+               + TSVDump.format_time(cold_transcript.timeline.get(e.end.time_id)) + "\t"
+               + (normaliser.normalise(e.content) + "\t" if normaliser is not None else '') + e.content)
+        if verbal and (e.content.endswith(".") or e.content.endswith("!") or e.content.endswith("?")):
+            row += " "
+        return row + "\n"
+
+    @staticmethod
+    def generate_streamed_rows(in_file, interpolate=False, filters=None, normaliser=None):
+        """ Generates the rows of the data table while the exb file is read, see ExmaraldaTranscript.stream
+
+        The rows equal those of generate_cold_data_dump, but neither the document, nor the events, nor the data table
+        are held in memory, so the memory needed depends on the size of the timeline rather than of the file.
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :param interpolate: true if time points that are not anchored in time should be interpolated
+        :type interpolate: bool (optional, defaults to False)
+        :param filters: restricts the dump to some tiers, see GeneralHelper.select_tiers
+        :type filters: dict (optional, defaults to None)
+        :param normaliser: adds the normalised content next to the raw content
+        :type normaliser: Normaliser (optional, defaults to None)
+        :return: header followed by one row per event
+        :rtype: generator of str
+        """
+
+        yield TSVDump.get_header(normaliser)
+        # prefix and verbal flag of each tier, None for tiers that are not selected
+        tier_formats = {}
+        for cold_transcript, tid, e in exmaralda.ExmaraldaTranscript.stream(in_file, interpolate):
+            if tid not in tier_formats:
+                tier = cold_transcript.tiers[tid]
+                tier_formats[tid] = (TSVDump.get_tier_prefix(cold_transcript, tid), tier.category == "v") \
+                    if tid in GeneralHelper.select_tiers(cold_transcript, filters) else None
+            if tier_formats[tid] is not None:
+                prefix, verbal = tier_formats[tid]
+                yield prefix + TSVDump.format_event(cold_transcript, e, verbal, normaliser)
+
+    @staticmethod
+    def generate_chronological_rows(cold_transcript, filters=None, normaliser=None):
+        """ Generates the rows of the data table in temporal order rather than tier by tier
+
+        The events of each tier are merged with those of all other tiers using a heap holding the next event of each
+        tier, so only one event per tier is compared at a time. Events are ordered by the position of their start in
+        the timeline order (cf. ExmaraldaTranscript.get_timeline_order), which places time points without time stamps
+        between their neighbours. Time points with the same time stamp share their position, so events starting at the
+        same time keep the tier order. The events of a tier are expected in temporal order, as written by the Partitur
+        editor, and only sorted if they are not.
+
+        :param cold_transcript: transcript to be dumped
+        :type cold_transcript: ExmaraldaTranscript
+        :param filters: restricts the dump to some tiers, see GeneralHelper.select_tiers
+        :type filters: dict (optional, defaults to None)
+        :param normaliser: adds the normalised content next to the raw content
+        :type normaliser: Normaliser (optional, defaults to None)
+        :return: header followed by one row per event
+        :rtype: generator of str
+        """
+
+        # time points with equal seconds share the rank of the first of them, even if time points without time stamps
+        # have been placed in between
+        rank = {}
+        first = {}
+        for i, tid in enumerate(cold_transcript.get_timeline_order()):
+            seconds = cold_transcript.timeline[tid].get_seconds()
+            rank[tid] = i if seconds is None else first.setdefault(seconds, i)
+
+        def tier_stream(k, tid):
+            tier = cold_transcript.tiers[tid]
+            prefix = TSVDump.get_tier_prefix(cold_transcript, tid)
+            verbal = tier.category == "v"
+            # events starting at unknown time points stay behind the preceding event of their tier
+            keys = []
+            previous = -1
+            for e in tier.event_list:
+                previous = rank.get(e.start.time_id, previous)
+                keys.append(previous)
+            order = range(len(keys))
+            if any(keys[i] > keys[i + 1] for i in range(len(keys) - 1)):
+                order = sorted(order, key=keys.__getitem__)
+            for i in order:
+                yield keys[i], k, i, prefix, tier.event_list[i], verbal
+
+        yield TSVDump.get_header(normaliser)
+        streams = [tier_stream(k, tid) for k, tid in enumerate(GeneralHelper.select_tiers(cold_transcript, filters))]
+        for key, k, i, prefix, e, verbal in heapq.merge(*streams):
+            yield prefix + TSVDump.format_event(cold_transcript, e, verbal, normaliser)
+
+    @staticmethod
+    def generate_window_dump(in_file, k, n_windows, window=600.0, interpolate=False, filters=None, normaliser=None):
+        """ Creates the tier dumps of the events starting within the k-th time window of a transcript
+
+        Only the events of the window are loaded, while the rest of the file is skipped by a streaming parser (see
+        ExmaraldaTranscript.stream); still, every window reads the whole file. Interpolating time points requires the
+        full transcript in every window, so files to be interpolated are better dumped as a whole. Events before the
+        first and after the last window belong to the first and last window.
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :param k: index of the time window
+        :type k: int
+        :param n_windows: number of time windows of the transcript
+        :type n_windows: int
+        :param window: length of the time windows in seconds
+        :type window: float (optional, defaults to 600.0)
+        :param interpolate: true if time points that are not anchored in time should be interpolated
+        :type interpolate: bool (optional, defaults to False)
+        :param filters: restricts the dump to some tiers, see GeneralHelper.select_tiers
+        :type filters: dict (optional, defaults to None)
+        :param normaliser: adds the normalised content next to the raw content
+        :type normaliser: Normaliser (optional, defaults to None)
+        :return: tier ids and the rows of their events in tier order
+        :rtype: list of tuples
+        """
+
+        if interpolate:
+            cold_transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+            cold_transcript.normalise_timeline()
+            return TSVDump.generate_tier_dumps(cold_transcript.split(window)[k], filters, normaliser)
+        time_window = (k * window if k > 0 else float('-inf'), (k + 1) * window if k < n_windows - 1 else float('inf'))
+        cold_transcript = exmaralda.ExmaraldaTranscript()
+        for cold_transcript, tid, e in exmaralda.ExmaraldaTranscript.stream(in_file, time_window=time_window,
+                                                                           head=cold_transcript):
+            cold_transcript.add_event(e, tid)
+        return TSVDump.generate_tier_dumps(cold_transcript, filters, normaliser)
+
+    @staticmethod
+    def merge_tier_dumps(chunk_dumps, normaliser=None):
+        """ Merges the tier dumps of consecutive chunks of a transcript into a single data table
+
+        :param chunk_dumps: tier dumps of the chunks in temporal order
+        :type chunk_dumps: list of lists of tuples
+        :param normaliser: normaliser the chunks have been dumped with, determines the header
+        :type normaliser: Normaliser (optional, defaults to None)
+        :return: data table of the transcript
+        :rtype: str
+        """
+
+        rval = [TSVDump.get_header(normaliser)]
+        for i, (tid, rows) in enumerate(chunk_dumps[0]):
+            rval.append(rows)
+            rval.extend(chunk_dump[i][1] for chunk_dump in chunk_dumps[1:])
+        return ''.join(rval)
+
+
+class JSONLinesDump:
+    """ Creates json-lines dumps with one object per event
+
+    Every line is a json object with a 'record' key. By default, each event record contains its tier and speaker
+    metadata as nested objects. With referenced metadata, speaker and tier records are written once before the events,
+    which only contain the id of their tier.
+
+    Methods
+    -------
+    generate_lines(cold_transcript, filters=None, reference_metadata=False, normaliser=None):
+        Generates the lines of the dump of a transcript one by one
+    """
+
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def format_time(time_point):
+        # time points that are unknown or not anchored in time are reported as null
+        return JSONLinesDump.encoder.encode(None if time_point is None else time_point.get_seconds())
+
+    @staticmethod
+    def get_speaker_record(speaker):
+        return {'id': speaker.speaker_id, 'abbreviation': speaker.abbreviation, 'sex': speaker.sex,
+                'languages_used': speaker.languages_used, 'l1': speaker.l1, 'l2': speaker.l2}
+
+    @staticmethod
+    def get_tier_record(tier):
+        return {'id': tier.id, 'type': tier.type, 'display_name': tier.display_name, 'category': tier.category}
+
+    @staticmethod
+    def generate_lines(cold_transcript, filters=None, reference_metadata=False, normaliser=None):
+        """ Generates the lines of the dump of a transcript one by one, so the dump never has to be kept in memory
+
+        The json of the tier metadata is only encoded once per tier, events only encode their times and content.
+
+        :param cold_transcript: transcript to be dumped
+        :type cold_transcript: ExmaraldaTranscript
+        :param filters: restricts the dump to some tiers, see GeneralHelper.select_tiers
+        :type filters: dict (optional, defaults to None)
+        :param reference_metadata: true to write speakers and tiers as separate records referenced by id
+        :type reference_metadata: bool (optional, defaults to False)
+        :param normaliser: adds the normalised content as 'normalised' to each event
+        :type normaliser: Normaliser (optional, defaults to None)
+        :return: json encoded lines including their line breaks
+        :rtype: generator of str
+        """
+
+        encode = JSONLinesDump.encoder.encode
+        tids = GeneralHelper.select_tiers(cold_transcript, filters)
+
+        if reference_metadata:
+            for sid, speaker in cold_transcript.speaker_table.items():
+                if any(cold_transcript.tiers[tid].speaker == sid for tid in tids):
+                    yield encode(dict({'record': 'speaker'}, **JSONLinesDump.get_speaker_record(speaker))) + '\n'
+            for tid in tids:
+                tier = cold_transcript.tiers[tid]
+                speaker = tier.speaker if tier.speaker in cold_transcript.speaker_table else None
+                yield encode(dict({'record': 'tier'}, **JSONLinesDump.get_tier_record(tier), speaker=speaker)) + '\n'
+
+        for tid in tids:
+            tier = cold_transcript.tiers[tid]
+            if reference_metadata:
+                tier_json = encode(tid)
+            else:
+                speaker = cold_transcript.speaker_table.get(tier.speaker)
+                tier_json = encode(dict(JSONLinesDump.get_tier_record(tier), speaker=None if speaker is None else
+                                        JSONLinesDump.get_speaker_record(speaker)))
+            prefix = '{"record":"event","tier":' + tier_json + ',"start":'
+            for e in tier.event_list:
+                yield (prefix + JSONLinesDump.format_time(cold_transcript.timeline.get(e.start.time_id)) + ',"end":'
+                       + JSONLinesDump.format_time(cold_transcript.timeline.get(e.end.time_id)) + ',"content":'
+                       + encode(e.content)
+                       + (',"normalised":' + encode(normaliser.normalise(e.content)) if normaliser is not None else '')
+                       + '}\n')
+
+
+class TokenDump:
+    """ Creates data tables with one token per line
+
+    Event contents are split with a precompiled regular expression matching the tokens. Each token row carries the
+    tier and speaker columns and the times of its event (cf. TSVDump), the position of the event within its tier and
+    of the token within its event, and the character offsets of the token within the event content. Optionally, token
+    times are linearly interpolated from the event times by their character offsets.
+
+    Methods
+    -------
+    get_header(token_times=False):
+        Returns the header of a token table
+    generate_lines(cold_transcript, filters=None, pattern=default_pattern, token_times=False):
+        Generates the rows of the token table of a transcript tier by tier
+    """
+
+    # words (including inner hyphens and apostrophes) and sequences of other non-space characters
+    default_pattern = r"\w+(?:[-'’]\w+)*|[^\w\s]+"
+
+    @staticmethod
+    def get_header(token_times=False):
+        return (TSVDump.header[:TSVDump.header.index('String')] + 'Event\tToken\tChar-Start\tChar-End\t'
+                + ('Token-Start\tToken-End\t' if token_times else '') + 'String\n')
+
+    @staticmethod
+    def generate_lines(cold_transcript, filters=None, pattern=default_pattern, token_times=False):
+        """ Generates the rows of the token table of a transcript tier by tier
+
+        :param cold_transcript: transcript to be dumped
+        :type cold_transcript: ExmaraldaTranscript
+        :param filters: restricts the dump to some tiers, see GeneralHelper.select_tiers
+        :type filters: dict (optional, defaults to None)
+        :param pattern: regular expression matching a token, or its compiled form
+        :type pattern: str or re.Pattern (optional, defaults to TokenDump.default_pattern)
+        :param token_times: true if token times should be interpolated from the event times
+        :type token_times: bool (optional, defaults to False)
+        :return: header followed by the rows of each tier
+        :rtype: generator of str
+        """
+
+        tokenize = re.compile(pattern).finditer
+        yield TokenDump.get_header(token_times)
+        for tid in GeneralHelper.select_tiers(cold_transcript, filters):
+            tier = cold_transcript.tiers[tid]
+            prefix = TSVDump.get_tier_prefix(cold_transcript, tid)
+            rows = []
+            for i, e in enumerate(tier.event_list):
+                start = cold_transcript.timeline.get(e.start.time_id)
+                end = cold_transcript.timeline.get(e.end.time_id)
+                event_prefix = prefix + TSVDump.format_time(start) + "\t" + TSVDump.format_time(end) + "\t" + str(i) + "\t"
+                if token_times:
+                    start = start.get_seconds() if start is not None else None
+                    end = end.get_seconds() if end is not None else None
+                    # seconds per character of the event content
+                    rate = None
+                    if start is not None and end is not None and len(e.content) > 0:
+                        rate = (end - start) / len(e.content)
+                for j, token in enumerate(tokenize(e.content)):
+                    char_start, char_end = token.span()
+                    if not token_times:
+                        rows.append('%s%d\t%d\t%d\t%s\n' % (event_prefix, j, char_start, char_end, token.group()))
+                    elif rate is None:
+                        rows.append('%s%d\t%d\t%d\tNA\tNA\t%s\n' % (event_prefix, j, char_start, char_end, token.group()))
+                    else:
+                        rows.append('%s%d\t%d\t%d\t%r\t%r\t%s\n' % (event_prefix, j, char_start, char_end,
+                                                                      round(start + rate * char_start, 6),
+                                                                      round(start + rate * char_end, 6), token.group()))
+            yield ''.join(rows)
+
+
+class StarSchemaDump:
+    """ Creates separate speaker, tier, and event tables linked by id instead of one table repeating the tier and
+    speaker columns in every row
+
+    Methods
+    -------
+    generate_tables(cold_transcript, filters=None, normaliser=None):
+        Creates the speaker and tier tables and generates the rows of the event table
+    rejoin(speakers, tiers, events):
+        Joins the three tables into the data table created by TSVDump
+    """
+
+    # table names used as file endings, e.g. 'lesson1.events.tsv'
+    tables = ['speakers', 'tiers', 'events']
+    headers = {'speakers': 'Speaker-ID\tAbbreviation\tL1\tL2\tLanguages Used\tSex\n',
+               'tiers': 'Tier-ID\tType\tDisplay Name\tCategory\tSpeaker-ID\n',
+               'events': 'Tier-ID\tStart\tEnd\tString\n'}
+    normalised_events_header = 'Tier-ID\tStart\tEnd\tNormalised String\tString\n'
+
+    @staticmethod
+    def generate_tables(cold_transcript, filters=None, normaliser=None):
+        """ Creates the speaker and tier tables and generates the rows of the event table
+
+        Only the speakers of the selected tiers are listed. Tiers without a known speaker have the Speaker-ID 'NA'.
+
+        :param cold_transcript: transcript to be dumped
+        :type cold_transcript: ExmaraldaTranscript
+        :param filters: restricts the dump to some tiers, see GeneralHelper.select_tiers
+        :type filters: dict (optional, defaults to None)
+        :param normaliser: adds the normalised content next to the raw content of the event table
+        :type normaliser: Normaliser (optional, defaults to None)
+        :return: speaker table, tier table, and the event table generated tier by tier, by their table names
+        :rtype: dict
+        """
+
+        tids = GeneralHelper.select_tiers(cold_transcript, filters)
+        speakers = StarSchemaDump.headers['speakers']
+        tiers = StarSchemaDump.headers['tiers']
+        sids = []
+        for tid in tids:
+            # the prefix of the data table holds the tier columns followed by the speaker columns
+            columns = TSVDump.get_tier_prefix(cold_transcript, tid).split('\t')
+            tiers += '\t'.join(columns[:5]) + '\n'
+            if columns[4] != 'NA' and columns[4] not in sids:
+                sids.append(columns[4])
+                speakers += '\t'.join(columns[4:10]) + '\n'
+        return {'speakers': speakers, 'tiers': tiers,
+                'events': StarSchemaDump.generate_events(cold_transcript, tids, normaliser)}
+
+    @staticmethod
+    def generate_events(cold_transcript, tids, normaliser=None):
+        yield StarSchemaDump.headers['events'] if normaliser is None else StarSchemaDump.normalised_events_header
+        for tid in tids:
+            tier = cold_transcript.tiers[tid]
+            rows = []
+            for e in tier.event_list:
+                rows.append(tid + "\t" + TSVDump.format_event(cold_transcript, e, tier.category == "v", normaliser))
+            yield ''.join(rows)
+
+    @staticmethod
+    def rejoin(speakers, tiers, events):
+        """ Joins the three tables into the data table created by TSVDump
+
+        :param speakers: speaker table
+        :type speakers: str
+        :param tiers: tier table
+        :type tiers: str
+        :param events: event table, its rows (e.g. an open file), or the tiers generated by generate_tables
+        :type events: str or iterable of str
+        :return: rows of the data table including its header
+        :rtype: generator of str
+        """
+
+        na_speaker = '\t'.join(['NA'] * 6)
+        speaker_columns = {row.split('\t', 1)[0]: row for row in speakers.splitlines()[1:]}
+        prefixes = {}
+        for row in tiers.splitlines()[1:]:
+            tier_columns = row.split('\t')
+            prefixes[tier_columns[0]] = '\t'.join(tier_columns[:4]) + '\t' + speaker_columns.get(tier_columns[4], na_speaker) + '\t'
+        # the event table generated by generate_tables holds the rows of a whole tier in each string
+        chunks = [events] if isinstance(events, str) else events
+        rows = (row for chunk in chunks for row in chunk.splitlines(keepends=True))
+        for i, row in enumerate(rows):
+            if i == 0:
+                # event tables with normalised contents are joined into data tables with normalised contents
+                yield TSVDump.normalised_header if row == StarSchemaDump.normalised_events_header else TSVDump.header
+            else:
+                tid, rest = row.split('\t', 1)
+                yield prefixes[tid] + rest
+
 
 class GeneralHelper:
 
     @staticmethod
     def rec_read_files(in_dir, file_ending=".exb"):
+        # compressed files (e.g., .exb.gz) are included, see compression.Compression
         rval = []
         for root, dirs, files in os.walk(in_dir):
             for f in files:
-                if f.startswith(".") or not f.endswith(file_ending):
+                if f.startswith(".") or not compression.Compression.strip_extension(f).endswith(file_ending):
                     continue
                 rval.append(os.path.join(root,f))
         return rval
+
+    @staticmethod
+    def select_tiers(transcript, filters=None):
+        """ Selects the tiers of a transcript matching all given filters
+
+        Supported filters are lists of 'tiers' (tier ids), 'categories', 'types', and 'speakers' (speaker ids or
+        abbreviations).
+
+        :param transcript: transcript whose tiers are selected
+        :type transcript: ExmaraldaTranscript
+        :param filters: lists of accepted values by filter name
+        :type filters: dict (optional, defaults to None)
+        :return: ids of the selected tiers in tier order
+        :rtype: list of str
+        """
+
+        if filters is None or len(filters) == 0:
+            return list(transcript.tiers.keys())
+        unknown = set(filters.keys()) - {'tiers', 'categories', 'types', 'speakers'}
+        if len(unknown) > 0:
+            raise ValueError('unknown filter(s): {}'.format(', '.join(sorted(unknown))))
+        rval = []
+        for tid, tier in transcript.tiers.items():
+            if 'tiers' in filters and tid not in filters['tiers']:
+                continue
+            if 'categories' in filters and tier.category not in filters['categories']:
+                continue
+            if 'types' in filters and tier.type not in filters['types']:
+                continue
+            if 'speakers' in filters:
+                abbreviation = transcript.speaker_table[tier.speaker].abbreviation if tier.speaker in transcript.speaker_table else None
+                if tier.speaker not in filters['speakers'] and abbreviation not in filters['speakers']:
+                    continue
+            rval.append(tid)
+        return rval
+
+    @staticmethod
+    def atomic_write(out_file, content, encoding="UTF-8", compress=None):
+        """ Writes content to a file such that readers either see the old or the complete new file
+
+        The content is written to a temporary file in the target directory which then replaces the target.
+
+        :param out_file: path to the output file
+        :type out_file: str
+        :param content: content to be written, either as a whole or as an iterable of consecutive parts
+        :type content: str or iterable of str
+        :param encoding: encoding of the output file
+        :type encoding: str (optional, defaults to 'UTF-8')
+        :param compress: 'gz', 'bz2', 'xz', or None for uncompressed output
+        :type compress: str (optional, defaults to None)
+        """
+
+        out_dir = os.path.dirname(os.path.abspath(out_file))
+        fd, tmp_file = tempfile.mkstemp(dir=out_dir, prefix='.' + os.path.basename(out_file), suffix='.tmp')
+        try:
+            with open(fd, 'wb') as rawstr:
+                with compression.Compression.wrap_output(rawstr, compress, encoding) as outstr:
+                    if isinstance(content, str):
+                        outstr.write(content)
+                    else:
+                        outstr.writelines(content)
+            os.chmod(tmp_file, 0o644)
+            os.replace(tmp_file, out_file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
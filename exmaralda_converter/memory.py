@@ -0,0 +1,220 @@
+""" Conversion of many exb files within a memory budget
+
+The peak memory of converting a file is estimated from its size. Files whose conversion would take more than a
+worker's share of the budget are streamed (cf. TSVDump.generate_streamed_rows), and files are only started while the
+estimated peaks of all conversions in flight fit into the budget. The actual peak of each conversion is measured as the
+high water mark of the resident set size (VmHWM), which is reset before each file where /proc/self/clear_refs is
+available; otherwise the maximum resident set size of the process (resource.getrusage) is reported.
+"""
+__author__ = 'zweiss'
+
+import os
+import sys
+from exmaralda_converter import compression
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class MemoryBudget:
+    """ Plans the conversion of exb files such that the estimated peak memory of all conversions stays within a budget
+
+    Attributes
+    ----------
+    max_memory: int
+        budget in bytes for all conversions together, including the calling process
+    jobs: int
+        number of worker processes
+    streaming: bool
+        true if large files may be streamed
+    interpolate: bool
+        true if time points that are not anchored in time are interpolated
+    base: int
+        resident memory in bytes of an idle (worker) process
+
+    Methods
+    -------
+    parse_size(size):
+        Reads a memory size such as 512M or 4G
+    get_strategy(in_file):
+        Selects how a file is converted
+    estimate(in_file, strategy):
+        Estimates the peak memory of converting a file
+    fits(estimate, in_flight):
+        Tells whether a conversion can be started next to the ones in flight
+    reset_peak():
+        Resets the peak memory of the current process
+    get_peak():
+        Returns the peak memory of the current process
+    measure(function, args):
+        Calls a function and returns the peak memory of the call
+    """
+
+    # peak memory (excluding the idle process) per byte of uncompressed exb file for each strategy; measured on
+    # transcripts of several MB with a reserve of about 20 %
+    factors = {'load': 20.0, 'stream': 3.0, 'stream-interpolate': 10.0}
+    # assumed ratio of the uncompressed and the compressed size of exb files
+    compression_ratio = 10.0
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+    def __init__(self, max_memory, jobs=1, streaming=True, interpolate=False, base=None):
+        """
+        :param max_memory: budget in bytes for all conversions together, including the calling process
+        :type max_memory: int
+        :param jobs: number of worker processes
+        :type jobs: int (optional, defaults to 1)
+        :param streaming: true if large files may be streamed
+        :type streaming: bool (optional, defaults to True)
+        :param interpolate: true if time points that are not anchored in time are interpolated
+        :type interpolate: bool (optional, defaults to False)
+        :param base: resident memory in bytes of an idle (worker) process
+        :type base: int (optional, defaults to the current resident memory of the calling process)
+        """
+
+        self.max_memory = max_memory
+        self.jobs = jobs
+        self.streaming = streaming
+        self.interpolate = interpolate
+        self.base = base if base is not None else MemoryBudget.get_current()
+
+    @staticmethod
+    def parse_size(size):
+        """ Reads a memory size given in bytes with an optional unit K, M, G, or T, or in megabytes without unit
+
+        :param size: memory size, e.g. 512M, 4G, or 1500
+        :type size: str
+        :return: memory size in bytes
+        :rtype: int
+        """
+
+        size = size.strip().upper().rstrip('B')
+        if len(size) > 0 and size[-1] in MemoryBudget.units.keys():
+            rval = float(size[:-1]) * MemoryBudget.units[size[-1]]
+        else:
+            rval = float(size) * MemoryBudget.units['M']
+        if rval <= 0:
+            raise ValueError('memory size must be positive: {}'.format(size))
+        return int(rval)
+
+    def get_available(self):
+        # the calling process is part of the budget
+        return self.max_memory - self.base
+
+    def get_size(self, in_file):
+        size = os.path.getsize(in_file)
+        if compression.Compression.detect(in_file) is not None:
+            size *= MemoryBudget.compression_ratio
+        return size
+
+    def get_strategy(self, in_file):
+        """ Selects how a file is converted: files whose loaded transcript exceeds a worker's share of the budget are
+        streamed if possible
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :return: 'load' or 'stream'
+        :rtype: str
+        """
+
+        if self.streaming and self.estimate(in_file, 'load') > self.get_available() / self.jobs:
+            return 'stream'
+        return 'load'
+
+    def estimate(self, in_file, strategy='load'):
+        """ Estimates the peak memory of converting a file in a worker process
+
+        :param in_file: path to the exb file
+        :type in_file: str
+        :param strategy: 'load' or 'stream'
+        :type strategy: str (optional, defaults to 'load')
+        :return: estimated peak memory in bytes including the idle process
+        :rtype: int
+        """
+
+        if strategy == 'stream' and self.interpolate:
+            strategy = 'stream-interpolate'
+        return int(self.base + MemoryBudget.factors[strategy] * self.get_size(in_file))
+
+    def fits(self, estimate, in_flight):
+        """ Tells whether a conversion can be started next to the ones in flight; a conversion exceeding the budget on
+        its own is started once nothing else is in flight
+
+        :param estimate: estimated peak memory of the conversion in bytes
+        :type estimate: int
+        :param in_flight: estimated peak memory of each conversion in flight in bytes
+        :type in_flight: list of int
+        :return: true if the conversion can be started
+        :rtype: bool
+        """
+
+        if len(in_flight) >= self.jobs:
+            return False
+        return len(in_flight) == 0 or sum(in_flight) + estimate <= self.get_available()
+
+    # measurement
+
+    @staticmethod
+    def read_status(field):
+        # value of a field of /proc/self/status in bytes, None if not available
+        try:
+            with open('/proc/self/status') as instr:
+                for line in instr:
+                    if line.startswith(field + ':'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    @staticmethod
+    def get_maxrss():
+        if resource is None:
+            return 0
+        # kilobytes on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+    @staticmethod
+    def get_current():
+        rval = MemoryBudget.read_status('VmRSS')
+        return rval if rval is not None else MemoryBudget.get_maxrss()
+
+    @staticmethod
+    def reset_peak():
+        """ Resets the peak memory of the current process to its current memory (Linux only)
+
+        :return: true if the peak has been reset
+        :rtype: bool
+        """
+
+        try:
+            with open('/proc/self/clear_refs', 'w') as outstr:
+                outstr.write('5')
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def get_peak():
+        rval = MemoryBudget.read_status('VmHWM')
+        return rval if rval is not None else MemoryBudget.get_maxrss()
+
+    @staticmethod
+    def measure(function, args):
+        """ Calls a function and returns the peak memory of the process during the call
+
+        Where the peak cannot be reset, the peak since the start of the process is returned, which is still the peak
+        of the call in fresh worker processes.
+
+        :param function: function to be called
+        :type function: function
+        :param args: positional arguments of the function
+        :type args: tuple
+        :return: peak memory in bytes
+        :rtype: int
+        """
+
+        MemoryBudget.reset_peak()
+        function(*args)
+        return MemoryBudget.get_peak()
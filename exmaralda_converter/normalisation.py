@@ -0,0 +1,164 @@
+r""" Normalisation of event contents following the rules of a transcription convention
+
+Rules are read from a tab-separated file with one rule per line, a regular expression and its replacement:
+
+    # pauses, e.g. (.) or (1.5)
+    \(\.\)|\(\d+(\.\d+)?\)
+    # unintelligible speech
+    \(\(unverständlich\)\)	<unk>
+    # annotations in brackets
+    \[[^]]*\]
+
+Lines starting with '#' and empty lines are ignored, a missing replacement deletes the match. All rules are compiled
+into one regular expression, so each content is normalised in a single pass instead of one pass per rule.
+"""
+__author__ = 'zweiss'
+
+import re
+
+
+class Normaliser:
+    """ Applies a set of replacement rules to event contents in a single pass
+
+    At each position of a content, the first rule (in file order) matching there is applied, and the search continues
+    after its match. Patterns may contain groups but no backreferences or named groups, replacements are inserted
+    literally. Inline flags at the start of a pattern, e.g. (?i), only apply to their rule. After all replacements,
+    white space is collapsed to single spaces and stripped.
+
+    Attributes
+    ----------
+    rules: list of tuples
+        pattern and replacement of each rule
+    pattern: re.Pattern
+        combined pattern of all rules
+
+    Methods
+    -------
+    load(rule_file):
+        Reads the rules of a rule file
+    normalise(content):
+        Normalises a content
+    """
+
+    whitespace = re.compile(r'\s+')
+    # inline flags at the start of a pattern, which apply to the whole pattern
+    global_flags = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+    def __init__(self, rules):
+        """
+        :param rules: pattern and replacement of each rule
+        :type rules: list of tuples
+        """
+
+        self.rules = list(rules)
+        alternatives = []
+        for i, (pattern, replacement) in enumerate(self.rules):
+            try:
+                compiled = re.compile(pattern)
+            except re.error as err:
+                raise ValueError('invalid pattern of rule {} "{}": {}'.format(i + 1, pattern, err))
+            if len(compiled.groupindex) > 0:
+                raise ValueError('pattern of rule {} "{}" contains named groups'.format(i + 1, pattern))
+            if Normaliser.has_backreference(pattern):
+                raise ValueError('pattern of rule {} "{}" contains backreferences'.format(i + 1, pattern))
+            alternatives.append(Normaliser.scope_flags(pattern))
+        # each rule becomes a named alternative, the name of the matching alternative selects the replacement
+        self.replacements = {'r{}'.format(i): replacement for i, (pattern, replacement) in enumerate(self.rules)}
+        self.pattern = None
+        if len(self.rules) > 0:
+            try:
+                self.pattern = re.compile('|'.join('(?P<r{}>{})'.format(i, pattern)
+                                                   for i, pattern in enumerate(alternatives)))
+            except re.error as err:
+                raise ValueError('rules cannot be combined: {}'.format(err))
+
+    def __len__(self):
+        return len(self.rules)
+
+    @staticmethod
+    def scope_flags(pattern):
+        """ Turns inline flags at the start of a pattern into flags of a group, e.g. (?i)x into (?i:x), so that they
+        still apply to the pattern only once it is part of the combined pattern
+
+        :param pattern: regular expression
+        :type pattern: str
+        :return: regular expression without global flags
+        :rtype: str
+        """
+
+        flags = ''
+        match = Normaliser.global_flags.match(pattern)
+        while match is not None:
+            flags += match.group(1)
+            pattern = pattern[match.end():]
+            match = Normaliser.global_flags.match(pattern)
+        if len(flags) == 0:
+            return pattern
+        # the group is closed on a new line, so that a comment of a verbose pattern does not swallow it
+        return '(?{}:{}{})'.format(flags, pattern, '\n' if 'x' in flags else '')
+
+    @staticmethod
+    def has_backreference(pattern):
+        """ Tells whether a pattern refers to a group, by number (e.g. \\1), by name, or in a conditional
+
+        :param pattern: regular expression
+        :type pattern: str
+        :return: true if the pattern contains a backreference
+        :rtype: bool
+        """
+
+        i = 0
+        in_class = False
+        while i < len(pattern):
+            c = pattern[i]
+            if c == '\\':
+                if not in_class and i + 1 < len(pattern) and pattern[i + 1] in '123456789':
+                    return True
+                i += 2
+                continue
+            if in_class:
+                in_class = c != ']'
+            elif c == '[':
+                in_class = True
+                # a closing bracket right after the opening one (or its negation) is a literal
+                i += 2 if pattern.startswith('^]', i + 1) else 1 if pattern.startswith(']', i + 1) else 0
+            elif pattern.startswith('(?P=', i) or pattern.startswith('(?(', i):
+                return True
+            i += 1
+        return False
+
+    def replace(self, match):
+        return self.replacements[match.lastgroup]
+
+    def normalise(self, content):
+        """ Normalises a content
+
+        :param content: raw event content
+        :type content: str
+        :return: normalised content
+        :rtype: str
+        """
+
+        if self.pattern is not None:
+            content = self.pattern.sub(self.replace, content)
+        return Normaliser.whitespace.sub(' ', content).strip()
+
+    @staticmethod
+    def load(rule_file):
+        """ Reads the rules of a rule file
+
+        :param rule_file: path to the tab-separated rule file
+        :type rule_file: str
+        :return: normaliser applying the rules
+        :rtype: Normaliser
+        """
+
+        rules = []
+        with open(rule_file, encoding='UTF-8') as instr:
+            for line in instr:
+                line = line.rstrip('\r\n')
+                if len(line.strip()) == 0 or line.lstrip().startswith('#'):
+                    continue
+                pattern, _, replacement = line.partition('\t')
+                rules.append((pattern, replacement))
+        return Normaliser(rules)
@@ -0,0 +1,217 @@
+""" Detection of overlapping speech across the speakers of Exmaralda transcripts
+
+All events of the selected tiers are turned into start and end points and swept in temporal order, so finding the
+overlaps of n events takes O(n log n) rather than comparing every pair of events.
+"""
+__author__ = 'zweiss'
+
+import json
+from exmaralda_converter import generalhelper
+
+
+class OverlapReport:
+    """ Collects the overlapping speech of a transcript or of a whole corpus
+
+    Within a transcript, speakers are told apart by their id, so that two speakers sharing an abbreviation are not
+    merged. Aggregated reports sum up the speakers by their abbreviation (or their id if they have none), so that the
+    totals of speakers with the same role, e.g. the teacher, are combined across transcripts.
+
+    Attributes
+    ----------
+    file: str
+        path of the analysed file or empty string for aggregated reports
+    segments: list of tuples
+        start and end in seconds and the sorted keys of the speakers of each maximal stretch of overlapping speech
+    speaking: dict
+        seconds each speaker speaks, by speaker key (speaker id, or label for aggregated reports)
+    overlapping: dict
+        seconds each speaker speaks while another speaker speaks, by speaker key
+    labels: dict
+        label used to aggregate each speaker, by speaker key
+    segment_count: int
+        number of overlap segments, also of aggregated reports
+    overlap_time: float
+        total duration of all overlap segments in seconds
+
+    Methods
+    -------
+    from_transcript(transcript, file='', filters=None):
+        Finds the overlapping speech of a transcript
+    aggregate(reports):
+        Sums up the per-speaker totals of many reports
+    get_overlap_time():
+        Returns the total duration of all overlap segments
+    to_dict():
+        Creates a dictionary representation of the report
+    """
+
+    segment_header = 'Start\tEnd\tDuration\tSpeakers\n'
+    totals_header = 'File\tSpeaker\tSpeaking\tOverlapping\tShare\n'
+
+    def __init__(self, file=''):
+        """
+        :param file: path of the analysed file
+        :type file: str (optional, defaults to '')
+        """
+
+        self.file = file
+        self.segments = []
+        self.speaking = {}
+        self.overlapping = {}
+        self.labels = {}
+        self.segment_count = 0
+        self.overlap_time = 0.0
+
+    def __len__(self):
+        return self.segment_count
+
+    def get_overlap_time(self):
+        return self.overlap_time
+
+    def add_interval(self, start, end, speakers):
+        """ Records a stretch of time in which the given speakers speak, merging it with the preceding overlap segment
+        if the same speakers continue to overlap
+
+        :param start: start in seconds
+        :type start: float
+        :param end: end in seconds
+        :type end: float
+        :param speakers: sorted keys of the speakers speaking throughout the interval
+        :type speakers: tuple of str
+        """
+
+        duration = end - start
+        for speaker in speakers:
+            self.speaking[speaker] = self.speaking.get(speaker, 0.0) + duration
+        if len(speakers) < 2:
+            return
+        for speaker in speakers:
+            self.overlapping[speaker] = self.overlapping.get(speaker, 0.0) + duration
+        self.overlap_time += duration
+        if len(self.segments) > 0 and self.segments[-1][1] == start and self.segments[-1][2] == speakers:
+            self.segments[-1] = (self.segments[-1][0], end, speakers)
+        else:
+            self.segments.append((start, end, speakers))
+            self.segment_count += 1
+
+    @staticmethod
+    def from_transcript(transcript, file='', filters=None):
+        """ Finds the overlapping speech of a transcript with a single sweep over the events of its speaker tiers
+
+        Several tiers of the same speaker do not overlap with each other. Events without resolvable times and events
+        that do not last are ignored; events merely touching each other do not overlap.
+
+        :param transcript: transcript to be analysed
+        :type transcript: ExmaraldaTranscript
+        :param file: path of the file the transcript has been loaded from
+        :type file: str (optional, defaults to '')
+        :param filters: selects the tiers to be analysed, see GeneralHelper.select_tiers
+        :type filters: dict (optional, defaults to the verbal tiers, i.e. {'categories': ['v']})
+        :return: report of the overlapping speech
+        :rtype: OverlapReport
+        """
+
+        rval = OverlapReport(file)
+        filters = {'categories': ['v']} if filters is None else filters
+
+        # start (1) and end (-1) points of all events; ends sort before starts at the same time
+        points = []
+        for tid in generalhelper.GeneralHelper.select_tiers(transcript, filters):
+            tier = transcript.tiers[tid]
+            if tier.speaker not in transcript.speaker_table:
+                continue
+            speaker = transcript.speaker_table[tier.speaker]
+            rval.labels[speaker.speaker_id] = speaker.abbreviation if len(speaker.abbreviation) > 0 \
+                else speaker.speaker_id
+            for e in tier.event_list:
+                start = transcript.timeline.get(e.start.time_id)
+                end = transcript.timeline.get(e.end.time_id)
+                start = start.get_seconds() if start is not None else None
+                end = end.get_seconds() if end is not None else None
+                if start is None or end is None or end <= start:
+                    continue
+                points.append((start, 1, speaker.speaker_id))
+                points.append((end, -1, speaker.speaker_id))
+        points.sort()
+
+        # number of events of each speaker going on at the current point of the sweep
+        active = {}
+        previous = None
+        for time, change, sid in points:
+            if previous is not None and time > previous and len(active) > 0:
+                rval.add_interval(previous, time, tuple(sorted(active)))
+            active[sid] = active.get(sid, 0) + change
+            if active[sid] == 0:
+                del active[sid]
+            previous = time
+        return rval
+
+    @staticmethod
+    def aggregate(reports):
+        """ Sums up the per-speaker totals of many reports, e.g. of all transcripts of a corpus
+
+        The speakers of the reports are summed up by their label. The segments of the reports are not kept, only their
+        number and total duration.
+
+        :param reports: reports to be aggregated
+        :type reports: iterable of OverlapReport
+        :return: aggregated report without file and segments
+        :rtype: OverlapReport
+        """
+
+        rval = OverlapReport()
+        for report in reports:
+            for speaker, seconds in report.speaking.items():
+                label = report.labels.get(speaker, speaker)
+                rval.labels[label] = label
+                rval.speaking[label] = rval.speaking.get(label, 0.0) + seconds
+            for speaker, seconds in report.overlapping.items():
+                label = report.labels.get(speaker, speaker)
+                rval.overlapping[label] = rval.overlapping.get(label, 0.0) + seconds
+            rval.segment_count += report.segment_count
+            rval.overlap_time += report.overlap_time
+        return rval
+
+    # output
+
+    def get_segment_rows(self):
+        """ Creates the data table of the overlap segments
+
+        :return: header and one row per segment, speakers are separated by '_'
+        :rtype: str
+        """
+
+        return OverlapReport.segment_header + ''.join(
+            '{}\t{}\t{}\t{}\n'.format(round(start, 6), round(end, 6), round(end - start, 6), '_'.join(speakers))
+            for start, end, speakers in self.segments)
+
+    def get_total_rows(self, file=None):
+        """ Creates the rows of the per-speaker totals, without header
+
+        :param file: value of the File column
+        :type file: str (optional, defaults to the file of the report)
+        :return: one row per speaker with the seconds spoken, spoken in overlap, and the share of the latter
+        :rtype: str
+        """
+
+        file = self.file if file is None else file
+        return ''.join('{}\t{}\t{}\t{}\t{}\n'.format(
+            file, speaker, round(seconds, 6), round(self.overlapping.get(speaker, 0.0), 6),
+            round(self.overlapping.get(speaker, 0.0) / seconds, 6)) for speaker, seconds in sorted(self.speaking.items()))
+
+    def to_dict(self):
+        """ Creates a dictionary representation of the report
+
+        :return: file name, number and total duration of segments, speaker labels, per-speaker totals, and segments
+        :rtype: dict
+        """
+
+        return {'file': self.file, 'segments': self.segment_count, 'overlap_time': round(self.overlap_time, 6),
+                'labels': dict(self.labels),
+                'speaking': {speaker: round(seconds, 6) for speaker, seconds in self.speaking.items()},
+                'overlapping': {speaker: round(seconds, 6) for speaker, seconds in self.overlapping.items()},
+                'overlap_segments': [{'start': start, 'end': end, 'speakers': list(speakers)}
+                                     for start, end, speakers in self.segments]}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False)
@@ -0,0 +1,232 @@
+""" Long-running conversion service answering json-lines requests with a pool of warm worker processes
+
+Each request is a json object on a single line:
+
+    {"id": 1, "path": "/data/lesson1.exb", "format": "tsv", "filters": {"categories": ["v"]}}
+    {"id": 2, "exb": "<?xml version=...", "format": "tsv"}
+    {"id": 3, "exb_base64": "H4sIAAAA...", "interpolate": true}
+
+The exb content is given either as a path, as inline xml text ("exb"), or as base64 encoded (and possibly compressed)
+bytes ("exb_base64"). Each response is a json object on a single line with the id of its request:
+
+    {"id": 1, "ok": true, "format": "tsv", "result": "Tier-ID\tType...", "elapsed_ms": 3.1}
+    {"id": 2, "ok": false, "error": {"type": "ParseError", "message": "..."}, "elapsed_ms": 0.4}
+
+Responses are written as soon as their conversion has finished, so they may arrive in a different order than the
+requests. Each client has at most a fixed number of requests in flight; further requests are only read once earlier
+ones have been answered.
+"""
+__author__ = 'zweiss'
+
+import base64
+import io
+import json
+import multiprocessing
+import os
+import socketserver
+import sys
+import threading
+import time
+from exmaralda_converter import compression
+from exmaralda_converter import conversion
+
+
+class ConversionService:
+    """ Converts exb content sent as json-lines requests with a pool of worker processes
+
+    Attributes
+    ----------
+    jobs: int
+        number of worker processes
+    max_pending: int
+        maximum number of requests of a single client that are converted or waiting to be converted at a time
+
+    Methods
+    -------
+    process_request(line):
+        Converts the exb content of a single request and creates the response
+    serve_stream(instr, outstr):
+        Answers all requests read from a stream
+    serve_socket(socket_path):
+        Answers requests of all clients connecting to a unix domain socket until interrupted
+    """
+
+    def __init__(self, jobs=1, max_pending=None):
+        """
+        :param jobs: number of worker processes
+        :type jobs: int (optional, defaults to 1)
+        :param max_pending: maximum number of requests of a single client in flight
+        :type max_pending: int (optional, defaults to twice the number of jobs)
+        """
+
+        self.jobs = jobs
+        self.max_pending = max_pending if max_pending is not None else 2 * jobs
+        self.pool = None
+
+    def __enter__(self):
+        self.pool = multiprocessing.Pool(self.jobs)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = None
+
+    # request handling
+
+    @staticmethod
+    def open_exb(request):
+        """ Opens the exb content of a request as binary stream
+
+        :param request: the decoded request
+        :type request: dict
+        :return: binary stream of the exb content
+        :rtype: file object
+        """
+
+        if 'path' in request:
+            return compression.Compression.open_input(request['path'])
+        if 'exb' in request:
+            return io.BytesIO(request['exb'].encode('UTF-8'))
+        if 'exb_base64' in request:
+            return compression.Compression.open_bytes(base64.b64decode(request['exb_base64']))
+        raise ValueError('request contains neither "path" nor "exb" nor "exb_base64"')
+
+    @staticmethod
+    def convert(request):
+        """ Converts the exb content of a decoded request
+
+        :param request: the decoded request
+        :type request: dict
+        :return: the converted content
+        :rtype: str
+        """
+
+        with ConversionService.open_exb(request) as instr:
+            return conversion.convert(instr, request.get('format', 'tsv'), request.get('filters'),
+                                      request.get('interpolate', False))
+
+    @staticmethod
+    def process_request(line):
+        """ Converts the exb content of a single request and creates the response
+
+        Every error is reported in the response rather than raised, so a broken request never stops the service.
+
+        :param line: json encoded request
+        :type line: str
+        :return: json encoded response (without line break)
+        :rtype: str
+        """
+
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('request is not a json object')
+            request_id = request.get('id')
+            response = {'id': request_id, 'ok': True, 'format': request.get('format', 'tsv'),
+                        'result': ConversionService.convert(request)}
+        except Exception as err:
+            response = {'id': request_id, 'ok': False, 'error': {'type': type(err).__name__, 'message': str(err)}}
+        response['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return json.dumps(response, ensure_ascii=False)
+
+    # serving
+
+    def serve_stream(self, instr, outstr):
+        """ Answers all requests read from a stream, writing each response as soon as it is ready
+
+        At most max_pending requests are in flight, the next request is only read once a response has been written. If
+        the client goes away (e.g. a socket is closed before its responses have been written), no further requests are
+        read and the remaining responses are dropped.
+
+        :param instr: text stream with one json request per line
+        :type instr: file object
+        :param outstr: text stream the json responses are written to
+        :type outstr: file object
+        """
+
+        lock = threading.Lock()
+        slots = threading.BoundedSemaphore(self.max_pending)
+        closed = threading.Event()
+
+        def respond(response):
+            # runs on the result thread of the pool, which serves all clients and must not be stopped by an error
+            try:
+                with lock:
+                    if not closed.is_set():
+                        outstr.write(response + '\n')
+                        outstr.flush()
+            except (OSError, ValueError):
+                # the client has disconnected or the stream has been closed
+                closed.set()
+            finally:
+                slots.release()
+
+        def respond_error(err):
+            respond(json.dumps({'id': None, 'ok': False, 'error': {'type': type(err).__name__, 'message': str(err)}}))
+
+        pending = []
+        try:
+            for line in instr:
+                if len(line.strip()) == 0:
+                    continue
+                slots.acquire()
+                if closed.is_set():
+                    slots.release()
+                    break
+                pending.append(self.pool.apply_async(ConversionService.process_request, (line,),
+                                                     callback=respond, error_callback=respond_error))
+                # forget finished requests so that long sessions do not accumulate results
+                pending = [result for result in pending if not result.ready()]
+        except OSError:
+            closed.set()
+        if not closed.is_set():
+            for result in pending:
+                result.wait()
+
+    def serve_socket(self, socket_path):
+        """ Answers requests of all clients connecting to a unix domain socket until interrupted
+
+        Every connection is served like a stream of requests.
+
+        :param socket_path: path of the socket, an existing socket file is replaced
+        :type socket_path: str
+        """
+
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                service.serve_stream(io.TextIOWrapper(self.rfile, encoding='UTF-8'),
+                                     io.TextIOWrapper(self.wfile, encoding='UTF-8', write_through=True))
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(socket_path)
+
+    @staticmethod
+    def run(jobs=1, socket_path=None, max_pending=None):
+        """ Starts the service on stdin and stdout or on a unix domain socket
+
+        :param jobs: number of worker processes
+        :type jobs: int (optional, defaults to 1)
+        :param socket_path: path of the unix domain socket or None to serve stdin and stdout
+        :type socket_path: str (optional, defaults to None)
+        :param max_pending: maximum number of requests of a single client in flight
+        :type max_pending: int (optional, defaults to twice the number of jobs)
+        """
+
+        with ConversionService(jobs, max_pending) as service:
+            if socket_path is None:
+                service.serve_stream(sys.stdin, sys.stdout)
+            else:
+                service.serve_socket(socket_path)
@@ -0,0 +1,256 @@
+""" Export of Exmaralda transcripts into an indexed SQLite corpus database
+
+The database stores one row per transcript, speaker, tier, time point, and event in normalised tables so that
+corpus queries (e.g., all non-verbal events of L2 speakers within a time window) can be answered via indexes rather
+than by scanning the TSV dumps.
+"""
+__author__ = 'zweiss'
+
+import sqlite3
+from exmaralda_converter import exmaralda
+
+
+class SQLiteDump:
+
+    schema = """
+    CREATE TABLE IF NOT EXISTS transcripts (
+        transcript_id INTEGER PRIMARY KEY,
+        file TEXT NOT NULL UNIQUE,
+        project_name TEXT,
+        transcription_name TEXT,
+        transcription_convention TEXT,
+        comment TEXT
+    );
+    CREATE TABLE IF NOT EXISTS speakers (
+        speaker_key INTEGER PRIMARY KEY,
+        transcript_id INTEGER NOT NULL REFERENCES transcripts(transcript_id),
+        speaker_id TEXT NOT NULL,
+        abbreviation TEXT,
+        sex TEXT,
+        l1 TEXT,
+        l2 TEXT,
+        languages_used TEXT
+    );
+    CREATE TABLE IF NOT EXISTS tiers (
+        tier_key INTEGER PRIMARY KEY,
+        transcript_id INTEGER NOT NULL REFERENCES transcripts(transcript_id),
+        tier_id TEXT NOT NULL,
+        speaker_key INTEGER REFERENCES speakers(speaker_key),
+        category TEXT,
+        type TEXT,
+        display_name TEXT
+    );
+    CREATE TABLE IF NOT EXISTS timeline (
+        transcript_id INTEGER NOT NULL REFERENCES transcripts(transcript_id),
+        time_id TEXT NOT NULL,
+        time_stamp REAL,
+        PRIMARY KEY (transcript_id, time_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS events (
+        event_key INTEGER PRIMARY KEY,
+        transcript_id INTEGER NOT NULL REFERENCES transcripts(transcript_id),
+        tier_key INTEGER NOT NULL REFERENCES tiers(tier_key),
+        start_id TEXT,
+        end_id TEXT,
+        start REAL,
+        end REAL,
+        content TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_speakers_transcript ON speakers(transcript_id, speaker_id);
+    CREATE INDEX IF NOT EXISTS idx_speakers_l2 ON speakers(l2);
+    CREATE INDEX IF NOT EXISTS idx_tiers_transcript ON tiers(transcript_id, tier_id);
+    CREATE INDEX IF NOT EXISTS idx_tiers_speaker ON tiers(speaker_key);
+    CREATE INDEX IF NOT EXISTS idx_tiers_category ON tiers(category, speaker_key);
+    CREATE INDEX IF NOT EXISTS idx_events_tier_start ON events(tier_key, start);
+    CREATE INDEX IF NOT EXISTS idx_events_start ON events(start);
+    CREATE INDEX IF NOT EXISTS idx_events_transcript_start ON events(transcript_id, start_id);
+    CREATE INDEX IF NOT EXISTS idx_events_transcript_end ON events(transcript_id, end_id);
+    """
+
+    @staticmethod
+    def connect(db_file):
+        """ Opens (and if necessary creates) a corpus database
+
+        :param db_file: path to the SQLite database file
+        :type db_file: str
+        :return: connection to the database with the corpus schema in place
+        :rtype: sqlite3.Connection
+        """
+
+        connection = sqlite3.connect(db_file)
+        connection.executescript(SQLiteDump.schema)
+        return connection
+
+    @staticmethod
+    def delete_transcript(connection, file_name):
+        """ Removes all rows belonging to a previously inserted transcript
+
+        :param connection: connection to the corpus database
+        :type connection: sqlite3.Connection
+        :param file_name: name of the file the transcript has been loaded from
+        :type file_name: str
+        """
+
+        row = connection.execute('SELECT transcript_id FROM transcripts WHERE file = ?', (file_name,)).fetchone()
+        if row is None:
+            return
+        for table in ['events', 'timeline', 'tiers', 'speakers', 'transcripts']:
+            connection.execute('DELETE FROM {} WHERE transcript_id = ?'.format(table), row)
+
+    @staticmethod
+    def insert_transcript(connection, transcript, file_name):
+        """ Inserts a transcript into the corpus database using bulk inserts within a single transaction
+
+        A transcript that has already been inserted under the same file name is replaced.
+
+        :param connection: connection to the corpus database
+        :type connection: sqlite3.Connection
+        :param transcript: transcript to be inserted
+        :type transcript: ExmaraldaTranscript
+        :param file_name: name of the file the transcript has been loaded from
+        :type file_name: str
+        :return: id of the transcript in the database
+        :rtype: int
+        """
+
+        with connection:
+            SQLiteDump.delete_transcript(connection, file_name)
+            cursor = connection.execute(
+                'INSERT INTO transcripts (file, project_name, transcription_name, transcription_convention, comment) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (file_name, transcript.get_project_name(), transcript.get_transcription_name(),
+                 transcript.get_transcription_convention(), transcript.get_comment()))
+            transcript_id = cursor.lastrowid
+
+            # speakers
+            speaker_keys = {}
+            for sid, speaker in transcript.speaker_table.items():
+                cursor = connection.execute(
+                    'INSERT INTO speakers (transcript_id, speaker_id, abbreviation, sex, l1, l2, languages_used) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (transcript_id, sid, speaker.abbreviation, speaker.sex, '_'.join(speaker.l1) or None,
+                     '_'.join(speaker.l2) or None, '_'.join(speaker.languages_used) or None))
+                speaker_keys[sid] = cursor.lastrowid
+
+            # timeline
+            times = {tid: tp.get_seconds() for tid, tp in transcript.timeline.items()}
+            connection.executemany('INSERT OR REPLACE INTO timeline (transcript_id, time_id, time_stamp) VALUES (?, ?, ?)',
+                                   [(transcript_id, tid, time) for tid, time in times.items()])
+
+            # tiers and events
+            for tid, tier in transcript.tiers.items():
+                cursor = connection.execute(
+                    'INSERT INTO tiers (transcript_id, tier_id, speaker_key, category, type, display_name) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (transcript_id, tid, speaker_keys.get(tier.speaker), tier.category, tier.type, tier.display_name))
+                tier_key = cursor.lastrowid
+                connection.executemany(
+                    'INSERT INTO events (transcript_id, tier_key, start_id, end_id, start, end, content) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(transcript_id, tier_key, e.start.time_id, e.end.time_id, times.get(e.start.time_id),
+                      times.get(e.end.time_id), e.content) for e in tier.event_list])
+        return transcript_id
+
+    @staticmethod
+    def apply_changes(connection, file_name, changes):
+        """ Updates a previously inserted transcript with the changes to a new version of it in a single transaction
+
+        :param connection: connection to the corpus database
+        :type connection: sqlite3.Connection
+        :param file_name: name of the file the transcript has been loaded from
+        :type file_name: str
+        :param changes: changes between the inserted and the new version of the transcript
+        :type changes: ChangeSet
+        """
+
+        with connection:
+            row = connection.execute('SELECT transcript_id FROM transcripts WHERE file = ?', (file_name,)).fetchone()
+            if row is None:
+                raise ValueError('transcript not in database: {}'.format(file_name))
+            transcript_id = row[0]
+
+            # speakers
+            for sid in changes.speakers['removed']:
+                connection.execute('UPDATE tiers SET speaker_key = NULL WHERE speaker_key IN '
+                                   '(SELECT speaker_key FROM speakers WHERE transcript_id = ? AND speaker_id = ?)',
+                                   (transcript_id, sid))
+                connection.execute('DELETE FROM speakers WHERE transcript_id = ? AND speaker_id = ?', (transcript_id, sid))
+            connection.executemany(
+                'UPDATE speakers SET abbreviation = ?, sex = ?, l1 = ?, l2 = ?, languages_used = ? '
+                'WHERE transcript_id = ? AND speaker_id = ?',
+                [(speaker.abbreviation, speaker.sex, '_'.join(speaker.l1) or None, '_'.join(speaker.l2) or None,
+                  '_'.join(speaker.languages_used) or None, transcript_id, sid)
+                 for sid, speaker in changes.speakers['modified'].items()])
+            connection.executemany(
+                'INSERT INTO speakers (transcript_id, speaker_id, abbreviation, sex, l1, l2, languages_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(transcript_id, sid, speaker.abbreviation, speaker.sex, '_'.join(speaker.l1) or None,
+                  '_'.join(speaker.l2) or None, '_'.join(speaker.languages_used) or None)
+                 for sid, speaker in changes.speakers['added'].items()])
+            speaker_keys = dict(connection.execute('SELECT speaker_id, speaker_key FROM speakers WHERE transcript_id = ?',
+                                                   (transcript_id,)).fetchall())
+
+            # timeline
+            connection.executemany('DELETE FROM timeline WHERE transcript_id = ? AND time_id = ?',
+                                   [(transcript_id, tid) for tid in changes.timeline['removed']])
+            changed_times = {tid: exmaralda.Timepoint(time_stamp=time_stamp).get_seconds() for tid, (time_stamp, type)
+                             in list(changes.timeline['added'].items()) + list(changes.timeline['modified'].items())}
+            connection.executemany('INSERT OR REPLACE INTO timeline (transcript_id, time_id, time_stamp) VALUES (?, ?, ?)',
+                                   [(transcript_id, tid, time) for tid, time in changed_times.items()])
+            for column in ['start', 'end']:
+                connection.executemany('UPDATE events SET {0} = ? WHERE transcript_id = ? AND {0}_id = ?'.format(column),
+                                       [(time, transcript_id, tid) for tid, time in changed_times.items()])
+
+            # tiers
+            for tid in changes.tiers['removed']:
+                connection.execute('DELETE FROM events WHERE tier_key IN '
+                                   '(SELECT tier_key FROM tiers WHERE transcript_id = ? AND tier_id = ?)', (transcript_id, tid))
+                connection.execute('DELETE FROM tiers WHERE transcript_id = ? AND tier_id = ?', (transcript_id, tid))
+            connection.executemany(
+                'UPDATE tiers SET speaker_key = ?, category = ?, type = ?, display_name = ? '
+                'WHERE transcript_id = ? AND tier_id = ?',
+                [(speaker_keys.get(speaker), category, type, display_name, transcript_id, tid)
+                 for tid, (speaker, category, type, display_name) in changes.tiers['modified'].items()])
+            connection.executemany(
+                'INSERT INTO tiers (transcript_id, tier_id, speaker_key, category, type, display_name) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(transcript_id, tid, speaker_keys.get(speaker), category, type, display_name)
+                 for tid, (speaker, category, type, display_name) in changes.tiers['added'].items()])
+            tier_keys = dict(connection.execute('SELECT tier_id, tier_key FROM tiers WHERE transcript_id = ?',
+                                                (transcript_id,)).fetchall())
+
+            # events
+            connection.executemany('DELETE FROM events WHERE tier_key = ? AND start_id = ? AND end_id = ?',
+                                   [(tier_keys[tid], start, end) for tid, start, end in changes.events['removed']])
+            connection.executemany('UPDATE events SET content = ? WHERE tier_key = ? AND start_id = ? AND end_id = ?',
+                                   [(content, tier_keys[tid], start, end)
+                                    for tid, start, end, content in changes.events['modified']])
+            connection.executemany(
+                'INSERT INTO events (transcript_id, tier_key, start_id, end_id, start, end, content) '
+                'SELECT ?, ?, ?, ?, '
+                '(SELECT time_stamp FROM timeline WHERE transcript_id = ? AND time_id = ?), '
+                '(SELECT time_stamp FROM timeline WHERE transcript_id = ? AND time_id = ?), ?',
+                [(transcript_id, tier_keys[tid], start, end, transcript_id, start, transcript_id, end, content)
+                 for tid, start, end, content in changes.events['added']])
+
+    @staticmethod
+    def generate_cold_data_db(in_files, db_file, interpolate=False):
+        """ Loads exb files and writes them into a corpus database, committing one transaction per file
+
+        :param in_files: paths to the exb files
+        :type in_files: list of str
+        :param db_file: path to the SQLite database file
+        :type db_file: str
+        :param interpolate: true if time points that are not anchored in time should be interpolated
+        :type interpolate: bool (optional, defaults to False)
+        """
+
+        connection = SQLiteDump.connect(db_file)
+        try:
+            for in_file in in_files:
+                transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+                if interpolate:
+                    transcript.normalise_timeline()
+                SQLiteDump.insert_transcript(connection, transcript, in_file)
+        finally:
+            connection.close()
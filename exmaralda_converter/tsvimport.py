@@ -0,0 +1,217 @@
+""" Import of tsv data dumps back into Exmaralda exb files
+
+Reads the tsv files written by the converter, possibly extended by further tiers (e.g., of automatic annotators), or
+corpus-level tables holding the rows of many transcripts with an additional 'File' column, and rebuilds one
+transcript per file that can be opened with the Partitur editor.
+"""
+__author__ = 'zweiss'
+
+import io
+import os
+from exmaralda_converter import compression
+from exmaralda_converter import exmaralda
+from exmaralda_converter import generalhelper
+
+
+class TSVImport:
+    """ Rebuilds Exmaralda transcripts from tsv data dumps
+
+    Methods
+    -------
+    check_header(header):
+        Finds out why a header is not in the format of the converter output
+    read_transcripts(in_file, transcripts=None, time_points=None):
+        Reads the transcripts of a tsv file in a single pass over its rows
+    import_files(in_files, out_dir, compress=None):
+        Rebuilds the transcripts of many tsv files and writes them as exb files
+    """
+
+    # column holding the name of the transcript in corpus-level tables
+    file_column = 'File'
+    columns = generalhelper.TSVDump.header.rstrip('\n').split('\t')
+    # columns of the token output, whose rows are tokens rather than events
+    token_columns = ['Event', 'Token', 'Char-Start', 'Char-End', 'Token-Start', 'Token-End']
+
+    @staticmethod
+    def get_name(in_file):
+        # name of a transcript without directory and file endings, e.g. 'lesson1' for 'data/lesson1.tsv.gz'
+        name = os.path.basename(compression.Compression.strip_extension(in_file))
+        return os.path.splitext(name)[0] if name.endswith('.tsv') or name.endswith('.exb') else name
+
+    @staticmethod
+    def get_value(value):
+        return '' if value == 'NA' else value
+
+    @staticmethod
+    def get_time_point(time_points, time_stamp):
+        """ Returns the time point of a time stamp, creating it if necessary
+
+        Time stamps denoting the same time share one time point. Missing time stamps ('NA') cannot be matched to each
+        other, so each of them gets a time point of its own. Time points are numbered by their creation, so their ids
+        do not depend on the running ids of other time points in the process.
+
+        :param time_points: time points of the transcript by their time
+        :type time_points: dict
+        :param time_stamp: time stamp in the tsv file
+        :type time_stamp: str
+        :return: time point
+        :rtype: Timepoint
+        """
+
+        if time_stamp == 'NA':
+            key = ('NA', len(time_points))
+        else:
+            try:
+                key = float(time_stamp)
+            except ValueError:
+                key = time_stamp
+        if key not in time_points:
+            tp = exmaralda.Timepoint(time_stamp=-1 if time_stamp == 'NA' else time_stamp)
+            tp.set_time_id(str(len(time_points)))
+            time_points[key] = tp
+        return time_points[key]
+
+    @staticmethod
+    def read_header(in_file):
+        with io.TextIOWrapper(compression.Compression.open_input(in_file), encoding='UTF-8', newline='\n') as instr:
+            return instr.readline().rstrip('\r\n').split('\t')
+
+    @staticmethod
+    def check_header(header):
+        """ Finds out why a header is not in the format of the converter output
+
+        :param header: column names
+        :type header: list of str
+        :return: description of the problem or None if the header can be imported
+        :rtype: str
+        """
+
+        missing = [column for column in TSVImport.columns if column not in header]
+        if len(missing) > 0:
+            return 'missing column(s) {}'.format(', '.join(missing))
+        if header[-1] != 'String':
+            return '"String" has to be the last column'
+        if any(column in header for column in TSVImport.token_columns):
+            return 'token tables cannot be imported'
+        return None
+
+    @staticmethod
+    def read_transcripts(in_file, transcripts=None, time_points=None):
+        """ Reads the transcripts of a tsv file in a single pass over its rows
+
+        The rows of each transcript are grouped by their tier, speakers and tiers are created when they are first
+        seen. Without a 'File' column, all rows belong to one transcript named after the tsv file. The trailing space
+        the converter appends to verbal events ending in '.', '!', or '?' is removed again. Event contents must not
+        contain line breaks.
+
+        :param in_file: path to the (possibly compressed) tsv file
+        :type in_file: str
+        :param transcripts: transcripts by their names, extended by the transcripts of the file
+        :type transcripts: dict (optional, defaults to None)
+        :param time_points: time points of each transcript by their time, extended by the time points of the file
+        :type time_points: dict (optional, defaults to None)
+        :return: transcripts by their names and the time points of each transcript by their time
+        :rtype: tuple of dicts
+        """
+
+        transcripts = {} if transcripts is None else transcripts
+        time_points = {} if time_points is None else time_points
+        default_name = TSVImport.get_name(in_file)
+        with io.TextIOWrapper(compression.Compression.open_input(in_file), encoding='UTF-8', newline='\n') as instr:
+            header = instr.readline().rstrip('\r\n').split('\t')
+            problem = TSVImport.check_header(header)
+            if problem is not None:
+                raise ValueError('{}: {}'.format(in_file, problem))
+            index = {column: i for i, column in enumerate(header)}
+            file_index = index.get(TSVImport.file_column)
+
+            for line_number, line in enumerate(instr, 2):
+                line = line.rstrip('\r\n')
+                if len(line) == 0:
+                    continue
+                # the content may contain tabs, everything after the last regular column belongs to it
+                row = line.split('\t', len(header) - 1)
+                if len(row) < len(header):
+                    raise ValueError('{}, line {}: expected {} columns, found {}'.format(
+                        in_file, line_number, len(header), len(row)))
+                name = TSVImport.get_name(row[file_index]) if file_index is not None else default_name
+                if name not in transcripts:
+                    transcripts[name] = exmaralda.ExmaraldaTranscript(transcription_name=name)
+                transcript = transcripts[name]
+                points = time_points.setdefault(name, {})
+
+                sid = TSVImport.get_value(row[index['Speaker-ID']])
+                if len(sid) > 0 and not transcript.contains_speaker(sid):
+                    transcript.add_speaker(speaker_id=sid,
+                                           abbreviation=TSVImport.get_value(row[index['Abbreviation']]),
+                                           sex=TSVImport.get_value(row[index['Sex']]),
+                                           languages_used=[lang for lang in row[index['Languages Used']].split('_')
+                                                           if lang not in ['', 'NA']],
+                                           l1=[lang for lang in row[index['L1']].split('_') if lang not in ['', 'NA']],
+                                           l2=[lang for lang in row[index['L2']].split('_') if lang not in ['', 'NA']])
+                tid = row[index['Tier-ID']]
+                category = TSVImport.get_value(row[index['Category']])
+                if not transcript.contains_tier(tid):
+                    transcript.add_tier(tier_id=tid, speaker=sid, tier_category=category,
+                                        tier_type=TSVImport.get_value(row[index['Type']]),
+                                        display_name=TSVImport.get_value(row[index['Display Name']]))
+
+                content = row[index['String']]
+                if category == 'v' and content[-2:] in ['. ', '! ', '? ']:
+                    content = content[:-1]
+                transcript.add_event(exmaralda.Event(
+                    start=TSVImport.get_time_point(points, row[index['Start']]),
+                    end=TSVImport.get_time_point(points, row[index['End']]),
+                    content=content), tid)
+        return transcripts, time_points
+
+    @staticmethod
+    def renumber_timeline(transcript):
+        """ Orders the timeline of a rebuilt transcript and numbers its time points in temporal order
+
+        :param transcript: rebuilt transcript whose events share the time points of its timeline
+        :type transcript: ExmaraldaTranscript
+        """
+
+        order = transcript.get_timeline_order()
+        timeline = {}
+        for i, tid in enumerate(order):
+            tp = transcript.timeline[tid]
+            tp.set_time_id(str(i))
+            timeline[tp.time_id] = tp
+        transcript.timeline = timeline
+
+    @staticmethod
+    def import_files(in_files, out_dir, compress=None):
+        """ Rebuilds the transcripts of many tsv files and writes them as exb files
+
+        Rows of the same transcript may be spread over several files, e.g. a converted file and a table of additional
+        annotation tiers. Files in other formats, e.g. the token, star schema, or overlap tables of the converter, are
+        skipped with a warning. Every exb file is written while it is serialized.
+
+        :param in_files: paths to the tsv files
+        :type in_files: list of str
+        :param out_dir: output directory
+        :type out_dir: str
+        :param compress: 'gz', 'bz2', 'xz', or None for uncompressed output
+        :type compress: str (optional, defaults to None)
+        :return: paths to the written exb files
+        :rtype: list of str
+        """
+
+        transcripts = {}
+        time_points = {}
+        for in_file in in_files:
+            problem = TSVImport.check_header(TSVImport.read_header(in_file))
+            if problem is not None:
+                print('Skipping {}: {}'.format(in_file, problem))
+                continue
+            # time points are shared by all rows of a transcript, regardless of the file they are read from
+            TSVImport.read_transcripts(in_file, transcripts, time_points)
+        rval = []
+        for name, transcript in transcripts.items():
+            TSVImport.renumber_timeline(transcript)
+            out_file = os.path.join(out_dir, name + '.exb' + compression.Compression.get_extension(compress))
+            generalhelper.GeneralHelper.atomic_write(out_file, transcript.generate_xml(), compress=compress)
+            rval.append(out_file)
+        return rval
@@ -0,0 +1,146 @@
+""" Structured integrity reports collected while loading Exmaralda transcripts
+
+The checks themselves are run by ExmaraldaTranscript.load while it parses a file, so validating a file costs no more
+than loading it.
+"""
+__author__ = 'zweiss'
+
+import json
+
+
+class ValidationIssue:
+    """ Represents a single integrity problem found in a transcript
+
+    Attributes
+    ----------
+    severity: str
+        either 'error' (the data is inconsistent) or 'warning' (the data is incomplete but usable)
+    code: str
+        short identifier of the kind of problem, e.g. 'dangling-time-id'
+    message: str
+        human readable description of the problem
+    element: str
+        id of the element the problem was found in (default is empty string)
+    """
+
+    def __init__(self, severity, code, message, element=''):
+        """
+        :param severity: either 'error' or 'warning'
+        :type severity: str
+        :param code: short identifier of the kind of problem
+        :type code: str
+        :param message: human readable description of the problem
+        :type message: str
+        :param element: id of the element the problem was found in
+        :type element: str (optional, defaults to '')
+        """
+
+        self.severity = severity
+        self.code = code
+        self.message = message
+        self.element = element
+
+    def __str__(self):
+        return '{}\t{}\t{}\t{}'.format(self.severity, self.code, self.element, self.message)
+
+    def to_dict(self):
+        return {'severity': self.severity, 'code': self.code, 'element': self.element, 'message': self.message}
+
+
+class ValidationReport:
+    """ Collects the integrity problems of a single transcript file
+
+    Attributes
+    ----------
+    file: str
+        path of the validated file
+    issues: list of ValidationIssue
+        problems in the order in which they were found
+
+    Methods
+    -------
+    error(code, message, element=''):
+        Records an error
+    warning(code, message, element=''):
+        Records a warning
+    is_valid():
+        Checks if no errors have been recorded
+    to_dict():
+        Creates a dictionary representation of the report
+    to_json():
+        Creates a single line json representation of the report
+    """
+
+    def __init__(self, file=''):
+        """
+        :param file: path of the validated file
+        :type file: str (optional, defaults to '')
+        """
+
+        self.file = file
+        self.issues = []
+
+    def __str__(self):
+        return '\n'.join('{}\t{}'.format(self.file, issue) for issue in self.issues)
+
+    def __len__(self):
+        return len(self.issues)
+
+    def error(self, code, message, element=''):
+        """ Records an error
+
+        :param code: short identifier of the kind of problem
+        :type code: str
+        :param message: human readable description of the problem
+        :type message: str
+        :param element: id of the element the problem was found in
+        :type element: str (optional, defaults to '')
+        """
+
+        self.issues.append(ValidationIssue('error', code, message, element))
+
+    def warning(self, code, message, element=''):
+        """ Records a warning
+
+        :param code: short identifier of the kind of problem
+        :type code: str
+        :param message: human readable description of the problem
+        :type message: str
+        :param element: id of the element the problem was found in
+        :type element: str (optional, defaults to '')
+        """
+
+        self.issues.append(ValidationIssue('warning', code, message, element))
+
+    def get_errors(self):
+        return [issue for issue in self.issues if issue.severity == 'error']
+
+    def get_warnings(self):
+        return [issue for issue in self.issues if issue.severity == 'warning']
+
+    def is_valid(self):
+        """ Checks if no errors have been recorded
+
+        :return: true if the report does not contain any errors
+        :rtype: bool
+        """
+
+        return len(self.get_errors()) == 0
+
+    def to_dict(self):
+        """ Creates a dictionary representation of the report
+
+        :return: file name, validity, counts, and issues of the report
+        :rtype: dict
+        """
+
+        return {'file': self.file, 'valid': self.is_valid(), 'errors': len(self.get_errors()),
+                'warnings': len(self.get_warnings()), 'issues': [issue.to_dict() for issue in self.issues]}
+
+    def to_json(self):
+        """ Creates a single line json representation of the report
+
+        :rtype: str
+        """
+
+        return json.dumps(self.to_dict(), ensure_ascii=False)
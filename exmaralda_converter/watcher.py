@@ -0,0 +1,128 @@
+""" Polling watcher used to reconvert exb files as soon as they have been saved
+
+Only the standard library is used: the input directory is polled for changes of file size and modification time.
+A changed file is reported once its signature has not changed for a settle period, so that partial saves of the
+Partitur editor are not picked up.
+"""
+__author__ = 'zweiss'
+
+import os
+import time
+from exmaralda_converter import generalhelper
+
+
+class DirectoryWatcher:
+    """ Detects added, modified, and removed files in a directory tree
+
+    Attributes
+    ----------
+    in_dir: str
+        directory that is being watched
+    file_ending: str
+        ending of the files that are being watched
+    settle_time: float
+        number of seconds a changed file has to remain unchanged before it is reported
+
+    Methods
+    -------
+    scan():
+        Sets the current state of the directory as known state without reporting any changes
+    poll():
+        Scans the directory once and returns the files that have settled since the last call
+    watch(on_change, on_remove, interval=1.0):
+        Polls the directory until interrupted and calls the handlers for settled changes
+    """
+
+    def __init__(self, in_dir, file_ending='.exb', settle_time=2.0):
+        """
+        :param in_dir: directory to be watched
+        :type in_dir: str
+        :param file_ending: ending of the files to be watched
+        :type file_ending: str (optional, defaults to '.exb')
+        :param settle_time: seconds a changed file has to remain unchanged before it is reported
+        :type settle_time: float (optional, defaults to 2.0)
+        """
+
+        self.in_dir = in_dir
+        self.file_ending = file_ending
+        self.settle_time = settle_time
+        self.known = {}
+        self.pending = {}
+
+    @staticmethod
+    def signature(path):
+        """ Returns size and modification time of a file or None if it vanished
+
+        :param path: path to the file
+        :type path: str
+        :rtype: tuple
+        """
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def scan(self):
+        """ Sets the current state of the directory as known state without reporting any changes """
+
+        for f in generalhelper.GeneralHelper.rec_read_files(self.in_dir, file_ending=self.file_ending):
+            self.known[f] = DirectoryWatcher.signature(f)
+
+    def poll(self):
+        """ Scans the directory once and returns the files that have settled since the last call
+
+        :return: list of changed files and list of removed files
+        :rtype: tuple
+        """
+
+        now = time.monotonic()
+        current = {f: DirectoryWatcher.signature(f)
+                   for f in generalhelper.GeneralHelper.rec_read_files(self.in_dir, file_ending=self.file_ending)}
+
+        # (re)start the settle period of every file whose signature changed
+        for f, sig in current.items():
+            if sig is None:
+                continue
+            if self.known.get(f) == sig:
+                self.pending.pop(f, None)
+            elif f not in self.pending or self.pending[f][0] != sig:
+                self.pending[f] = (sig, now)
+
+        changed = []
+        for f, (sig, since) in list(self.pending.items()):
+            if current.get(f) is None:
+                del self.pending[f]
+            elif now - since >= self.settle_time:
+                del self.pending[f]
+                self.known[f] = sig
+                changed.append(f)
+
+        removed = [f for f in self.known if f not in current]
+        for f in removed:
+            del self.known[f]
+        return sorted(changed), sorted(removed)
+
+    def watch(self, on_change, on_remove=None, interval=1.0):
+        """ Polls the directory until interrupted and calls the handlers for settled changes
+
+        :param on_change: function called with the path of every added or modified file
+        :type on_change: callable
+        :param on_remove: function called with the path of every removed file
+        :type on_remove: callable (optional, defaults to None)
+        :param interval: seconds between two polls
+        :type interval: float (optional, defaults to 1.0)
+        """
+
+        try:
+            while True:
+                changed, removed = self.poll()
+                for f in changed:
+                    on_change(f)
+                if on_remove is not None:
+                    for f in removed:
+                        on_remove(f)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -1,30 +1,405 @@
 # Main file running the converter to generate TSV data dumps from Exmaralda exb files
 __author__ = 'zweiss'
 
+from exmaralda_converter import compression
+from exmaralda_converter import exmaralda
 from exmaralda_converter import generalhelper
-import sys
+from exmaralda_converter import memory
+from exmaralda_converter import normalisation
+from exmaralda_converter import overlap
+from exmaralda_converter import service
+from exmaralda_converter import sqlitedump
+from exmaralda_converter import tsvimport
+from exmaralda_converter import watcher
+import argparse
+import collections
+import functools
+import math
+import multiprocessing
 import os
+import queue
+import re
+import sys
+
+in_file_ending = ".exb"
+out_file_ending = ".tsv"
+jsonl_file_ending = ".jsonl"
+token_file_ending = ".tokens.tsv"
+star_file_endings = {table: "." + table + ".tsv" for table in generalhelper.StarSchemaDump.tables}
+overlap_file_ending = ".overlaps.tsv"
+overlap_totals_file = "overlap_totals.tsv"
+
+
+def get_out_file(in_file, out_dir, compress=None, out_ending=out_file_ending):
+    in_file = compression.Compression.strip_extension(in_file)
+    return os.path.join(out_dir, in_file[in_file.rfind(os.path.sep)+1:in_file.rfind(in_file_ending)] + out_ending
+                        + compression.Compression.get_extension(compress))
+
+
+def convert_to_tsv(in_file, out_dir, interpolate=False, compress=None, filters=None, normaliser=None):
+    f_content = generalhelper.TSVDump.generate_cold_data_dump(in_file=in_file, interpolate=interpolate, filters=filters,
+                                                              normaliser=normaliser)
+    # save the output
+    generalhelper.GeneralHelper.atomic_write(get_out_file(in_file, out_dir, compress), f_content, compress=compress)
+
+
+def convert_to_streamed_tsv(in_file, out_dir, interpolate=False, compress=None, filters=None, normaliser=None):
+    # the rows are written while the exb file is read
+    generalhelper.GeneralHelper.atomic_write(get_out_file(in_file, out_dir, compress),
+                                             generalhelper.TSVDump.generate_streamed_rows(in_file, interpolate, filters,
+                                                                                          normaliser),
+                                             compress=compress)
+
+
+def convert_to_chronological_tsv(in_file, out_dir, interpolate=False, compress=None, filters=None, normaliser=None):
+    cold_transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+    if interpolate:
+        cold_transcript.normalise_timeline()
+    # the rows are written while the tiers are merged
+    generalhelper.GeneralHelper.atomic_write(get_out_file(in_file, out_dir, compress),
+                                             generalhelper.TSVDump.generate_chronological_rows(cold_transcript, filters,
+                                                                                                normaliser),
+                                             compress=compress)
+
+
+def convert_to_jsonl(in_file, out_dir, interpolate=False, compress=None, filters=None, reference_metadata=False,
+                     normaliser=None):
+    cold_transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+    if interpolate:
+        cold_transcript.normalise_timeline()
+    # the lines are written while they are generated
+    generalhelper.GeneralHelper.atomic_write(get_out_file(in_file, out_dir, compress, jsonl_file_ending),
+                                             generalhelper.JSONLinesDump.generate_lines(cold_transcript, filters,
+                                                                                        reference_metadata, normaliser),
+                                             compress=compress)
+
+
+def convert_to_tokens(in_file, out_dir, interpolate=False, compress=None, filters=None,
+                      pattern=generalhelper.TokenDump.default_pattern, token_times=False):
+    cold_transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+    if interpolate:
+        cold_transcript.normalise_timeline()
+    # the rows are written tier by tier while they are generated
+    generalhelper.GeneralHelper.atomic_write(get_out_file(in_file, out_dir, compress, token_file_ending),
+                                             generalhelper.TokenDump.generate_lines(cold_transcript, filters, pattern,
+                                                                                    token_times),
+                                             compress=compress)
+
+
+def convert_to_star(in_file, out_dir, interpolate=False, compress=None, filters=None, normaliser=None):
+    cold_transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+    if interpolate:
+        cold_transcript.normalise_timeline()
+    tables = generalhelper.StarSchemaDump.generate_tables(cold_transcript, filters, normaliser)
+    for table in generalhelper.StarSchemaDump.tables:
+        generalhelper.GeneralHelper.atomic_write(get_out_file(in_file, out_dir, compress, star_file_endings[table]),
+                                                 tables[table], compress=compress)
+
+
+def find_overlaps(in_file, out_dir, interpolate=False, compress=None, filters=None):
+    cold_transcript = exmaralda.ExmaraldaTranscript.load(in_file)
+    if interpolate:
+        cold_transcript.normalise_timeline()
+    report = overlap.OverlapReport.from_transcript(cold_transcript, in_file, filters if len(filters or {}) > 0 else None)
+    generalhelper.GeneralHelper.atomic_write(get_out_file(in_file, out_dir, compress, overlap_file_ending),
+                                             report.get_segment_rows(), compress=compress)
+    # the segments have been written, only the totals are sent back
+    report.segments = []
+    return report
+
+
+def write_overlap_totals(reports, out_dir):
+    # totals of each file followed by the totals of the whole run (File 'ALL')
+    totals = overlap.OverlapReport.aggregate(reports)
+    generalhelper.GeneralHelper.atomic_write(os.path.join(out_dir, overlap_totals_file), overlap.OverlapReport.totals_header
+                                             + ''.join(report.get_total_rows() for report in reports)
+                                             + totals.get_total_rows('ALL'))
+    return totals
+
+
+def convert_many_to_tsv(file_list, out_dir, jobs, split_size, window, interpolate=False, compress=None, filters=None,
+                        normaliser=None):
+    # large files are split into time windows dumped by all workers, small files are converted by a single worker each;
+    # every window parses the whole file, so files are only split if there are fewer files than workers, which would
+    # otherwise be idle, and interpolation needs the whole transcript in every window, so files to be interpolated are
+    # never split
+    splitting = not interpolate and len(file_list) < jobs
+    large_files = sorted([f for f in file_list if splitting and os.path.getsize(f) >= split_size],
+                         key=os.path.getsize, reverse=True)
+    small_files = [f for f in file_list if f not in large_files]
+    with multiprocessing.Pool(jobs) as pool:
+        pending = []
+        for f in large_files:
+            duration = exmaralda.ExmaraldaTranscript.read_duration(f)
+            # by default, each worker gets one window of the file (plus a millisecond to cover its last event)
+            f_window = window if window is not None else duration / jobs + 0.001
+            n_windows = max(math.ceil(duration / f_window), 1)
+            pending.append((f, pool.starmap_async(generalhelper.TSVDump.generate_window_dump,
+                                                  [(f, k, n_windows, f_window, interpolate, filters, normaliser)
+                                                   for k in range(n_windows)])))
+        small_result = pool.starmap_async(convert_to_tsv, [(f, out_dir, interpolate, compress, filters, normaliser)
+                                                           for f in small_files])
+        for f, window_result in pending:
+            f_content = generalhelper.TSVDump.merge_tier_dumps(window_result.get(), normaliser)
+            generalhelper.GeneralHelper.atomic_write(get_out_file(f, out_dir, compress), f_content, compress=compress)
+        small_result.get()
+
+
+def convert_within_budget(file_list, out_dir, budget, convert_files, interpolate=False, compress=None, filters=None):
+    # each file is converted by a fresh worker process, so that the memory of one conversion is returned to the system
+    # before the next one starts; files are started in order as soon as their estimated peak fits into the budget
+    planned = collections.deque()
+    for f in file_list:
+        strategy = budget.get_strategy(f) if 'stream' in convert_files else 'load'
+        planned.append((f, strategy, budget.estimate(f, strategy)))
+    finished = queue.Queue()
+    in_flight = {}
+    with multiprocessing.Pool(budget.jobs, maxtasksperchild=1) as pool:
+        while len(planned) > 0 or len(in_flight) > 0:
+            while len(planned) > 0 and budget.fits(planned[0][2], [estimate for s, estimate in in_flight.values()]):
+                f, strategy, estimate = planned.popleft()
+                in_flight[f] = (strategy, estimate)
+                pool.apply_async(memory.MemoryBudget.measure,
+                                 (convert_files[strategy], (f, out_dir, interpolate, compress, filters)),
+                                 callback=lambda peak, f=f: finished.put((f, peak)),
+                                 error_callback=lambda err, f=f: finished.put((f, err)))
+            f, peak = finished.get()
+            strategy, estimate = in_flight.pop(f)
+            if isinstance(peak, Exception):
+                raise peak
+            yield f, strategy, estimate, peak
+
 
 if __name__ == '__main__':
 
-    if len(sys.argv) < 3:
-        print("Call\n> python main_converter.py INDIR OUTDIR")
+    parser = argparse.ArgumentParser(description='Converts Exmaralda exb files into TSV data dumps.')
+    parser.add_argument('in_dir', metavar='INDIR', nargs='?',
+                        help='input directory containing the exb file(s) (not needed with --serve)')
+    parser.add_argument('out_dir', metavar='OUTDIR', nargs='?',
+                        help='output directory, created if it does not exist (not needed with --validate-only)')
+    parser.add_argument('--format', choices=['tsv', 'star', 'jsonl', 'tokens', 'sqlite'], default='tsv',
+                        help='write one tsv file per exb file (default), separate speaker, tier, and event tsv files '
+                             'per exb file, one json-lines file per exb file, one tsv file with one token per row per '
+                             'exb file, or a single SQLite corpus database')
+    parser.add_argument('--db-file', default='corpus.sqlite',
+                        help='name of the SQLite database within OUTDIR (default: corpus.sqlite)')
+    parser.add_argument('--chronological', action='store_true',
+                        help='with --format tsv, write the events of all tiers in temporal order instead of tier by '
+                             'tier')
+    parser.add_argument('--reference-metadata', action='store_true',
+                        help='with --format jsonl, write speakers and tiers as separate records referenced by id '
+                             'instead of nesting them in every event')
+    parser.add_argument('--token-pattern', default=generalhelper.TokenDump.default_pattern,
+                        help='with --format tokens, regular expression matching a token (default: words and '
+                             'sequences of punctuation)')
+    parser.add_argument('--token-times', action='store_true',
+                        help='with --format tokens, interpolate token times from the event times by their character '
+                             'offsets')
+    parser.add_argument('--compress', choices=['gz', 'bz2', 'xz'], default=None,
+                        help='compress the tsv or json-lines output files (compressed exb input files are always detected)')
+    parser.add_argument('--tiers', help='comma-separated ids of the tiers to be converted (default: all)')
+    parser.add_argument('--categories', help='comma-separated categories of the tiers to be converted (default: all)')
+    parser.add_argument('--types', help='comma-separated types of the tiers to be converted (default: all)')
+    parser.add_argument('--speakers',
+                        help='comma-separated ids or abbreviations of the speakers to be converted (default: all)')
+    parser.add_argument('--normalise', metavar='RULEFILE',
+                        help='add the contents normalised with the rules of this tab-separated file (pattern and '
+                             'replacement per line) next to the raw contents; not supported by tokens and sqlite')
+    parser.add_argument('--interpolate', action='store_true',
+                        help='interpolate the times of time points that are not anchored in time')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of worker processes used for tsv and json-lines conversion (default: 1)')
+    parser.add_argument('--split-size', type=float, default=10.0,
+                        help='with --jobs, files of at least this many MB are split into time windows that are '
+                             'converted in parallel if there are fewer files than jobs (default: 10)')
+    parser.add_argument('--max-memory', type=memory.MemoryBudget.parse_size, default=None, metavar='SIZE',
+                        help='memory budget of the whole conversion, e.g. 4G or 512M (plain numbers are megabytes); '
+                             'large files are streamed (tsv only) and files are only converted in parallel as long as '
+                             'their estimated peak memory fits into the budget')
+    parser.add_argument('--window', type=float, default=None,
+                        help='length of the time windows in seconds used for splitting large files (default: the '
+                             'duration of the file divided by the number of jobs)')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running after the initial conversion and reconvert files whenever they change')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between two polls of INDIR in watch mode (default: 1.0)')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='seconds a changed file has to remain unchanged before it is reconverted (default: 2.0)')
+    parser.add_argument('--serve', action='store_true',
+                        help='run as conversion service answering json requests (one per line) read from stdin')
+    parser.add_argument('--socket', help='with --serve, read requests from this unix domain socket instead of stdin')
+    parser.add_argument('--import-tsv', action='store_true',
+                        help='convert the tsv files in INDIR (converter output or corpus-level tables with a File '
+                             'column) back into exb files written to OUTDIR')
+    parser.add_argument('--overlaps', action='store_true',
+                        help='instead of converting, write the overlapping speech of the verbal tiers (or of the '
+                             'selected tiers) of each file and the per-speaker totals of all files to OUTDIR')
+    parser.add_argument('--validate-only', action='store_true',
+                        help='only check the integrity of the exb files and print one json report per file')
+    args = parser.parse_args()
+
+    if args.jobs < 1 or (args.window is not None and args.window <= 0):
+        parser.error('--jobs and --window must be positive')
+    if args.chronological and args.format != 'tsv':
+        parser.error('--chronological requires --format tsv')
+    try:
+        re.compile(args.token_pattern)
+    except re.error as err:
+        parser.error('invalid --token-pattern: {}'.format(err))
+    if args.max_memory is not None and args.format == 'sqlite':
+        parser.error('--max-memory is not supported by --format sqlite')
+    normaliser = None
+    if args.normalise is not None:
+        if args.format in ['tokens', 'sqlite']:
+            parser.error('--normalise is not supported by --format {}'.format(args.format))
+        try:
+            # all rules are compiled once here and shipped to the workers with the conversion arguments
+            normaliser = normalisation.Normaliser.load(args.normalise)
+        except (OSError, ValueError) as err:
+            parser.error('invalid --normalise: {}'.format(err))
+
+    in_dir = args.in_dir
+    out_dir = args.out_dir
+    filters = {name: getattr(args, name).split(',') for name in ['tiers', 'categories', 'types', 'speakers']
+               if getattr(args, name) is not None}
+
+    if args.serve:
+        service.ConversionService.run(jobs=args.jobs, socket_path=args.socket)
         sys.exit(0)
+    if in_dir is None:
+        parser.error('the following arguments are required: INDIR')
+
+    if args.validate_only:
+        invalid = 0
+        for f in generalhelper.GeneralHelper.rec_read_files(in_dir, file_ending=in_file_ending):
+            report = exmaralda.ExmaraldaTranscript.validate(f)
+            invalid += 0 if report.is_valid() else 1
+            print(report.to_json())
+        sys.exit(1 if invalid > 0 else 0)
+    if out_dir is None:
+        parser.error('the following arguments are required: OUTDIR')
 
-    in_dir = sys.argv[1]
-    out_dir = sys.argv[2]
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    in_file_ending = ".exb"
-    out_file_ending = ".tsv"
+    if args.overlaps:
+        f_args = [(f, out_dir, args.interpolate, args.compress, filters)
+                  for f in generalhelper.GeneralHelper.rec_read_files(in_dir, file_ending=in_file_ending)]
+        if args.jobs > 1:
+            with multiprocessing.Pool(args.jobs) as pool:
+                reports = pool.starmap(find_overlaps, f_args)
+        else:
+            reports = [find_overlaps(*f_arg) for f_arg in f_args]
+        totals = write_overlap_totals(reports, out_dir)
+        print('Found {} overlap segments ({} seconds) in {} files'.format(len(totals), round(totals.get_overlap_time(), 3),
+                                                                         len(reports)))
+        sys.exit(0)
+
+    if args.import_tsv:
+        tsv_files = sorted(generalhelper.GeneralHelper.rec_read_files(in_dir, file_ending=out_file_ending))
+        for f in tsvimport.TSVImport.import_files(tsv_files, out_dir, compress=args.compress):
+            print('Wrote {}'.format(f))
+        sys.exit(0)
+
+    if args.watch:
+        # remember the state before converting so that changes made in the meantime are picked up
+        dir_watcher = watcher.DirectoryWatcher(in_dir, file_ending=in_file_ending, settle_time=args.settle)
+        dir_watcher.scan()
 
     file_list = generalhelper.GeneralHelper.rec_read_files(in_dir, file_ending=in_file_ending)
 
-    for f in file_list:
-        f_content = generalhelper.TSVDump.generate_cold_data_dump(in_file=f)
-        # save the output
-        out_file = f[f.rfind(os.path.sep)+1:f.rfind(in_file_ending)] + out_file_ending
-        with open(os.path.join(out_dir, out_file), 'w', encoding="UTF-8") as outstr:
-            outstr.write(f_content)
+    # formats whose output is written while it is generated, with their output file endings
+    streamed_formats = {
+        'star': (functools.partial(convert_to_star, normaliser=normaliser), list(star_file_endings.values())),
+        'jsonl': (functools.partial(convert_to_jsonl, reference_metadata=args.reference_metadata, normaliser=normaliser),
+                  [jsonl_file_ending]),
+        'tokens': (functools.partial(convert_to_tokens, pattern=args.token_pattern, token_times=args.token_times),
+                   [token_file_ending])}
+    if args.chronological:
+        streamed_formats['tsv'] = (functools.partial(convert_to_chronological_tsv, normaliser=normaliser),
+                                   [out_file_ending])
+
+    if args.format == 'sqlite':
+        sqlitedump.SQLiteDump.generate_cold_data_db(file_list, os.path.join(out_dir, args.db_file),
+                                                    interpolate=args.interpolate)
+    elif args.max_memory is not None:
+        if args.format in streamed_formats:
+            convert_files = {'load': streamed_formats[args.format][0]}
+        else:
+            convert_files = {'load': functools.partial(convert_to_tsv, normaliser=normaliser),
+                             'stream': functools.partial(convert_to_streamed_tsv, normaliser=normaliser)}
+        budget = memory.MemoryBudget(args.max_memory, args.jobs, 'stream' in convert_files, args.interpolate)
+        max_peak = 0
+        for f, strategy, estimate, peak in convert_within_budget(file_list, out_dir, budget, convert_files,
+                                                                 args.interpolate, args.compress, filters):
+            max_peak = max(max_peak, peak)
+            print('Converted {} ({}, estimated peak {:.1f} MB, peak {:.1f} MB{})'.format(
+                f, strategy, estimate / 1024 ** 2, peak / 1024 ** 2,
+                ', exceeds the budget on its own' if estimate > budget.get_available() else ''))
+        print('Converted {} files with a budget of {:.1f} MB, highest peak per file {:.1f} MB'.format(
+            len(file_list), args.max_memory / 1024 ** 2, max_peak / 1024 ** 2))
+    elif args.format in streamed_formats:
+        convert_file = streamed_formats[args.format][0]
+        f_args = [(f, out_dir, args.interpolate, args.compress, filters) for f in file_list]
+        if args.jobs > 1:
+            with multiprocessing.Pool(args.jobs) as pool:
+                pool.starmap(convert_file, f_args)
+        else:
+            for f_arg in f_args:
+                convert_file(*f_arg)
+    elif args.jobs > 1:
+        convert_many_to_tsv(file_list, out_dir, args.jobs, args.split_size * 1024 * 1024, args.window,
+                            interpolate=args.interpolate, compress=args.compress, filters=filters, normaliser=normaliser)
+    else:
+        for f in file_list:
+            convert_to_tsv(f, out_dir, interpolate=args.interpolate, compress=args.compress, filters=filters,
+                           normaliser=normaliser)
+
+    if args.watch:
+        connection = sqlitedump.SQLiteDump.connect(os.path.join(out_dir, args.db_file)) if args.format == 'sqlite' else None
+        # versions of the files converted while watching, used to update the database incrementally
+        previous_versions = {}
+
+        def on_change(f):
+            try:
+                if connection is not None:
+                    transcript = exmaralda.ExmaraldaTranscript.load(f)
+                    if args.interpolate:
+                        transcript.normalise_timeline()
+                    if f in previous_versions:
+                        sqlitedump.SQLiteDump.apply_changes(connection, f, previous_versions[f].diff(transcript))
+                    else:
+                        sqlitedump.SQLiteDump.insert_transcript(connection, transcript, f)
+                    previous_versions[f] = transcript
+                elif args.format in streamed_formats:
+                    streamed_formats[args.format][0](f, out_dir, interpolate=args.interpolate, compress=args.compress,
+                                                     filters=filters)
+                else:
+                    convert_to_tsv(f, out_dir, interpolate=args.interpolate, compress=args.compress, filters=filters,
+                                   normaliser=normaliser)
+                print('Converted {}'.format(f))
+            except Exception as err:
+                # keep the previous output until the file can be read again, e.g. a partially written or
+                # compressed file, and keep watching the other files
+                print('Could not convert {}: {}: {}'.format(f, type(err).__name__, err))
+
+        def on_remove(f):
+            try:
+                if connection is not None:
+                    previous_versions.pop(f, None)
+                    with connection:
+                        sqlitedump.SQLiteDump.delete_transcript(connection, f)
+                else:
+                    for out_ending in streamed_formats[args.format][1] if args.format in streamed_formats \
+                            else [out_file_ending]:
+                        out_file = get_out_file(f, out_dir, args.compress, out_ending)
+                        if os.path.exists(out_file):
+                            os.remove(out_file)
+                print('Removed {}'.format(f))
+            except Exception as err:
+                print('Could not remove the output of {}: {}: {}'.format(f, type(err).__name__, err))
 
+        print('Watching {} for changes (press Ctrl+C to stop)'.format(in_dir))
+        dir_watcher.watch(on_change, on_remove, interval=args.interval)
+        if connection is not None:
+            connection.close()
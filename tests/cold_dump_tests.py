@@ -1 +1,446 @@
 __author__ = 'zweiss'
+
+import json
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from exmaralda_converter import exmaralda
+from exmaralda_converter import generalhelper
+from exmaralda_converter import normalisation
+from exmaralda_converter import tsvimport
+
+head = """<?xml version="1.0" encoding="UTF-8"?>
+<basic-transcription>
+<head>
+<meta-information>
+<project-name>COLD</project-name>
+<transcription-name>lesson2</transcription-name>
+<referenced-file url=""/>
+<ud-meta-information></ud-meta-information>
+<comment></comment>
+<transcription-convention>cGAT</transcription-convention>
+</meta-information>
+<speakertable>
+<speaker id="SPK0">
+<abbreviation>T</abbreviation>
+<sex value="f"/>
+<languages-used><language lang="deu"/></languages-used>
+<l1><language lang="deu"/></l1>
+<l2></l2>
+<ud-speaker-information></ud-speaker-information>
+<comment></comment>
+</speaker>
+<speaker id="SPK1">
+<abbreviation>S1</abbreviation>
+<sex value="m"/>
+<languages-used><language lang="deu"/><language lang="tur"/></languages-used>
+<l1><language lang="tur"/></l1>
+<l2><language lang="deu"/></l2>
+<ud-speaker-information></ud-speaker-information>
+<comment></comment>
+</speaker>
+</speakertable>
+</head>
+"""
+
+
+def make_transcript(n_points=40, step=1.5, unanchored=(3, 4, 17, 31)):
+    """ Creates an exb file with three tiers whose events span several windows of 10 seconds, start at window
+    boundaries (e.g. 30.0), and start or end at time points that are not anchored in time
+
+    :param n_points: number of time points
+    :type n_points: int (optional, defaults to 40)
+    :param step: seconds between two time points
+    :type step: float (optional, defaults to 1.5)
+    :param unanchored: indices of the time points without time stamp
+    :type unanchored: tuple of int (optional, defaults to (3, 4, 17, 31))
+    :return: content of the exb file
+    :rtype: str
+    """
+
+    rval = [head, '<basic-body>\n<common-timeline>\n']
+    for i in range(n_points):
+        time = '' if i in unanchored else ' time="{}"'.format(i * step)
+        rval.append('<tli id="T{}"{}/>\n'.format(i, time))
+    rval.append('</common-timeline>\n')
+    tiers = [('TIE0', 'SPK0', 'v', 't', 'T [v]', 2), ('TIE1', 'SPK1', 'v', 't', 'S1 [v]', 3),
+             ('TIE2', 'SPK1', 'nv', 'd', 'S1 [nv]', 5)]
+    contents = ['Guten Morgen.', 'Setzt euch (.) bitte!', 'Morgen &amp; so', 'JA (1.5) ja', 'nods', 'Wer weiß?']
+    for tid, sid, category, type, display_name, length in tiers:
+        rval.append('<tier id="{}" speaker="{}" category="{}" type="{}" display-name="{}">\n'.format(
+            tid, sid, category, type, display_name))
+        for i, start in enumerate(range(len(tid) % 2, n_points - length, length)):
+            rval.append('<event start="T{}" end="T{}">{}</event>\n'.format(
+                start, start + length, contents[(i + len(tiers)) % len(contents)]))
+        rval.append('</tier>\n')
+    rval.append('</basic-body>\n</basic-transcription>\n')
+    return ''.join(rval)
+
+
+class ColdDumpTests(unittest.TestCase):
+
+    rules = [(r'\(\.\)|\(\d+(\.\d+)?\)', ''), ('(?i)ja', 'yes'), ('&', 'und')]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.in_file = os.path.join(self.tmp_dir, 'lesson2.exb')
+        with open(self.in_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write(make_transcript())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def generate_split_dump(in_file, window, interpolate=False, normaliser=None):
+        # dumps the windows of a file separately and merges them as done by the parallel conversion
+        n_windows = max(math.ceil(exmaralda.ExmaraldaTranscript.read_duration(in_file) / window), 1)
+        return generalhelper.TSVDump.merge_tier_dumps(
+            [generalhelper.TSVDump.generate_window_dump(in_file, k, n_windows, window, interpolate, None, normaliser)
+             for k in range(n_windows)], normaliser)
+
+    # dumps of the whole file
+
+    def test_cold_data_dump(self):
+        dump = generalhelper.TSVDump.generate_cold_data_dump(self.in_file)
+        lines = dump.splitlines(True)
+        self.assertEqual(lines[0], generalhelper.TSVDump.header)
+        self.assertEqual(lines[1], 'TIE0\tt\tT [v]\tv\tSPK0\tT\tdeu\tNA\tdeu\tf\t0.0\t3.0\tJA (1.5) ja\n')
+        self.assertIn('TIE0\tt\tT [v]\tv\tSPK0\tT\tdeu\tNA\tdeu\tf\tNA\t9.0\tWer weiß? \n', lines)
+        self.assertIn('TIE1\tt\tS1 [v]\tv\tSPK1\tS1\ttur\tdeu\tdeu_tur\tm\t0.0\tNA\tJA (1.5) ja\n', lines)
+        self.assertIn('TIE2\td\tS1 [nv]\tnv\tSPK1\tS1\ttur\tdeu\tdeu_tur\tm\t0.0\t7.5\tJA (1.5) ja\n', lines)
+        self.assertTrue(any(line.endswith('bitte! \n') for line in lines))
+        self.assertFalse(any(line.startswith('TIE2') and line.endswith('? \n') for line in lines))
+
+    def test_interpolated_dump(self):
+        rows = [line.split('\t') for line in generalhelper.TSVDump.generate_cold_data_dump(
+            self.in_file, interpolate=True).splitlines()[1:]]
+        self.assertEqual(len(rows), len(generalhelper.TSVDump.generate_cold_data_dump(self.in_file).splitlines()) - 1)
+        self.assertFalse(any('NA' in row[10:12] for row in rows))
+        self.assertIn(['6.0', '9.0'], [row[10:12] for row in rows if row[0] == 'TIE0'])
+
+    # split, merged, and streamed dumps
+
+    def test_split_dump(self):
+        for interpolate in [False, True]:
+            expected = generalhelper.TSVDump.generate_cold_data_dump(self.in_file, interpolate)
+            for window in [10.0, 15.0, 30.0, 58.5, 100.0]:
+                self.assertEqual(self.generate_split_dump(self.in_file, window, interpolate), expected,
+                                 'window {}, interpolate {}'.format(window, interpolate))
+
+    def test_split_dump_normalised(self):
+        normaliser = normalisation.Normaliser(ColdDumpTests.rules)
+        for interpolate in [False, True]:
+            self.assertEqual(self.generate_split_dump(self.in_file, 10.0, interpolate, normaliser),
+                             generalhelper.TSVDump.generate_cold_data_dump(self.in_file, interpolate,
+                                                                           normaliser=normaliser))
+
+    def test_split_chunks(self):
+        # the last time stamp (58.5) lies in the sixth window, the end of a window does not open another one
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        self.assertEqual(len(cold_transcript.split(10.0)), 6)
+        self.assertEqual(len(cold_transcript.split(58.5)), 1)
+        n_events = sum(len(tier.event_list) for tier in cold_transcript.tiers.values())
+        self.assertEqual(sum(len(tier.event_list) for chunk in cold_transcript.split(10.0)
+                             for tier in chunk.tiers.values()), n_events)
+
+    def test_streamed_rows(self):
+        normaliser = normalisation.Normaliser(ColdDumpTests.rules)
+        filters = {'categories': ['v']}
+        for interpolate in [False, True]:
+            for kwargs in [{}, {'normaliser': normaliser}, {'filters': filters}]:
+                self.assertEqual(
+                    ''.join(generalhelper.TSVDump.generate_streamed_rows(self.in_file, interpolate, **kwargs)),
+                    generalhelper.TSVDump.generate_cold_data_dump(self.in_file, interpolate, **kwargs),
+                    'interpolate {}, {}'.format(interpolate, list(kwargs.keys())))
+
+    # chronological order
+
+    def test_chronological_rows(self):
+        normaliser = normalisation.Normaliser(ColdDumpTests.rules)
+        for interpolate in [False, True]:
+            for kwargs in [{}, {'normaliser': normaliser}, {'filters': {'categories': ['v']}}]:
+                cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+                if interpolate:
+                    cold_transcript.normalise_timeline()
+                lines = list(generalhelper.TSVDump.generate_chronological_rows(cold_transcript, **kwargs))
+                # the same rows as the dump tier by tier, in another order
+                expected = generalhelper.TSVDump.generate_cold_data_dump(self.in_file, interpolate, **kwargs)
+                self.assertEqual(lines[0], expected.splitlines(True)[0])
+                self.assertEqual(sorted(lines[1:]), sorted(expected.splitlines(True)[1:]))
+                self.assertNotEqual(lines[1:], expected.splitlines(True)[1:])
+                # known starts do not decrease, events starting at the same time keep the tier order
+                keys = [(float(row[10]), row[0]) for row in map(lambda line: line.split('\t'), lines[1:])
+                        if row[10] != 'NA']
+                self.assertEqual(keys, sorted(keys), 'interpolate {}, {}'.format(interpolate, list(kwargs.keys())))
+                self.assertEqual(len(keys), sum(1 for line in lines[1:] if line.split('\t')[10] != 'NA'))
+                if interpolate:
+                    self.assertEqual(len(keys), len(lines) - 1)
+
+    def test_chronological_unanchored(self):
+        # events starting at the time points without time stamps T3 (TIE1) and T4 (TIE0) are placed between the events
+        # starting at T2 (3.0) and T5 (7.5)
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        rows = [line.split('\t') for line in generalhelper.TSVDump.generate_chronological_rows(cold_transcript)][1:]
+        self.assertEqual([(row[0], row[10], row[11]) for row in rows[:8]],
+                         [('TIE0', '0.0', '3.0'), ('TIE1', '0.0', 'NA'), ('TIE2', '0.0', '7.5'),
+                          ('TIE0', '3.0', 'NA'), ('TIE1', 'NA', '9.0'), ('TIE0', 'NA', '9.0'),
+                          ('TIE2', '7.5', '15.0'), ('TIE0', '9.0', '12.0')])
+
+    def test_chronological_ties(self):
+        # events starting at time points with the same time stamp (T1 and T99 at 1.5) are ordered by tier, even though
+        # the timeline order places time points without time stamps (T3, T17, T31) between T1 and T99
+        with open(self.in_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write(make_transcript().replace('</common-timeline>', '<tli id="T99" time="1.5"/>\n</common-timeline>')
+                         .replace('start="T2" end="T4"', 'start="T99" end="T4"')
+                         .replace('start="T3" end="T6"', 'start="T1" end="T6"'))
+        for interpolate in [False, True]:
+            cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+            if interpolate:
+                cold_transcript.normalise_timeline()
+            rows = [line.split('\t') for line in generalhelper.TSVDump.generate_chronological_rows(cold_transcript)]
+            self.assertEqual([row[0] for row in rows if row[10] == '1.5'], ['TIE0', 'TIE1'])
+
+    # json lines
+
+    def test_jsonl(self):
+        # tabs and line breaks in contents are escaped, so each record stays on its line
+        with open(self.in_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write(make_transcript().replace('>nods<', '>nods&#9;and&#10;smiles<'))
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        lines = ''.join(generalhelper.JSONLinesDump.generate_lines(cold_transcript)).split('\n')
+        self.assertEqual(lines[-1], '')
+        records = [json.loads(line) for line in lines[:-1]]
+
+        rows = generalhelper.TSVDump.generate_cold_data_dump(self.in_file).split('\n')[1:-1]
+        self.assertEqual(len(records), len([row for row in rows if row.startswith('TIE')]))
+        self.assertIn('nods\tand\nsmiles', [record['content'] for record in records])
+        first = records[0]
+        self.assertEqual(first['record'], 'event')
+        self.assertEqual(first['tier'], {'id': 'TIE0', 'type': 't', 'display_name': 'T [v]', 'category': 'v',
+                                         'speaker': {'id': 'SPK0', 'abbreviation': 'T', 'sex': 'f',
+                                                     'languages_used': ['deu'], 'l1': ['deu'], 'l2': []}})
+        self.assertEqual((first['start'], first['end'], first['content']), (0.0, 3.0, 'JA (1.5) ja'))
+        # time points without time stamp are null
+        self.assertIn((None, 9.0), [(record['start'], record['end']) for record in records])
+
+    def test_jsonl_reference_metadata(self):
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        nested = [json.loads(line) for line in generalhelper.JSONLinesDump.generate_lines(cold_transcript)]
+        for filters in [None, {'categories': ['v']}, {'speakers': ['T']}]:
+            records = [json.loads(line) for line in generalhelper.JSONLinesDump.generate_lines(
+                cold_transcript, filters, reference_metadata=True)]
+            speakers = {record['id']: record for record in records if record['record'] == 'speaker'}
+            tiers = {record['id']: record for record in records if record['record'] == 'tier'}
+            events = [record for record in records if record['record'] == 'event']
+            self.assertEqual(records, list(speakers.values()) + list(tiers.values()) + events)
+            tids = generalhelper.GeneralHelper.select_tiers(cold_transcript, filters)
+            self.assertEqual(list(tiers.keys()), tids)
+            self.assertEqual(sorted(speakers.keys()), sorted(set(cold_transcript.tiers[tid].speaker for tid in tids)))
+
+            # resolving the references yields the records with nested metadata
+            for tier in tiers.values():
+                del tier['record']
+                tier['speaker'] = {key: value for key, value in speakers[tier['speaker']].items() if key != 'record'}
+            self.assertEqual([dict(record, tier=tiers[record['tier']]) for record in events],
+                             [record for record in nested if record['tier']['id'] in tids])
+
+    def test_jsonl_normalised(self):
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        normaliser = normalisation.Normaliser(ColdDumpTests.rules)
+        for line in generalhelper.JSONLinesDump.generate_lines(cold_transcript, normaliser=normaliser):
+            record = json.loads(line)
+            self.assertEqual(record['normalised'], normaliser.normalise(record['content']))
+
+    # tokens
+
+    def test_tokens(self):
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        lines = ''.join(generalhelper.TokenDump.generate_lines(cold_transcript)).splitlines()
+        header = lines[0].split('\t')
+        self.assertEqual(lines[0] + '\n', generalhelper.TokenDump.get_header())
+        rows = [dict(zip(header, line.split('\t'))) for line in lines[1:]]
+        self.assertTrue(all(len(line.split('\t')) == len(header) for line in lines))
+
+        # the character offsets point to the token within the content of its event
+        events = {(tid, i): e.content for tid, tier in cold_transcript.tiers.items()
+                  for i, e in enumerate(tier.event_list)}
+        for row in rows:
+            content = events[(row['Tier-ID'], int(row['Event']))]
+            self.assertEqual(content[int(row['Char-Start']):int(row['Char-End'])], row['String'])
+        tokens = [(row['Token'], row['Char-Start'], row['Char-End'], row['String']) for row in rows
+                  if row['Tier-ID'] == 'TIE0' and row['Event'] == '4']
+        self.assertEqual(tokens, [('0', '0', '5', 'Setzt'), ('1', '6', '10', 'euch'), ('2', '11', '14', '(.)'),
+                                  ('3', '15', '20', 'bitte'), ('4', '20', '21', '!')])
+        # every event with content has tokens
+        self.assertEqual(set((row['Tier-ID'], int(row['Event'])) for row in rows), set(events.keys()))
+
+    def test_token_pattern(self):
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        lines = ''.join(generalhelper.TokenDump.generate_lines(cold_transcript, pattern=r'\S+')).splitlines()
+        self.assertIn('(1.5)', [line.split('\t')[-1] for line in lines])
+
+    def test_token_times(self):
+        for interpolate in [False, True]:
+            cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+            if interpolate:
+                cold_transcript.normalise_timeline()
+            lines = ''.join(generalhelper.TokenDump.generate_lines(cold_transcript, token_times=True)).splitlines()
+            self.assertEqual(lines[0] + '\n', generalhelper.TokenDump.get_header(token_times=True))
+            header = lines[0].split('\t')
+            rows = [dict(zip(header, line.split('\t'))) for line in lines[1:]]
+            for row in rows:
+                if 'NA' in [row['Start'], row['End']]:
+                    self.assertFalse(interpolate)
+                    self.assertEqual((row['Token-Start'], row['Token-End']), ('NA', 'NA'))
+                    continue
+                start, end = float(row['Start']), float(row['End'])
+                # token times are interpolated by the character offsets within the event
+                length = len(cold_transcript.tiers[row['Tier-ID']].event_list[int(row['Event'])].content)
+                self.assertAlmostEqual(float(row['Token-Start']),
+                                       start + (end - start) * int(row['Char-Start']) / length, places=5)
+                self.assertAlmostEqual(float(row['Token-End']),
+                                       start + (end - start) * int(row['Char-End']) / length, places=5)
+                self.assertTrue(start <= float(row['Token-Start']) < float(row['Token-End']) <= end)
+            first = rows[0]
+            self.assertEqual((first['String'], first['Token-Start'], first['Token-End']), ('JA', '0.0', '0.545455'))
+
+    # star schema
+
+    def test_star_schema(self):
+        normaliser = normalisation.Normaliser(ColdDumpTests.rules)
+        for interpolate in [False, True]:
+            for kwargs in [{}, {'normaliser': normaliser}, {'filters': {'categories': ['v']}},
+                           {'filters': {'speakers': ['SPK1']}}]:
+                cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+                if interpolate:
+                    cold_transcript.normalise_timeline()
+                tables = generalhelper.StarSchemaDump.generate_tables(cold_transcript, **kwargs)
+                self.assertEqual(
+                    ''.join(generalhelper.StarSchemaDump.rejoin(tables['speakers'], tables['tiers'], tables['events'])),
+                    generalhelper.TSVDump.generate_cold_data_dump(self.in_file, interpolate, **kwargs),
+                    'interpolate {}, {}'.format(interpolate, kwargs))
+
+    def test_star_schema_tables(self):
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        tables = generalhelper.StarSchemaDump.generate_tables(cold_transcript, {'tiers': ['TIE1', 'TIE2']})
+        # speakers are listed once, and only if one of the selected tiers belongs to them
+        self.assertEqual(tables['speakers'], generalhelper.StarSchemaDump.headers['speakers'] +
+                         'SPK1\tS1\ttur\tdeu\tdeu_tur\tm\n')
+        self.assertEqual(tables['tiers'].splitlines()[1:], ['TIE1\tt\tS1 [v]\tv\tSPK1', 'TIE2\td\tS1 [nv]\tnv\tSPK1'])
+        events = ''.join(tables['events'])
+        self.assertEqual(events.splitlines(True)[0], generalhelper.StarSchemaDump.headers['events'])
+        self.assertIn('TIE1\t0.0\tNA\tJA (1.5) ja\n', events)
+
+        # the event table may be read back from a string or line by line, e.g. from an open file
+        expected = generalhelper.TSVDump.generate_cold_data_dump(self.in_file, filters={'tiers': ['TIE1', 'TIE2']})
+        events_file = os.path.join(self.tmp_dir, 'lesson2.events.tsv')
+        with open(events_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write(events)
+        with open(events_file, encoding='UTF-8') as instr:
+            rejoined = ''.join(generalhelper.StarSchemaDump.rejoin(tables['speakers'], tables['tiers'], instr))
+        self.assertEqual(rejoined, expected)
+        self.assertEqual(''.join(generalhelper.StarSchemaDump.rejoin(tables['speakers'], tables['tiers'], events)),
+                         expected)
+
+    def test_star_schema_unknown_speaker(self):
+        with open(self.in_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write(make_transcript().replace('speaker="SPK1" category="nv"', 'speaker="SPK9" category="nv"'))
+        cold_transcript = exmaralda.ExmaraldaTranscript.load(self.in_file)
+        tables = generalhelper.StarSchemaDump.generate_tables(cold_transcript)
+        self.assertNotIn('SPK9', tables['speakers'])
+        rows = list(generalhelper.StarSchemaDump.rejoin(tables['speakers'], tables['tiers'], tables['events']))
+        self.assertEqual(''.join(rows), generalhelper.TSVDump.generate_cold_data_dump(self.in_file))
+        self.assertTrue(all(row.split('\t')[5:10] == ['NA'] * 5 for row in rows if row.startswith('TIE2')))
+
+    # import
+
+    def test_round_trip(self):
+        for name, interpolate in [('lesson2', False), ('lesson3', True)]:
+            tsv_file = os.path.join(self.tmp_dir, name + '.tsv')
+            dump = generalhelper.TSVDump.generate_cold_data_dump(self.in_file, interpolate)
+            with open(tsv_file, 'w', encoding='UTF-8') as outstr:
+                outstr.write(dump)
+            out_dir = os.path.join(self.tmp_dir, 'import')
+            os.makedirs(out_dir, exist_ok=True)
+
+            out_files = tsvimport.TSVImport.import_files([tsv_file], out_dir)
+            self.assertEqual(out_files, [os.path.join(out_dir, name + '.exb')])
+            self.assertTrue(exmaralda.ExmaraldaTranscript.validate(out_files[0]).is_valid())
+            self.assertEqual(generalhelper.TSVDump.generate_cold_data_dump(out_files[0]), dump)
+
+    def test_round_trip_normalised(self):
+        tsv_file = os.path.join(self.tmp_dir, 'lesson2.tsv')
+        normaliser = normalisation.Normaliser(ColdDumpTests.rules)
+        with open(tsv_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write(generalhelper.TSVDump.generate_cold_data_dump(self.in_file, normaliser=normaliser))
+        out_files = tsvimport.TSVImport.import_files([tsv_file], self.tmp_dir)
+        self.assertEqual(generalhelper.TSVDump.generate_cold_data_dump(out_files[0]),
+                         generalhelper.TSVDump.generate_cold_data_dump(self.in_file))
+
+    def test_check_header(self):
+        columns = generalhelper.TSVDump.header.rstrip('\n').split('\t')
+        self.assertIsNone(tsvimport.TSVImport.check_header(columns))
+        self.assertIsNone(tsvimport.TSVImport.check_header(
+            generalhelper.TSVDump.normalised_header.rstrip('\n').split('\t')))
+        self.assertIsNotNone(tsvimport.TSVImport.check_header(columns[1:]))
+        self.assertIsNotNone(tsvimport.TSVImport.check_header(columns + ['Token']))
+        self.assertIsNotNone(tsvimport.TSVImport.check_header(columns[:-1] + ['Token', 'String']))
+
+    def test_import_skips(self):
+        tsv_file = os.path.join(self.tmp_dir, 'speakers.tsv')
+        with open(tsv_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write('Speaker-ID\tAbbreviation\nSPK0\tT\n')
+        self.assertEqual(tsvimport.TSVImport.import_files([tsv_file], self.tmp_dir), [])
+        with self.assertRaises(ValueError):
+            tsvimport.TSVImport.read_transcripts(tsv_file)
+
+    # normalisation
+
+    def test_normalise(self):
+        normaliser = normalisation.Normaliser(ColdDumpTests.rules)
+        self.assertEqual(len(normaliser), 3)
+        self.assertEqual(normaliser.normalise('Setzt euch (.) bitte!'), 'Setzt euch bitte!')
+        self.assertEqual(normaliser.normalise(' JA (1.5)  ja & Jan '), 'yes yes und yesn')
+        self.assertEqual(normaliser.normalise(''), '')
+        self.assertEqual(normalisation.Normaliser([]).normalise(' a  b '), 'a b')
+
+    def test_normalise_order(self):
+        # at each position, the first rule matching there is applied
+        self.assertEqual(normalisation.Normaliser([('ab', 'X'), ('a', 'Y')]).normalise('aab'), 'YX')
+        self.assertEqual(normalisation.Normaliser([('a', 'Y'), ('ab', 'X')]).normalise('aab'), 'YYb')
+        # replacements are inserted literally
+        self.assertEqual(normalisation.Normaliser([('(a)(b)?', r'\1')]).normalise('ab'), r'\1')
+
+    def test_normalise_flags(self):
+        # flags only apply to their rule
+        normaliser = normalisation.Normaliser([('(?i)ja', 'yes'), ('nein', 'no')])
+        self.assertEqual(normaliser.normalise('JA NEIN nein'), 'yes NEIN no')
+        normaliser = normalisation.Normaliser([('(?x) j a  # comment', 'yes'), ('(?i)(?s)n.in', 'no')])
+        self.assertEqual(normaliser.normalise('ja NEIN'), 'yes no')
+        self.assertEqual(normalisation.Normaliser.scope_flags('(?i)ja'), '(?i:ja)')
+        self.assertEqual(normalisation.Normaliser.scope_flags('ja(?i)'), 'ja(?i)')
+
+    def test_normalise_errors(self):
+        for rules in [[('(a)\\1', '')], [('(?P<x>a)', '')], [('(?P<x>a)(?P=x)', '')], [('(a)(?(1)b)', '')],
+                      [('(', '')], [('a', ''), ('[', '')]]:
+            with self.assertRaises(ValueError, msg=str(rules)):
+                normalisation.Normaliser(rules)
+        # digits in character classes and escaped backslashes are no backreferences
+        self.assertFalse(normalisation.Normaliser.has_backreference(r'[\1]'))
+        self.assertFalse(normalisation.Normaliser.has_backreference(r'\\1'))
+        self.assertFalse(normalisation.Normaliser.has_backreference(r'[]\1]'))
+        self.assertTrue(normalisation.Normaliser.has_backreference(r'[a]\1'))
+
+    def test_load_rules(self):
+        rule_file = os.path.join(self.tmp_dir, 'rules.tsv')
+        with open(rule_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write('# pauses\n\\(\\.\\)|\\(\\d+(\\.\\d+)?\\)\n\n&\tund\n')
+        normaliser = normalisation.Normaliser.load(rule_file)
+        self.assertEqual(normaliser.rules, [(r'\(\.\)|\(\d+(\.\d+)?\)', ''), ('&', 'und')])
+        self.assertEqual(normaliser.normalise('a (.) & (2) b'), 'a und b')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+__author__ = 'zweiss'
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from exmaralda_converter import columnar
+from exmaralda_converter import generalhelper
+from tests.cold_dump_tests import make_transcript
+from tests.exmaralda_tests import transcript
+
+
+class ColumnarTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.blocks = ColumnarTests.get_blocks()
+        self.paths = [self.write('lesson{}.exb'.format(i), make_transcript(n_points=40 + 10 * i)) for i in range(4)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        rval = os.path.join(self.tmp_dir, name)
+        with open(rval, 'w', encoding='UTF-8') as outstr:
+            outstr.write(content)
+        return rval
+
+    @staticmethod
+    def get_blocks():
+        # shared memory blocks created by columnar.ColumnarCorpus.load
+        return set(glob.glob('/dev/shm/psm_*'))
+
+    @staticmethod
+    def get_dump_columns(in_file, interpolate):
+        # tier id, start, end, and content of each row of the cold data dump
+        return [(row[0], row[10], row[11], row[12].rstrip(' ')) for row in map(
+            lambda line: line.split('\t'),
+            generalhelper.TSVDump.generate_cold_data_dump(in_file, interpolate).splitlines()[1:])]
+
+    @staticmethod
+    def get_columns(columnar_transcript):
+        return [(tid, 'NA' if start is None else str(start), 'NA' if end is None else str(end), content)
+                for tid, start, end, content in columnar_transcript.iter_events()]
+
+    def test_load(self):
+        for jobs in [1, 2]:
+            for interpolate in [False, True]:
+                with columnar.ColumnarCorpus.load(self.paths, jobs=jobs, interpolate=interpolate) as cold_corpus:
+                    self.assertEqual([t.file for t in cold_corpus], self.paths)
+                    for in_file, columnar_transcript in zip(self.paths, cold_corpus):
+                        expected = ColumnarTests.get_dump_columns(in_file, interpolate)
+                        self.assertEqual(ColumnarTests.get_columns(columnar_transcript), expected,
+                                         'jobs {}, interpolate {}'.format(jobs, interpolate))
+                        self.assertEqual(len(columnar_transcript), len(expected))
+                        self.assertEqual([columnar_transcript.get_tier(i) for i in range(len(expected))],
+                                         [row[0] for row in expected])
+                        self.assertEqual([columnar_transcript.get_content(i) for i in range(len(expected))],
+                                         [row[3] for row in expected])
+                    self.assertEqual(cold_corpus.transcripts[0].get_time_id(3), '3')
+                    self.assertEqual(sorted(cold_corpus.transcripts[0].speakers.keys()), ['SPK0', 'SPK1'])
+                    self.assertEqual(len(ColumnarTests.get_blocks() - self.blocks), len(self.paths))
+                self.assertEqual(ColumnarTests.get_blocks(), self.blocks)
+
+    def test_close(self):
+        cold_corpus = columnar.ColumnarCorpus.load(self.paths, jobs=2)
+        cold_corpus.close()
+        self.assertEqual(ColumnarTests.get_blocks(), self.blocks)
+        # closing twice is harmless
+        cold_corpus.close()
+
+    def test_broken_file(self):
+        # the blocks of the files loaded before and after a broken one are released
+        paths = self.paths[:2] + [self.write('broken.exb', transcript[:900])] + self.paths[2:]
+        for jobs in [1, 2]:
+            with self.assertRaises(ET.ParseError):
+                columnar.ColumnarCorpus.load(paths, jobs=jobs)
+            self.assertEqual(ColumnarTests.get_blocks(), self.blocks, 'jobs {}'.format(jobs))
+        with self.assertRaises(FileNotFoundError):
+            columnar.ColumnarCorpus.load(self.paths + [os.path.join(self.tmp_dir, 'missing.exb')], jobs=2)
+        self.assertEqual(ColumnarTests.get_blocks(), self.blocks)
+
+    def test_release(self):
+        # blocks created by workers whose results never arrive, e.g. after an interrupt
+        shm_names = ['psm_test_{}_{}'.format(os.getpid(), i) for i in range(3)]
+        for in_file, shm_name in zip(self.paths, shm_names[:2]):
+            columnar.ColumnarTranscript.load_shared(in_file, shm_name=shm_name)
+        self.assertEqual(len(ColumnarTests.get_blocks() - self.blocks), 2)
+        columnar.ColumnarCorpus.release(shm_names)
+        self.assertEqual(ColumnarTests.get_blocks(), self.blocks)
+
+
+if __name__ == '__main__':
+    unittest.main()
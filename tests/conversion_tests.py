@@ -0,0 +1,78 @@
+__author__ = 'zweiss'
+
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from exmaralda_converter import conversion
+from tests.cold_dump_tests import make_transcript
+from tests.exmaralda_tests import transcript
+
+
+class ConversionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = [self.write('lesson{}.exb'.format(i), make_transcript().replace('lesson2', 'lesson{}'.format(i)))
+                      for i in range(6)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        rval = os.path.join(self.tmp_dir, name)
+        with open(rval, 'w', encoding='UTF-8') as outstr:
+            outstr.write(content)
+        return rval
+
+    def test_convert_many(self):
+        expected = [(path, conversion.convert(path)) for path in self.paths]
+        self.assertEqual(list(conversion.convert_many(self.paths)), expected)
+        self.assertEqual(list(conversion.convert_many(self.paths, jobs=2, ordered=True)), expected)
+        self.assertEqual(sorted(conversion.convert_many(self.paths, jobs=2)), sorted(expected))
+
+    def test_completion_order(self):
+        # a large file first, so that the small files submitted with it are yielded before it
+        paths = [self.write('large.exb', make_transcript(n_points=20000))] + self.paths
+        results = [path for path, result in conversion.convert_many(iter(paths), jobs=2, max_pending=len(paths))]
+        self.assertEqual(sorted(results), sorted(paths))
+        self.assertNotEqual(results[0], paths[0])
+        self.assertEqual(results[-1], paths[0])
+
+    def test_errors(self):
+        broken = self.write('broken.exb', transcript[:900])
+        missing = os.path.join(self.tmp_dir, 'missing.exb')
+        paths = [broken, self.paths[1], missing, self.paths[2]]
+        for kwargs in [{}, {'jobs': 2, 'ordered': True}]:
+            results = list(conversion.convert_many(iter(paths), **kwargs))
+            self.assertEqual([path for path, result in results], paths)
+            self.assertIsInstance(results[0][1], ET.ParseError)
+            self.assertIsInstance(results[2][1], FileNotFoundError)
+            self.assertEqual(results[1][1], conversion.convert(self.paths[1]))
+            self.assertEqual(results[3][1], conversion.convert(self.paths[2]))
+        results = dict(conversion.convert_many(paths, jobs=2))
+        self.assertIsInstance(results[broken], ET.ParseError)
+        self.assertIsInstance(results[missing], FileNotFoundError)
+        with self.assertRaises(ValueError):
+            list(conversion.convert_many(paths, format='xml'))
+
+    def test_max_pending(self):
+        for ordered in [False, True]:
+            read = []
+
+            def generate_paths():
+                for path in self.paths * 3:
+                    read.append(path)
+                    yield path
+
+            n_results = 0
+            for path, result in conversion.convert_many(generate_paths(), jobs=2, ordered=ordered, max_pending=3):
+                n_results += 1
+                # files read from the iterator, but not yet yielded
+                self.assertLessEqual(len(read) - n_results, 3)
+            self.assertEqual(n_results, len(self.paths) * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
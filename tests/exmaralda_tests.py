@@ -1 +1,279 @@
 __author__ = 'zweiss'
+
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+from exmaralda_converter import exmaralda
+from exmaralda_converter import generalhelper
+from exmaralda_converter import sqlitedump
+
+transcript = """<?xml version="1.0" encoding="UTF-8"?>
+<basic-transcription>
+<head>
+<meta-information>
+<project-name>COLD</project-name>
+<transcription-name>lesson1</transcription-name>
+<referenced-file url=""/>
+<ud-meta-information></ud-meta-information>
+<comment></comment>
+<transcription-convention>cGAT</transcription-convention>
+</meta-information>
+<speakertable>
+<speaker id="SPK0">
+<abbreviation>T</abbreviation>
+<sex value="f"/>
+<languages-used><language lang="deu"/></languages-used>
+<l1><language lang="deu"/></l1>
+<l2></l2>
+<ud-speaker-information></ud-speaker-information>
+<comment></comment>
+</speaker>
+<speaker id="SPK1">
+<abbreviation>S1</abbreviation>
+<sex value="m"/>
+<languages-used/>
+<l1><language lang="tur"/></l1>
+<l2><language lang="deu"/></l2>
+<ud-speaker-information></ud-speaker-information>
+<comment></comment>
+</speaker>
+</speakertable>
+</head>
+<basic-body>
+<common-timeline>
+<tli id="T0" time="0.0"/>
+<tli id="T1" time="1.5"/>
+<tli id="T2" time="3.25"/>
+<tli id="T3" time="4.0"/>
+<tli id="T4" time="6.5"/>
+</common-timeline>
+<tier id="TIE0" speaker="SPK0" category="v" type="t" display-name="T [v]">
+<event start="T0" end="T2">Guten Morgen.</event>
+<event start="T3" end="T4">Setzt euch (.) bitte!</event>
+</tier>
+<tier id="TIE1" speaker="SPK1" category="v" type="t" display-name="S1 [v]">
+<event start="T1" end="T3">Morgen &amp; so</event>
+</tier>
+<tier id="TIE2" speaker="SPK1" category="nv" type="d" display-name="S1 [nv]">
+<event start="T2" end="T4">nods</event>
+</tier>
+</basic-body>
+</basic-transcription>
+"""
+
+# new version of the transcript: speakers modified and added, a time point inserted and one re-timed, a tier removed
+# and one added in front of an existing tier, events removed, modified, and added
+new_transcript = transcript.replace(
+    '<sex value="m"/>', '<sex value="f"/>'
+).replace(
+    '</speakertable>', '<speaker id="SPK2">\n<abbreviation>S2</abbreviation>\n<sex value="m"/>\n<languages-used/>\n'
+                       '<l1/>\n<l2/>\n<ud-speaker-information></ud-speaker-information>\n<comment></comment>\n'
+                       '</speaker>\n</speakertable>'
+).replace(
+    '<tli id="T1" time="1.5"/>', '<tli id="T1" time="1.75"/>\n<tli id="T5" time="2.5"/>'
+).replace(
+    'Setzt euch (.) bitte!', 'Setzt euch bitte!'
+).replace(
+    '<event start="T0" end="T2">Guten Morgen.</event>',
+    '<event start="T0" end="T5">Guten</event>\n<event start="T5" end="T2">Morgen.</event>'
+).replace(
+    '<tier id="TIE1"', '<tier id="TIE9" speaker="SPK2" category="v" type="t" display-name="S2 [v]">\n'
+                       '<event start="T5" end="T3">Hallo?</event>\n</tier>\n<tier id="TIE1"'
+).replace(
+    '<tier id="TIE2" speaker="SPK1" category="nv" type="d" display-name="S1 [nv]">\n'
+    '<event start="T2" end="T4">nods</event>\n</tier>\n', ''
+)
+
+# broken version of the transcript, each change causes one issue
+broken_transcript = transcript.replace(
+    '<tli id="T4" time="6.5"/>', '<tli id="T4" time="6.5"/>\n<tli id="T2" time="7.0"/>\n<tli id="T5" time="abc"/>\n'
+                                 '<tli id="T6"/>'
+).replace(
+    '<event start="T1" end="T3">', '<event start="T3" end="T1">'
+).replace(
+    '<event start="T2" end="T4">nods', '<event start="T2" end="T8">nods'
+).replace(
+    'speaker="SPK1" category="nv"', 'speaker="SPK7" category="nv"'
+)
+
+
+class ExmaraldaTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        rval = os.path.join(self.tmp_dir, name)
+        with open(rval, 'w', encoding='UTF-8') as outstr:
+            outstr.write(content)
+        return rval
+
+    def load(self, name, content):
+        return exmaralda.ExmaraldaTranscript.load(self.write(name, content))
+
+    @staticmethod
+    def dump(cold_transcript):
+        return ''.join(rows for tid, rows in generalhelper.TSVDump.generate_tier_dumps(cold_transcript))
+
+    # validation
+
+    def test_validate_valid(self):
+        report = exmaralda.ExmaraldaTranscript.validate(self.write('lesson1.exb', transcript))
+        self.assertTrue(report.is_valid())
+        self.assertEqual(len(report), 0)
+
+    def test_validate_broken(self):
+        report = exmaralda.ExmaraldaTranscript.validate(self.write('broken.exb', broken_transcript))
+        self.assertFalse(report.is_valid())
+        self.assertEqual(sorted((issue.code, issue.element) for issue in report.get_errors()),
+                         [('dangling-time-id', 'TIE2'), ('duplicate-id', 'T2'), ('invalid-time', 'T5'),
+                          ('start-after-end', 'TIE1'), ('unknown-speaker', 'TIE2')])
+        self.assertEqual([(issue.code, issue.element) for issue in report.get_warnings()], [('missing-time', 'T6')])
+
+    def test_validate_malformed(self):
+        report = exmaralda.ExmaraldaTranscript.validate(self.write('malformed.exb', transcript[:900]))
+        self.assertEqual([issue.code for issue in report.issues], ['malformed-xml'])
+
+    def test_validate_unreadable(self):
+        # truncated and corrupt compressed files are reported rather than raised
+        content = gzip.compress(transcript.encode('UTF-8'))
+        for name, data in [('truncated.exb.gz', content[:200]), ('corrupt.exb.gz', content[:20] + b'x' * 200),
+                           ('truncated.exb.xz', lzma.compress(transcript.encode('UTF-8'))[:200]),
+                           ('corrupt.exb.xz', b'\xfd7zXZ\x00' + b'x' * 200)]:
+            in_file = os.path.join(self.tmp_dir, name)
+            with open(in_file, 'wb') as outstr:
+                outstr.write(data)
+            report = exmaralda.ExmaraldaTranscript.validate(in_file)
+            self.assertEqual([issue.code for issue in report.issues], ['unreadable-file'], name)
+            self.assertFalse(report.is_valid())
+
+    # diff
+
+    def test_diff_equal(self):
+        old = self.load('old.exb', transcript)
+        new = self.load('new.exb', transcript)
+        changes = old.diff(new)
+        self.assertTrue(changes.is_empty())
+        self.assertEqual(len(changes), 0)
+
+    def test_diff_apply(self):
+        old = self.load('old.exb', transcript)
+        new = self.load('new.exb', new_transcript)
+        changes = old.diff(new)
+        self.assertEqual(changes.tiers['order'], ['TIE0', 'TIE9', 'TIE1'])
+        self.assertEqual(changes.timeline['order'], ['0', '1', '5', '2', '3', '4'])
+
+        changes.apply(old)
+        self.assertEqual(self.dump(old), self.dump(new))
+        self.assertEqual(''.join(old.generate_xml()), ''.join(new.generate_xml()))
+        self.assertEqual(list(old.timeline.keys()), list(new.timeline.keys()))
+        self.assertTrue(old.diff(new).is_empty())
+
+    def test_diff_apply_reverse(self):
+        old = self.load('old.exb', transcript)
+        new = self.load('new.exb', new_transcript)
+        new.diff(old).apply(new)
+        self.assertEqual(''.join(new.generate_xml()), ''.join(old.generate_xml()))
+
+    def test_diff_append(self):
+        # appended tiers and time points do not need a new order
+        old = self.load('old.exb', transcript)
+        new = self.load('new.exb', transcript.replace(
+            '<tli id="T4" time="6.5"/>', '<tli id="T4" time="6.5"/>\n<tli id="T5" time="8.0"/>'
+        ).replace(
+            '</basic-body>', '<tier id="TIE3" speaker="SPK0" category="nv" type="d" display-name="T [nv]">\n'
+                             '<event start="T4" end="T5">leaves</event>\n</tier>\n</basic-body>'))
+        changes = old.diff(new)
+        self.assertIsNone(changes.tiers['order'])
+        self.assertIsNone(changes.timeline['order'])
+        changes.apply(old)
+        self.assertEqual(''.join(old.generate_xml()), ''.join(new.generate_xml()))
+
+    # database
+
+    @staticmethod
+    def select_rows(connection):
+        # contents of all tables by file without their keys
+        return {
+            'transcripts': connection.execute(
+                'SELECT file, project_name, transcription_name, transcription_convention, comment FROM transcripts '
+                'ORDER BY file').fetchall(),
+            'speakers': connection.execute(
+                'SELECT file, speaker_id, abbreviation, sex, l1, l2, languages_used FROM speakers '
+                'JOIN transcripts USING (transcript_id) ORDER BY file, speaker_id').fetchall(),
+            'tiers': connection.execute(
+                'SELECT file, tier_id, speaker_id, category, type, display_name FROM tiers '
+                'JOIN transcripts USING (transcript_id) LEFT JOIN speakers USING (speaker_key) '
+                'ORDER BY file, tier_id').fetchall(),
+            'timeline': connection.execute(
+                'SELECT file, time_id, time_stamp FROM timeline JOIN transcripts USING (transcript_id) '
+                'ORDER BY file, time_id').fetchall(),
+            'events': connection.execute(
+                'SELECT file, tier_id, start_id, end_id, start, end, content FROM events '
+                'JOIN transcripts USING (transcript_id) JOIN tiers USING (tier_key) '
+                'ORDER BY file, tier_id, start_id, end_id').fetchall()}
+
+    def test_apply_changes(self):
+        old = self.load('old.exb', transcript)
+        new = self.load('new.exb', new_transcript)
+
+        updated = sqlitedump.SQLiteDump.connect(':memory:')
+        sqlitedump.SQLiteDump.insert_transcript(updated, old, 'lesson1.exb')
+        sqlitedump.SQLiteDump.apply_changes(updated, 'lesson1.exb', old.diff(new))
+        inserted = sqlitedump.SQLiteDump.connect(':memory:')
+        sqlitedump.SQLiteDump.insert_transcript(inserted, new, 'lesson1.exb')
+
+        self.assertEqual(self.select_rows(updated), self.select_rows(inserted))
+        updated.close()
+        inserted.close()
+
+    def test_apply_changes_corpus(self):
+        # other transcripts of the corpus share the time and tier ids of the updated ones, but stay untouched
+        old = self.load('old.exb', transcript)
+        new = self.load('new.exb', new_transcript)
+        unanchored = self.load('unanchored.exb', transcript.replace(' time="1.5"', '').replace(' time="3.25"', ''))
+        interpolated = self.load('interpolated.exb', transcript.replace(' time="1.5"', '').replace(' time="3.25"', ''))
+        interpolated.normalise_timeline()
+
+        db_file = os.path.join(self.tmp_dir, 'corpus.sqlite')
+        updated = sqlitedump.SQLiteDump.connect(db_file)
+        for name, cold_transcript in [('lesson1.exb', old), ('lesson2.exb', old), ('lesson3.exb', unanchored),
+                                      ('lesson4.exb', new)]:
+            sqlitedump.SQLiteDump.insert_transcript(updated, cold_transcript, name)
+        sqlitedump.SQLiteDump.apply_changes(updated, 'lesson1.exb', old.diff(new))
+        changes = unanchored.diff(interpolated)
+        self.assertEqual(sorted(changes.timeline['modified'].keys()), ['1', '2'])
+        sqlitedump.SQLiteDump.apply_changes(updated, 'lesson3.exb', changes)
+        updated.close()
+
+        inserted = sqlitedump.SQLiteDump.connect(os.path.join(self.tmp_dir, 'inserted.sqlite'))
+        for name, cold_transcript in [('lesson1.exb', new), ('lesson2.exb', old), ('lesson3.exb', interpolated),
+                                      ('lesson4.exb', new)]:
+            sqlitedump.SQLiteDump.insert_transcript(inserted, cold_transcript, name)
+        updated = sqlitedump.SQLiteDump.connect(db_file)
+        self.assertEqual(self.select_rows(updated), self.select_rows(inserted))
+
+        # the rows of a transcript are found by index rather than by scanning the corpus
+        for statement in ['DELETE FROM events WHERE transcript_id = 1', 'DELETE FROM tiers WHERE transcript_id = 1',
+                          'UPDATE events SET start = 0 WHERE transcript_id = 1 AND start_id = 1',
+                          'UPDATE events SET end = 0 WHERE transcript_id = 1 AND end_id = 1']:
+            plan = ' '.join(row[-1] for row in updated.execute('EXPLAIN QUERY PLAN ' + statement))
+            self.assertNotIn('SCAN', plan, statement)
+        updated.close()
+        inserted.close()
+
+    def test_apply_changes_unknown(self):
+        connection = sqlitedump.SQLiteDump.connect(':memory:')
+        with self.assertRaises(ValueError):
+            sqlitedump.SQLiteDump.apply_changes(connection, 'lesson1.exb', exmaralda.ChangeSet())
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+__author__ = 'zweiss'
+
+import os
+import shutil
+import tempfile
+import unittest
+from exmaralda_converter import exmaralda
+from exmaralda_converter import overlap
+
+speaker = """<speaker id="{}">
+<abbreviation>{}</abbreviation>
+<sex value="f"/>
+<languages-used><language lang="deu"/></languages-used>
+<l1><language lang="deu"/></l1>
+<l2></l2>
+<ud-speaker-information></ud-speaker-information>
+<comment></comment>
+</speaker>
+"""
+
+
+def make_transcript(speakers, tiers):
+    """ Creates an exb file with time points at every full second from 0 to 9
+
+    :param speakers: id and abbreviation of each speaker
+    :type speakers: list of tuples
+    :param tiers: id, speaker id, category, and the start and end seconds of the events of each tier
+    :type tiers: list of tuples
+    :return: content of the exb file
+    :rtype: str
+    """
+
+    rval = ['<?xml version="1.0" encoding="UTF-8"?>\n<basic-transcription>\n<head>\n<meta-information>\n'
+            '<project-name>COLD</project-name>\n<transcription-name>overlaps</transcription-name>\n'
+            '<referenced-file url=""/>\n<ud-meta-information></ud-meta-information>\n<comment></comment>\n'
+            '<transcription-convention>cGAT</transcription-convention>\n</meta-information>\n<speakertable>\n']
+    rval.extend(speaker.format(sid, abbreviation) for sid, abbreviation in speakers)
+    rval.append('</speakertable>\n</head>\n<basic-body>\n<common-timeline>\n')
+    rval.extend('<tli id="T{}" time="{}"/>\n'.format(i, float(i)) for i in range(10))
+    rval.append('</common-timeline>\n')
+    for tid, sid, category, events in tiers:
+        rval.append('<tier id="{}" speaker="{}" category="{}" type="t" display-name="{}">\n'.format(
+            tid, sid, category, tid))
+        rval.extend('<event start="T{}" end="T{}">ja</event>\n'.format(start, end) for start, end in events)
+        rval.append('</tier>\n')
+    rval.append('</basic-body>\n</basic-transcription>\n')
+    return ''.join(rval)
+
+
+class OverlapTests(unittest.TestCase):
+
+    # the two students share their abbreviation
+    speakers = [('SPK0', 'T'), ('SPK1', 'S'), ('SPK2', 'S')]
+    # 0-2 T; 2-3 T, both S; 3-5 SPK1 on two tiers; 5-6 T and SPK2; 6-7 SPK2. Events touching at 3, 5, and 6 do not
+    # overlap, the non-verbal tier is not analysed by default.
+    tiers = [('TIE0', 'SPK0', 'v', [(0, 3), (5, 6)]),
+             ('TIE1', 'SPK1', 'v', [(2, 4)]),
+             ('TIE2', 'SPK1', 'v', [(3, 5)]),
+             ('TIE3', 'SPK2', 'v', [(2, 3), (5, 7)]),
+             ('TIE4', 'SPK0', 'nv', [(0, 9)])]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def load(self, speakers, tiers):
+        in_file = os.path.join(self.tmp_dir, 'overlaps.exb')
+        with open(in_file, 'w', encoding='UTF-8') as outstr:
+            outstr.write(make_transcript(speakers, tiers))
+        return exmaralda.ExmaraldaTranscript.load(in_file)
+
+    def test_from_transcript(self):
+        report = overlap.OverlapReport.from_transcript(self.load(OverlapTests.speakers, OverlapTests.tiers))
+        self.assertEqual(report.segments, [(2.0, 3.0, ('SPK0', 'SPK1', 'SPK2')), (5.0, 6.0, ('SPK0', 'SPK2'))])
+        self.assertEqual(len(report), 2)
+        self.assertEqual(report.get_overlap_time(), 2.0)
+        self.assertEqual(report.speaking, {'SPK0': 4.0, 'SPK1': 3.0, 'SPK2': 3.0})
+        self.assertEqual(report.overlapping, {'SPK0': 2.0, 'SPK1': 1.0, 'SPK2': 2.0})
+        self.assertEqual(report.labels, {'SPK0': 'T', 'SPK1': 'S', 'SPK2': 'S'})
+        self.assertEqual(report.get_segment_rows(), overlap.OverlapReport.segment_header +
+                         '2.0\t3.0\t1.0\tSPK0_SPK1_SPK2\n5.0\t6.0\t1.0\tSPK0_SPK2\n')
+        self.assertEqual(report.get_total_rows('f'), 'f\tSPK0\t4.0\t2.0\t0.5\nf\tSPK1\t3.0\t1.0\t0.333333\n'
+                                                     'f\tSPK2\t3.0\t2.0\t0.666667\n')
+
+    def test_partial_overlap(self):
+        tiers = [('TIE0', 'SPK0', 'v', [(0, 4)]), ('TIE1', 'SPK1', 'v', [(2, 6)])]
+        report = overlap.OverlapReport.from_transcript(self.load(OverlapTests.speakers[:2], tiers))
+        self.assertEqual(report.segments, [(2.0, 4.0, ('SPK0', 'SPK1'))])
+        self.assertEqual(report.speaking, {'SPK0': 4.0, 'SPK1': 4.0})
+        self.assertEqual(report.overlapping, {'SPK0': 2.0, 'SPK1': 2.0})
+
+    def test_touching_events(self):
+        tiers = [('TIE0', 'SPK0', 'v', [(0, 2), (4, 6)]), ('TIE1', 'SPK1', 'v', [(2, 4), (6, 8)])]
+        report = overlap.OverlapReport.from_transcript(self.load(OverlapTests.speakers[:2], tiers))
+        self.assertEqual(report.segments, [])
+        self.assertEqual(report.get_overlap_time(), 0.0)
+        self.assertEqual(report.speaking, {'SPK0': 4.0, 'SPK1': 4.0})
+        self.assertEqual(report.overlapping, {})
+
+    def test_tiers_of_one_speaker(self):
+        # the tiers of a speaker do not overlap with each other, even if they are all selected
+        report = overlap.OverlapReport.from_transcript(self.load(OverlapTests.speakers, OverlapTests.tiers),
+                                                       filters={'speakers': ['SPK0']})
+        self.assertEqual(report.segments, [])
+        self.assertEqual(report.speaking, {'SPK0': 9.0})
+        report = overlap.OverlapReport.from_transcript(self.load(OverlapTests.speakers, OverlapTests.tiers),
+                                                       filters={'tiers': ['TIE1', 'TIE2', 'TIE3']})
+        self.assertEqual(report.segments, [(2.0, 3.0, ('SPK1', 'SPK2'))])
+        self.assertEqual(report.speaking, {'SPK1': 3.0, 'SPK2': 3.0})
+
+    def test_continued_overlap(self):
+        # an overlap of the same speakers spanning several events is one segment
+        tiers = [('TIE0', 'SPK0', 'v', [(0, 3), (3, 6)]), ('TIE1', 'SPK1', 'v', [(1, 5)])]
+        report = overlap.OverlapReport.from_transcript(self.load(OverlapTests.speakers[:2], tiers))
+        self.assertEqual(report.segments, [(1.0, 5.0, ('SPK0', 'SPK1'))])
+
+    def test_aggregate(self):
+        report = overlap.OverlapReport.from_transcript(self.load(OverlapTests.speakers, OverlapTests.tiers))
+        # speakers are summed up by their abbreviation across transcripts, but not within a transcript
+        totals = overlap.OverlapReport.aggregate([report, report])
+        self.assertEqual(totals.speaking, {'T': 8.0, 'S': 12.0})
+        self.assertEqual(totals.overlapping, {'T': 4.0, 'S': 6.0})
+        self.assertEqual(len(totals), 4)
+        self.assertEqual(totals.get_overlap_time(), 4.0)
+        self.assertEqual(totals.segments, [])
+        self.assertEqual(overlap.OverlapReport.aggregate([totals]).speaking, totals.speaking)
+        self.assertEqual(totals.get_total_rows('ALL'), 'ALL\tS\t12.0\t6.0\t0.5\nALL\tT\t8.0\t4.0\t0.5\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
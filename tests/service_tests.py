@@ -0,0 +1,93 @@
+__author__ = 'zweiss'
+
+import io
+import json
+import threading
+import unittest
+from exmaralda_converter import generalhelper
+from exmaralda_converter import service
+from tests.exmaralda_tests import transcript
+
+
+class BrokenStream:
+    """ Text stream of a client that has disconnected """
+
+    def write(self, text):
+        raise BrokenPipeError(32, 'Broken pipe')
+
+    def flush(self):
+        pass
+
+
+class RecordingStream(io.StringIO):
+    """ Text stream counting the responses written to it """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.responses = 0
+
+    def write(self, text):
+        with self.lock:
+            self.responses += text.count('\n')
+            return super().write(text)
+
+
+class ServiceTests(unittest.TestCase):
+
+    @staticmethod
+    def get_requests(n):
+        return [json.dumps({'id': i, 'exb': transcript, 'format': 'tsv'}) + '\n' for i in range(n)]
+
+    @staticmethod
+    def read_responses(outstr):
+        return {response['id']: response for response in map(json.loads, outstr.getvalue().splitlines())}
+
+    def test_process_request(self):
+        response = json.loads(service.ConversionService.process_request(self.get_requests(1)[0]))
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['id'], 0)
+        self.assertTrue(response['result'].startswith(generalhelper.TSVDump.header))
+        for line in ['{"id": 1, "exb": "<basic-transcription>"}', '{"id": 2}', '[1, 2]', 'no json']:
+            response = json.loads(service.ConversionService.process_request(line))
+            self.assertFalse(response['ok'], line)
+            self.assertIn('type', response['error'])
+
+    def test_serve_stream(self):
+        with service.ConversionService(jobs=2) as conversion_service:
+            outstr = RecordingStream()
+            conversion_service.serve_stream(io.StringIO(''.join(self.get_requests(5)) + '\n'), outstr)
+        responses = self.read_responses(outstr)
+        self.assertEqual(sorted(responses.keys()), list(range(5)))
+        self.assertTrue(all(response['ok'] for response in responses.values()))
+
+    def test_disconnected_client(self):
+        # the responses of a client that has gone away are dropped, other clients are still answered
+        with service.ConversionService(jobs=2) as conversion_service:
+            conversion_service.serve_stream(io.StringIO(''.join(self.get_requests(8))), BrokenStream())
+            outstr = RecordingStream()
+            thread = threading.Thread(target=conversion_service.serve_stream,
+                                      args=(io.StringIO(''.join(self.get_requests(3))), outstr))
+            thread.start()
+            thread.join(30)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(sorted(self.read_responses(outstr).keys()), [0, 1, 2])
+
+    def test_max_pending(self):
+        outstr = RecordingStream()
+        in_flight = []
+
+        def generate_requests():
+            for line in self.get_requests(12):
+                in_flight.append(len(in_flight) - outstr.responses)
+                yield line
+
+        with service.ConversionService(jobs=2, max_pending=3) as conversion_service:
+            conversion_service.serve_stream(generate_requests(), outstr)
+        self.assertEqual(outstr.responses, 12)
+        # requests read before the next one is read, minus the responses written by then
+        self.assertLessEqual(max(in_flight), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()